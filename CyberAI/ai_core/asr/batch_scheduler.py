@@ -0,0 +1,184 @@
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from utils.metrics import metrics
+
+
+class ASRBatchScheduler:
+    """
+    ASR 微批调度器
+
+    将并发到达的识别请求在 max_wait_ms 时间窗口内（或凑满 max_batch_size 条）
+    合并为一次批量 generate 调用，再把每条结果回填到各自调用方的 Future。
+    被调度的 ASR 对象需提供 batch_to_text(inputs) 方法（如 FunASRWrapper）。
+    """
+
+    def __init__(self, asr, config=None):
+        config = config or {}
+        self.asr = asr
+        self.max_batch_size = int(config.get("max_batch_size", 8))
+        self.max_wait_ms = float(config.get("max_wait_ms", 10))
+
+        self._queue = queue.Queue()
+        # 检查 _running 与入队在同一把锁内完成，close 之后不会再有请求排在关闭信号之后
+        self._submit_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._reset_stats()
+
+        self._running = True
+        self._worker = threading.Thread(target=self._run, name="asr-batch-scheduler", daemon=True)
+        self._worker.start()
+        metrics.track_queue("asr_batch", self.queue_depth)
+
+    def _reset_stats(self):
+        self._started_at = time.perf_counter()
+        self._requests = 0
+        self._batches = 0
+        self._errors = 0
+        self._max_batch_seen = 0
+        self._wait_ms_total = 0.0
+        self._latency_ms_total = 0.0
+        self._latency_ms_max = 0.0
+        self._inference_ms_total = 0.0
+
+    def submit(self, audio_input) -> Future:
+        """提交一个识别请求（文件路径或 PCM 数组），返回 concurrent.futures.Future"""
+        future = Future()
+        with self._submit_lock:
+            if not self._running:
+                raise RuntimeError("ASR 调度器已关闭")
+            # 记下调用方的追踪，排队与批量推理的耗时记入该追踪
+            self._queue.put((audio_input, future, time.perf_counter(), metrics.current_trace()))
+        return future
+
+    def transcribe(self, audio_input, timeout=None):
+        """阻塞等待识别结果"""
+        return self.submit(audio_input).result(timeout=timeout)
+
+    async def transcribe_async(self, audio_input):
+        """在 asyncio 中等待识别结果"""
+        return await asyncio.wrap_future(self.submit(audio_input))
+
+    def queue_depth(self):
+        """当前排队等待的请求数"""
+        return self._queue.qsize()
+
+    def _collect_batch(self):
+        """阻塞取第一条请求，然后在等待窗口内继续凑批"""
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = [item]
+        deadline = time.perf_counter() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                # 关闭信号放回队列，当前批次处理完后退出
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            if batch is None:
+                break
+            try:
+                self._process_batch(batch)
+            except Exception as e:
+                # 调度线程不能因单个批次退出，否则排队中与之后提交的请求都会一直挂起
+                print(f"ASR 批次处理异常: {e}")
+                for _, future, _, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process_batch(self, batch):
+        # 调用方已取消（如用户打断）的请求不再推理；其余标记为运行中，之后不能再被取消
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+
+        inputs = [audio_input for audio_input, _, _, _ in batch]
+        started = time.perf_counter()
+        try:
+            results = list(self.asr.batch_to_text(inputs))
+            if len(results) != len(batch):
+                raise RuntimeError(f"批量识别返回 {len(results)} 条结果，与输入的 {len(batch)} 条不一致")
+            error = None
+        except Exception as e:
+            print(f"ASR 批量识别失败: {e}")
+            results, error = None, e
+        finished = time.perf_counter()
+
+        for index, (_, future, _, _) in enumerate(batch):
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[index])
+
+        with self._stats_lock:
+            self._batches += 1
+            self._requests += len(batch)
+            self._errors += len(batch) if error is not None else 0
+            self._max_batch_seen = max(self._max_batch_seen, len(batch))
+            self._inference_ms_total += (finished - started) * 1000
+            for _, _, submitted, _ in batch:
+                latency_ms = (finished - submitted) * 1000
+                self._wait_ms_total += (started - submitted) * 1000
+                self._latency_ms_total += latency_ms
+                self._latency_ms_max = max(self._latency_ms_max, latency_ms)
+
+        for _, _, submitted, trace in batch:
+            metrics.observe("asr.queue_wait", started - submitted)
+            if trace is not None:
+                trace.add_span("asr.queue_wait", submitted, started)
+                trace.add_span("asr.batch", started, finished, "ok" if error is None else "error",
+                               {'batch_size': len(batch)})
+
+    def get_stats(self, reset=False):
+        """
+        获取吞吐与延迟统计
+
+        返回值:
+            dict: 请求数、批次数、平均批大小、吞吐（请求/秒）、平均排队等待、平均/最大端到端延迟等
+        """
+        with self._stats_lock:
+            elapsed = time.perf_counter() - self._started_at
+            requests = self._requests
+            stats = {
+                'requests': requests,
+                'batches': self._batches,
+                'errors': self._errors,
+                'avg_batch_size': requests / self._batches if self._batches else 0.0,
+                'max_batch_size_seen': self._max_batch_seen,
+                'throughput_rps': requests / elapsed if elapsed > 0 else 0.0,
+                'avg_queue_wait_ms': self._wait_ms_total / requests if requests else 0.0,
+                'avg_latency_ms': self._latency_ms_total / requests if requests else 0.0,
+                'max_latency_ms': self._latency_ms_max,
+                'avg_batch_inference_ms': self._inference_ms_total / self._batches if self._batches else 0.0,
+                'queue_depth': self._queue.qsize(),
+            }
+            if reset:
+                self._reset_stats()
+        return stats
+
+    def close(self, wait=True):
+        """停止调度线程，已排队的请求会先处理完"""
+        with self._submit_lock:
+            if not self._running:
+                return
+            self._running = False
+            self._queue.put(None)
+        metrics.untrack_queue("asr_batch")
+        if wait:
+            self._worker.join()
@@ -0,0 +1,151 @@
+"""
+比较 torch 与 onnx 两种 ASR 后端的准确率与实时率（RTF）
+
+清单文件每行一条: <wav 路径>\t<参考文本>；参考文本可省略，省略时以 torch 后端的输出作为参考，
+此时 CER 反映的是两种后端结果的差异。
+
+命令行（在 ai_core 目录下执行）:
+    python -m asr.compare_backends <清单文件> [--backends torch onnx] [--no-quantize] [--json 输出文件]
+"""
+
+import json
+import re
+import time
+import wave
+
+import yaml
+
+from asr.funasr.funasr_wrapper import FunASRWrapper
+from utils.util import Util
+
+# 计算 CER 前去掉的标点与空白
+_IGNORED_CHARS = re.compile(r"[\s\.,!?;:'\"、，。！？；：“”‘’（）()\[\]《》<>\-]")
+
+
+def normalize_text(text):
+    return _IGNORED_CHARS.sub("", text).lower()
+
+
+def edit_distance(reference, hypothesis):
+    """字符级编辑距离（Levenshtein）"""
+    previous = list(range(len(hypothesis) + 1))
+    for i, ref_char in enumerate(reference, 1):
+        current = [i] + [0] * len(hypothesis)
+        for j, hyp_char in enumerate(hypothesis, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1,
+                             previous[j - 1] + (ref_char != hyp_char))
+        previous = current
+    return previous[-1]
+
+
+def character_error_rate(references, hypotheses):
+    """语料级 CER：编辑距离之和 / 参考字符数之和（去掉标点与空白后）"""
+    errors = 0
+    total = 0
+    for reference, hypothesis in zip(references, hypotheses):
+        reference, hypothesis = normalize_text(reference), normalize_text(hypothesis)
+        errors += edit_distance(reference, hypothesis)
+        total += len(reference)
+    return errors / total if total else 0.0
+
+
+def load_manifest(manifest_path):
+    """读取清单，返回 [(wav 路径, 参考文本或 None), ...]"""
+    items = []
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                continue
+            path, _, reference = line.partition("\t")
+            items.append((path, reference or None))
+    return items
+
+
+def wav_duration(path):
+    with wave.open(path, "rb") as wav_file:
+        return wav_file.getnframes() / wav_file.getframerate()
+
+
+def run_backend(asr_config, backend, paths):
+    """用指定后端逐条识别，返回 (识别结果列表, 统计字典)"""
+    started = time.perf_counter()
+    asr = FunASRWrapper(dict(asr_config, backend=backend))
+    load_seconds = time.perf_counter() - started
+    # 预热一次，不计入 RTF
+    asr.audio_file_to_text(paths[0])
+
+    texts = []
+    infer_seconds = 0.0
+    for path in paths:
+        started = time.perf_counter()
+        texts.append(asr.audio_file_to_text(path))
+        infer_seconds += time.perf_counter() - started
+    return texts, {'load_seconds': load_seconds, 'infer_seconds': infer_seconds}
+
+
+def compare_backends(manifest_path, asr_config, backends=("torch", "onnx")):
+    """
+    返回值:
+        {后端: {cer, rtf, infer_seconds, load_seconds, audio_seconds}, ...}，以及逐条结果 details
+    """
+    items = load_manifest(manifest_path)
+    if not items:
+        raise ValueError(f"清单为空: {manifest_path}")
+    paths = [path for path, _ in items]
+    audio_seconds = sum(wav_duration(path) for path in paths)
+
+    outputs = {}
+    report = {}
+    for backend in backends:
+        texts, stats = run_backend(asr_config, backend, paths)
+        outputs[backend] = texts
+        stats['audio_seconds'] = audio_seconds
+        stats['rtf'] = stats['infer_seconds'] / audio_seconds if audio_seconds else 0.0
+        report[backend] = stats
+
+    # 缺少参考文本的条目以第一个后端的输出作为参考
+    references = [reference if reference is not None else outputs[backends[0]][index]
+                  for index, (_, reference) in enumerate(items)]
+    for backend in backends:
+        report[backend]['cer'] = character_error_rate(references, outputs[backend])
+
+    report['details'] = [
+        dict({'path': path, 'reference': references[index]},
+             **{backend: outputs[backend][index] for backend in backends})
+        for index, path in enumerate(paths)
+    ]
+    return report
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='比较 ASR 后端的准确率与实时率')
+    parser.add_argument('manifest', type=str, help='清单文件，每行 <wav 路径>\\t<参考文本>')
+    parser.add_argument('--config_path', type=str, default=Util.get_config_file_path(), help='配置文件路径')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'onnx'], help='参与比较的后端 (默认: torch onnx)')
+    parser.add_argument('--no-quantize', action='store_true', help='onnx 后端使用 fp32 模型')
+    parser.add_argument('--json', type=str, default=None, help='把完整结果写入 JSON 文件')
+
+    args = parser.parse_args()
+    with open(args.config_path, "r", encoding="utf-8") as file:
+        asr_config = yaml.safe_load(file).get("ASR").get("FunASR")
+    if args.no_quantize:
+        asr_config["onnx"] = dict(asr_config.get("onnx") or {}, quantize=False)
+
+    result = compare_backends(args.manifest, asr_config, tuple(args.backends))
+    audio_seconds = result[args.backends[0]]['audio_seconds']
+    print(f"共 {len(result['details'])} 条，音频 {audio_seconds:.1f}s")
+    for backend in args.backends:
+        stats = result[backend]
+        print(f"{backend:>6}: CER {stats['cer'] * 100:.2f}%  RTF {stats['rtf']:.4f}  "
+              f"推理 {stats['infer_seconds']:.2f}s  加载 {stats['load_seconds']:.2f}s")
+    if len(args.backends) > 1:
+        base, other = result[args.backends[0]], result[args.backends[1]]
+        if other['rtf']:
+            print(f"{args.backends[1]} 相对 {args.backends[0]} 加速 {base['rtf'] / other['rtf']:.2f}x，"
+                  f"CER 变化 {(other['cer'] - base['cer']) * 100:+.2f} 个百分点")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
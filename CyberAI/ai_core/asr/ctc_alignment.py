@@ -0,0 +1,111 @@
+import unicodedata
+
+import numpy as np
+import torch
+
+
+def reduce_ctc_logits(logits, top_k=3):
+    """
+    在前向钩子中就地归约 CTC 输出，不复制整个 (B, T, V) 张量
+
+    只保留每帧 top-k 的 token id 与对数概率（log-softmax 通过 logsumexp 归一化得到），
+    第 0 列即 argmax。返回 CPU 上的 numpy 数组：ids 为 (B, T, k) int32，logprobs 为 (B, T, k) float32。
+    """
+    with torch.no_grad():
+        top_logits, top_ids = logits.topk(top_k, dim=-1)
+        normalizer = torch.logsumexp(logits.float(), dim=-1, keepdim=True)
+        top_logprobs = top_logits.float() - normalizer
+    return top_ids.to(torch.int32).cpu().numpy(), top_logprobs.cpu().numpy()
+
+
+def _is_cjk(char):
+    name = unicodedata.name(char, "")
+    return any(script in name for script in ("CJK", "HIRAGANA", "KATAKANA", "HANGUL"))
+
+
+class CTCAligner:
+    """
+    由归约后的 CTC 输出计算 token / 词级别的时间戳与置信度（全部向量化）
+
+    pieces 为词表中每个 id 对应的 SentencePiece 片段；以 "▁" 开头的片段开始一个新词，
+    中日韩文字每个字单独成词；<|...|> 形式的特殊标记与纯标点不计入词。
+    frame_ms 为编码器每帧时长，prefix_frames 为编码器输出前部不对应音频的帧数。
+    """
+
+    def __init__(self, pieces, blank_id=0, frame_ms=60, prefix_frames=0):
+        self.blank_id = blank_id
+        self.frame_ms = frame_ms
+        self.prefix_frames = prefix_frames
+        self.pieces = [piece.replace("▁", " ") for piece in pieces]
+        self._word_start = np.array([piece.startswith("▁") for piece in pieces], dtype=bool)
+        self._cjk = np.array([bool(piece.strip("▁")) and all(_is_cjk(c) for c in piece.strip("▁"))
+                              for piece in pieces], dtype=bool)
+        self._skip = np.array([
+            (piece.startswith("<|") and piece.endswith("|>"))
+            or not piece.strip("▁")
+            or all(unicodedata.category(c).startswith("P") for c in piece.strip("▁"))
+            for piece in pieces
+        ], dtype=bool)
+
+    def tokens(self, ids, logprobs):
+        """
+        CTC 贪心解码：合并连续重复并去掉空白
+
+        参数:
+            ids/logprobs: 单条音频的 (T, k) 数组（reduce_ctc_logits 的结果取一行）
+        返回值:
+            dict：token_ids、start_frame、end_frame（不含）、logprob（token 各帧 top-1 对数概率的均值）
+        """
+        best = ids[:, 0]
+        best_logprob = logprobs[:, 0]
+        if len(best) == 0:
+            empty = np.zeros(0, dtype=np.int64)
+            return {'token_ids': empty, 'start_frame': empty, 'end_frame': empty,
+                    'logprob': np.zeros(0, dtype=np.float32)}
+        run_starts = np.flatnonzero(np.r_[True, best[1:] != best[:-1]])
+        run_ends = np.r_[run_starts[1:], len(best)]
+        run_ids = best[run_starts]
+        run_logprob = np.add.reduceat(best_logprob, run_starts) / (run_ends - run_starts)
+        keep = run_ids != self.blank_id
+        return {
+            'token_ids': run_ids[keep],
+            'start_frame': run_starts[keep],
+            'end_frame': run_ends[keep],
+            'logprob': run_logprob[keep],
+        }
+
+    def words(self, ids, logprobs):
+        """
+        词级别结果
+
+        返回值:
+            [{'word', 'start_ms', 'end_ms', 'confidence'}, ...]，confidence 为词内各 token 概率的几何平均
+        """
+        tokens = self.tokens(ids, logprobs)
+        keep = ~self._skip[tokens['token_ids']]
+        token_ids = tokens['token_ids'][keep]
+        if len(token_ids) == 0:
+            return []
+        start_frame = tokens['start_frame'][keep]
+        end_frame = tokens['end_frame'][keep]
+        logprob = tokens['logprob'][keep]
+
+        cjk = self._cjk[token_ids]
+        new_word = self._word_start[token_ids] | cjk | np.r_[True, cjk[:-1]]
+        new_word[0] = True
+        word_starts = np.flatnonzero(new_word)
+        word_ends = np.r_[word_starts[1:], len(token_ids)]
+        word_logprob = np.add.reduceat(logprob, word_starts) / (word_ends - word_starts)
+        start_ms = (start_frame[word_starts] - self.prefix_frames).clip(min=0) * self.frame_ms
+        end_ms = (end_frame[word_ends - 1] - self.prefix_frames).clip(min=0) * self.frame_ms
+        confidence = np.exp(word_logprob)
+
+        words = []
+        for i, (begin, end) in enumerate(zip(word_starts, word_ends)):
+            words.append({
+                'word': "".join(self.pieces[t] for t in token_ids[begin:end]).strip(),
+                'start_ms': int(start_ms[i]),
+                'end_ms': int(end_ms[i]),
+                'confidence': float(confidence[i]),
+            })
+        return words
@@ -0,0 +1,127 @@
+"""
+评估识别前静音裁剪（audio_format/silence_gate.py）对实时率（RTF）与准确率（CER）的影响
+
+同一批音频分别以原始 PCM 与裁剪后的 PCM 识别，RTF 均按原音频时长计算（裁剪耗时计入裁剪一方）。
+清单格式同 compare_backends.py：每行 <音频路径>\t<参考文本>；参考文本可省略，省略时以未裁剪的识别结果作为参考，
+此时 CER 反映的是裁剪带来的差异。--pad-ms 在每条音频前后各补一段低电平噪声，模拟录音首尾的长静音。
+
+命令行（在 ai_core 目录下执行）:
+    python -m asr.eval_silence_gate <清单文件> [--pad-ms 2000] [--keep-silence-ms 200] [--hangover-ms 300]
+                                    [--level-dbfs -45] [--json 输出文件]
+"""
+
+import json
+import time
+
+import numpy as np
+import yaml
+
+from asr.compare_backends import character_error_rate, load_manifest
+from asr.funasr.funasr_wrapper import FunASRWrapper
+from audio_format.opus import Opus_Encoder
+from audio_format.silence_gate import SilenceGate
+from utils.util import Util
+
+
+def pad_with_noise(pcm, pad_ms, level_dbfs=-60, sample_rate=16000, seed=0):
+    """前后各补 pad_ms 毫秒的白噪声（level_dbfs 电平）"""
+    if pad_ms <= 0:
+        return pcm
+    rng = np.random.default_rng(seed)
+    samples = sample_rate * pad_ms // 1000
+    noise = rng.standard_normal((2, samples)) * 32768 * 10 ** (level_dbfs / 20)
+    noise = np.clip(noise, -32768, 32767).astype(np.int16)
+    return np.concatenate([noise[0], np.asarray(pcm, dtype=np.int16), noise[1]])
+
+
+def evaluate(asr, items, gate, pad_ms=0, sample_rate=16000):
+    """
+    参数:
+        asr: 提供 pcm_to_text(pcm) 的识别对象，自身不应再做静音裁剪
+        items: [(音频路径, 参考文本或 None), ...]
+    返回值:
+        {'baseline': {...}, 'gated': {...}, 'details': [...]}，前两项各含 cer、rtf、infer_seconds，
+        gated 另含 gate_seconds 与 kept_ratio（保留的音频占比）
+    """
+    opus = Opus_Encoder()
+    pcms = [pad_with_noise(opus.load_pcm(path), pad_ms, sample_rate=sample_rate, seed=index)
+            for index, (path, _) in enumerate(items)]
+    audio_seconds = sum(len(pcm) for pcm in pcms) / sample_rate
+    # 预热一次，不计入 RTF
+    asr.pcm_to_text(pcms[0])
+
+    baseline, gated = [], []
+    baseline_seconds = gate_seconds = gated_seconds = 0.0
+    kept = 0
+    for pcm in pcms:
+        started = time.perf_counter()
+        baseline.append(asr.pcm_to_text(pcm))
+        baseline_seconds += time.perf_counter() - started
+
+        started = time.perf_counter()
+        result = gate.trim(pcm)
+        gate_seconds += time.perf_counter() - started
+        kept += len(result.pcm)
+        started = time.perf_counter()
+        gated.append(asr.pcm_to_text(result.pcm) if len(result.pcm) else "")
+        gated_seconds += time.perf_counter() - started
+
+    references = [reference if reference is not None else baseline[index]
+                  for index, (_, reference) in enumerate(items)]
+    return {
+        'audio_seconds': audio_seconds,
+        'baseline': {
+            'cer': character_error_rate(references, baseline),
+            'rtf': baseline_seconds / audio_seconds,
+            'infer_seconds': baseline_seconds,
+        },
+        'gated': {
+            'cer': character_error_rate(references, gated),
+            'rtf': (gate_seconds + gated_seconds) / audio_seconds,
+            'infer_seconds': gated_seconds,
+            'gate_seconds': gate_seconds,
+            'kept_ratio': kept / sum(len(pcm) for pcm in pcms),
+        },
+        'details': [
+            {'path': path, 'reference': references[index], 'baseline': baseline[index], 'gated': gated[index]}
+            for index, (path, _) in enumerate(items)
+        ],
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='评估识别前静音裁剪对 RTF 与 CER 的影响')
+    parser.add_argument('manifest', type=str, help='清单文件，每行 <音频路径>\\t<参考文本>')
+    parser.add_argument('--config_path', type=str, default=Util.get_config_file_path(), help='配置文件路径')
+    parser.add_argument('--pad-ms', type=int, default=0, help='每条音频前后补的噪声时长（毫秒）')
+    parser.add_argument('--level-dbfs', type=float, default=None, help='语音能量门限（默认使用配置）')
+    parser.add_argument('--hangover-ms', type=int, default=None, help='语音段之后保留的时长（默认使用配置）')
+    parser.add_argument('--keep-silence-ms', type=int, default=None, help='静音段压缩后的时长，0 为全部去掉（默认使用配置）')
+    parser.add_argument('--json', type=str, default=None, help='把完整结果写入 JSON 文件')
+
+    args = parser.parse_args()
+    with open(args.config_path, "r", encoding="utf-8") as file:
+        asr_config = yaml.safe_load(file).get("ASR").get("FunASR")
+    gate_config = dict(asr_config.get("silence_gate") or {})
+    for key in ("level_dbfs", "hangover_ms", "keep_silence_ms"):
+        if getattr(args, key) is not None:
+            gate_config[key] = getattr(args, key)
+
+    # 识别对象本身不裁剪，裁剪由本脚本完成，两组结果才可比
+    asr = FunASRWrapper(dict(asr_config, silence_gate=None))
+
+    items = load_manifest(args.manifest)
+    if not items:
+        raise SystemExit(f"清单为空: {args.manifest}")
+    result = evaluate(asr, items, SilenceGate(gate_config), args.pad_ms)
+    baseline, gated = result['baseline'], result['gated']
+    print(f"共 {len(items)} 条，音频 {result['audio_seconds']:.1f}s，裁剪后保留 {gated['kept_ratio']:.1%}")
+    print(f"  不裁剪: CER {baseline['cer'] * 100:.2f}%  RTF {baseline['rtf']:.4f}")
+    print(f"    裁剪: CER {gated['cer'] * 100:.2f}%  RTF {gated['rtf']:.4f}（其中裁剪 {gated['gate_seconds'] * 1000:.1f}ms）")
+    if gated['rtf']:
+        print(f"加速 {baseline['rtf'] / gated['rtf']:.2f}x，CER 变化 {(gated['cer'] - baseline['cer']) * 100:+.2f} 个百分点")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
@@ -1,9 +1,20 @@
 import os
+import threading
+import time
 from funasr import AutoModel  # 现在能正确导入真正的funasr库
 from funasr.utils.postprocess_utils import rich_transcription_postprocess 
-import torch
+import numpy as np
 
+try:
+    from funasr_onnx import SenseVoiceSmall  # 可选依赖：ONNX Runtime 推理后端
+except ImportError:
+    SenseVoiceSmall = None
+
+from asr.ctc_alignment import CTCAligner, reduce_ctc_logits
+from asr.long_audio import LongAudioTranscriber
 from audio_format.opus import Opus_Encoder
+from audio_format.silence_gate import SilenceGate
+from utils.metrics import metrics
 
 class FunASRWrapper:  # 建议也修改类名
     def __init__(self,config):
@@ -11,21 +22,84 @@ class FunASRWrapper:  # 建议也修改类名
         self.current_dir = os.path.dirname(os.path.abspath(__file__))
         self.model_dir = os.path.join(self.current_dir, "model")
         
-        self.model = AutoModel(
-            model=self.model_dir,
-            vad_kwargs={"max_single_segment_duration": 30000},
-            # device = "cuda:0" if torch.cuda.is_available() else "cpu",
-            disable_update=True,
-            hub="hf",
-        )
-        self.raw_outputs = {}
+        # 推理后端：torch（默认）或 onnx（onnxruntime，可选 int8 量化）
+        self.backend = config.get("backend", "torch")
+        self.onnx_config = config.get("onnx") or {}
+        self.model = None
+        self.onnx_model = None
+        if self.backend == "onnx":
+            self.onnx_model = self._load_onnx_model()
+        elif self.backend == "torch":
+            self.model = AutoModel(
+                model=self.model_dir,
+                vad_kwargs={"max_single_segment_duration": 30000},
+                device=config.get("device", "cpu"),
+                disable_update=True,
+                hub="hf",
+            )
+        else:
+            raise ValueError(f"不支持的 ASR 后端: {self.backend}")
         self.hooks = []
+        # CTC 对齐：在前向钩子中把 CTC 输出归约为 top-k，结果按线程保存
+        self.ctc_top_k = int(config.get("ctc_top_k", 3))
+        self._ctc_local = threading.local()
+        self._aligner = None
+        if config.get("ctc_alignment", False) and self.model is not None:
+            self._register_hook()
+
+        # 长音频模式：流式 VAD 模型在首次使用时加载
+        self.vad_model_name = config.get("vad_model", "fsmn-vad")
+        self.max_segment_ms = int(config.get("max_segment_ms", 30000))
+        self.long_audio_config = config.get("long_audio") or {}
+        self._vad_model = None
+        self._vad_lock = threading.Lock()
+
+        # 静音裁剪：识别前去掉或压缩静音段，词级时间戳换算回原音频
+        gate_config = config.get("silence_gate") or {}
+        self.silence_gate = SilenceGate(gate_config) if gate_config.get("enabled", False) else None
+
+    def _onnx_model_path(self, quantize):
+        return os.path.join(self.model_dir, "model_quant.onnx" if quantize else "model.onnx")
+
+    def export_onnx(self, quantize=True):
+        """
+        将本地模型导出为 ONNX，产物保存在模型目录中（model.onnx，量化时另有 model_quant.onnx），
+        已导出过则直接返回，只在第一次使用时付出导出开销
+        """
+        path = self._onnx_model_path(quantize)
+        if not os.path.exists(path):
+            print(f"正在导出 ONNX 模型: {path}")
+            model = AutoModel(model=self.model_dir, disable_update=True, hub="hf")
+            model.export(type="onnx", quantize=quantize, output_dir=self.model_dir)
+        return path
+
+    def _load_onnx_model(self):
+        if SenseVoiceSmall is None:
+            raise ImportError("未安装 funasr_onnx / onnxruntime，无法使用 onnx 后端")
+        quantize = self.onnx_config.get("quantize", True)
+        self.export_onnx(quantize)
+        return SenseVoiceSmall(
+            self.model_dir,
+            batch_size=int(self.onnx_config.get("batch_size", 8)),
+            quantize=quantize,
+            intra_op_num_threads=int(self.onnx_config.get("intra_op_num_threads", 4)),
+        )
 
     def _register_hook(self):
+        """
+        注册 CTC 输出层的前向钩子（重复调用无副作用）
+
+        钩子内直接归约为每帧 top-k 的 id 与对数概率，不复制完整的 logits 张量；
+        结果保存在调用线程自己的槽位中，多线程并发识别互不干扰。
+        """
+        if self.model is None:
+            raise RuntimeError("CTC 输出钩子仅支持 torch 后端")
+        if self.hooks:
+            return
         output_layer = self.model.model.ctc.ctc_lo
 
         def hook_function(module, input, output):
-            self.raw_outputs["ctc_logits"] = output.clone()
+            self._ctc_local.reduced = reduce_ctc_logits(output, self.ctc_top_k)
 
         hook = output_layer.register_forward_hook(hook_function)
         self.hooks.append(hook)
@@ -34,35 +108,235 @@ class FunASRWrapper:  # 建议也修改类名
         for hook in self.hooks:
             hook.remove()
         self.hooks.clear()
-        self.raw_outputs.clear()
+        self._ctc_local = threading.local()
+
+    def last_ctc_output(self):
+        """
+        当前线程最近一次识别的归约 CTC 输出
+
+        返回值:
+            (ids, logprobs)，形状均为 (batch, 帧数, top_k)，第 0 列为 argmax；未注册钩子时为 None
+        """
+        return getattr(self._ctc_local, "reduced", None)
+
+    def _vocab_pieces(self, tokenizer):
+        sp = getattr(tokenizer, "sp", None)
+        if sp is None and hasattr(tokenizer, "_build_sentence_piece_processor"):
+            tokenizer._build_sentence_piece_processor()
+            sp = tokenizer.sp
+        if sp is not None:
+            return [sp.IdToPiece(i) for i in range(sp.GetPieceSize())]
+        return [tokenizer.decode([i]) for i in range(tokenizer.get_vocab_size())]
+
+    def _get_aligner(self):
+        if self._aligner is None:
+            frontend = self.model.kwargs.get("frontend")
+            # 编码器每帧 = fbank 帧移 × 低帧率拼接步长（SenseVoice 为 10ms × 6）
+            frame_ms = getattr(frontend, "frame_shift", 10) * getattr(frontend, "lfr_n", 6)
+            self._aligner = CTCAligner(
+                self._vocab_pieces(self.model.kwargs.get("tokenizer")),
+                blank_id=getattr(self.model.model, "blank_id", 0),
+                frame_ms=frame_ms,
+                # SenseVoice 在编码器输入前拼接了语种、情感、事件、ITN 四个查询帧
+                prefix_frames=4,
+            )
+        return self._aligner
+
+    def _to_text_with_words(self, audio_input):
+        self._register_hook()
+        audio_input, timestamps = self._gate(audio_input)
+        if timestamps is not None and not timestamps.kept_samples:
+            return {'text': "", 'words': [], 'confidence': 0.0}
+        self._ctc_local.reduced = None
+        text = self._generate(audio_input, audio_seconds=self._original_seconds(timestamps))[0]
+        ids, logprobs = self._ctc_local.reduced
+        words = self._get_aligner().words(ids[0], logprobs[0])
+        if timestamps is not None:
+            words = timestamps.remap(words)
+        confidence = float(np.exp(np.mean(np.log([w['confidence'] for w in words])))) if words else 0.0
+        return {'text': text, 'words': words, 'confidence': confidence}
+
+    def audio_file_to_text_with_words(self, audio_file_path):
+        """
+        识别音频文件，同时返回词级时间戳与置信度
+
+        返回值:
+            {'text', 'words': [{'word', 'start_ms', 'end_ms', 'confidence'}, ...], 'confidence'}；
+            words 来自 CTC 解码结果，未经过 ITN 与标点后处理；开启静音裁剪时时间戳已换算回原音频
+        """
+        return self._to_text_with_words(audio_file_path)
+
+    def pcm_to_text_with_words(self, pcm: np.ndarray):
+        """识别内存中的 PCM，同时返回词级时间戳与置信度（格式同 audio_file_to_text_with_words）"""
+        return self._to_text_with_words(pcm)
+
+    @staticmethod
+    def _audio_seconds(audio_input):
+        """内存中 PCM 的时长（秒）；文件路径不读取，返回 None"""
+        inputs = audio_input if isinstance(audio_input, list) else [audio_input]
+        if not all(isinstance(item, np.ndarray) for item in inputs):
+            return None
+        return sum(len(item) for item in inputs) / 16000
+
+    @staticmethod
+    def _original_seconds(timestamps):
+        """裁剪前的音频时长，RTF 按原音频计算；未裁剪时返回 None（由输入计算）"""
+        return timestamps.original_samples / timestamps.sample_rate if timestamps is not None else None
 
+    def _gate(self, audio_input):
+        """
+        开启静音裁剪时把输入（文件路径或 PCM）裁剪为只含语音的 PCM
+
+        返回值:
+            (模型输入, TimestampMap 或 None)；未开启时原样返回输入
+        """
+        if self.silence_gate is None:
+            return self._to_model_input(audio_input), None
+        pcm = Opus_Encoder().load_pcm(audio_input) if isinstance(audio_input, str) else audio_input
+        with metrics.span("asr.silence_gate", len(pcm) / 16000):
+            result = self.silence_gate.trim(pcm)
+        return self._to_model_input(result.pcm), result.timestamps
+
+    def _generate(self, audio_input, batch_size=1, audio_seconds=None):
+        """调用 AutoModel.generate（或 ONNX 模型），返回后处理后的文本列表"""
+        if audio_seconds is None:
+            audio_seconds = self._audio_seconds(audio_input)
+        with metrics.span("asr", audio_seconds):
+            if self.onnx_model is not None:
+                return self._generate_onnx(audio_input)
+            res = self.model.generate(
+                input=audio_input,
+                language="auto",
+                use_itn=True,
+                batch_size=batch_size,
+            )
+        # return res[0]["text"]
+        return [rich_transcription_postprocess(r["text"]) for r in res]
+
+    def _generate_onnx(self, audio_input):
+        inputs = audio_input if isinstance(audio_input, list) else [audio_input]
+        if all(isinstance(item, str) for item in inputs):
+            # 文件路径列表由 funasr_onnx 按 batch_size 分批推理
+            res = self.onnx_model(inputs, language="auto", textnorm="withitn")
+        else:
+            res = [text for item in inputs
+                   for text in self.onnx_model(item, language="auto", textnorm="withitn")]
+        return [rich_transcription_postprocess(text) for text in res]
+
+    @staticmethod
+    def _to_model_input(audio_input):
+        """int16 PCM 转为 FunASR 需要的 [-1, 1] 区间 float32，文件路径与 float32 数组原样返回"""
+        if isinstance(audio_input, np.ndarray) and audio_input.dtype == np.int16:
+            return audio_input.astype(np.float32) / 32768.0
+        return audio_input
+
+    def _gated_to_text(self, audio_input):
+        audio_input, timestamps = self._gate(audio_input)
+        if timestamps is not None and not timestamps.kept_samples:
+            # 整段都是静音，不调用模型
+            return ""
+        return self._generate(audio_input, audio_seconds=self._original_seconds(timestamps))[0]
 
     def audio_file_to_text(self, audio_file_path):
-        res = self.model.generate(
-            input=audio_file_path,
-            language="auto",
-            use_itn=True,
+        return self._gated_to_text(audio_file_path)
+
+    def pcm_to_text(self, pcm: np.ndarray):
+        """直接识别内存中的 16kHz 单声道 PCM（int16 或 float32），不经过文件系统"""
+        return self._gated_to_text(pcm)
+
+    def batch_to_text(self, audio_inputs):
+        """一次 generate 调用批量识别多个输入（文件路径或 PCM 数组），按输入顺序返回文本"""
+        if len(audio_inputs) == 1:
+            return [self._gated_to_text(audio_inputs[0])]
+        gated = [self._gate(audio_input) for audio_input in audio_inputs]
+        texts = [""] * len(gated)
+        # 整段静音的输入不参与推理
+        active = [index for index, (_, timestamps) in enumerate(gated)
+                  if timestamps is None or timestamps.kept_samples]
+        inputs = [gated[index][0] for index in active]
+        audio_seconds = sum(self._original_seconds(gated[index][1]) for index in active) \
+            if self.silence_gate is not None else None
+        if len(inputs) == 1:
+            results = self._generate(inputs[0], audio_seconds=audio_seconds)
+        elif inputs:
+            try:
+                results = self._generate(inputs, batch_size=len(inputs), audio_seconds=audio_seconds)
+            except NotImplementedError:
+                # 部分模型版本不支持批量解码，退回逐条识别
+                results = [self._generate(audio_input)[0] for audio_input in inputs]
+        else:
+            results = []
+        for index, text in zip(active, results):
+            texts[index] = text
+        return texts
+
+    def _get_vad_model(self):
+        with self._vad_lock:
+            if self._vad_model is None:
+                self._vad_model = AutoModel(
+                    model=self.vad_model_name,
+                    max_single_segment_time=self.max_segment_ms,
+                    disable_update=True,
+                    hub="hf",
+                )
+            return self._vad_model
+
+    def vad_generate(self, chunk, cache, is_final, chunk_size):
+        """
+        流式 VAD：送入一块 float32 PCM，cache 在同一段音频的多次调用间保持
+
+        返回值:
+            本块新确定的 [起点毫秒, 终点毫秒] 列表，-1 表示该端点尚未确定（起点在之前的块中 / 终点在之后的块中）
+        """
+        res = self._get_vad_model().generate(
+            input=chunk,
+            cache=cache,
+            is_final=is_final,
+            chunk_size=chunk_size,
         )
-        # return res[0]["text"]
-        return rich_transcription_postprocess(res[0]["text"])
+        return res[0]["value"] if res else []
+
+    def long_audio_to_segments(self, source, decoder=None):
+        """
+        长音频模式：VAD 分段后并行识别，按时间顺序逐段 yield {start_ms, end_ms, text, elapsed_ms}
+
+        source 为音频文件路径或 16kHz 单声道 PCM 数组；decoder 可传入 ASRBatchScheduler 等提供 submit() 的对象
+        """
+        transcriber = LongAudioTranscriber(self, self.long_audio_config, decoder)
+        yield from transcriber.iter_segments(source)
 
-    def opus_data_to_text(self,opus_data , audio_file_path):
+    def long_audio_to_text(self, source, decoder=None):
+        """长音频模式识别全文"""
+        return "".join(segment['text'] for segment in self.long_audio_to_segments(source, decoder))
+
+    def warmup(self, duration_ms=1000):
+        """
+        对一段静音做一次推理，提前完成算子初始化与内存分配，避免首个真实请求变慢
+
+        返回值:
+            预热耗时（毫秒）
+        """
+        started = time.perf_counter()
+        # 直接推理，不经过静音裁剪（否则静音被整段裁掉，模型不会运行）
+        self._generate(np.zeros(16000 * duration_ms // 1000, dtype=np.float32))
+        return (time.perf_counter() - started) * 1000
+
+    def opus_data_to_text(self, opus_data, audio_file_path=None):
+        """识别 Opus 数据包；audio_file_path 仅用于额外保存解码后的 WAV，识别本身在内存中完成"""
         opus = Opus_Encoder()
-        opus.opus_to_wav_file(audio_file_path, opus_data)
-        res = self.audio_file_to_text(audio_file_path)
-        return res
+        pcm = opus.opus_to_pcm(opus_data)
+        if audio_file_path:
+            opus.pcm_to_wav_file(audio_file_path, pcm)
+        return self.pcm_to_text(pcm)
 
 if __name__ == "__main__":
-    funasr = FunASRWrapper()
-    funasr._register_hook()
-    res = funasr.audio_file_to_text("test.wav")
-
-    if funasr.raw_outputs:  # 获取原始输出
-        logits = funasr.raw_outputs.get("ctc_logits")
-        print("CTC Logits Shape:", logits.shape)
+    funasr = FunASRWrapper({})
+    res = funasr.audio_file_to_text_with_words("test.wav")
 
-        token_ids = torch.argmax(logits, dim=-1).squeeze().tolist()
-        print("Token IDs:", token_ids)
+    for word in res['words']:
+        print(f"{word['start_ms']:>6}-{word['end_ms']:<6} {word['confidence']:.2f} {word['word']}")
 
+    ids, logprobs = funasr.last_ctc_output()
+    print("Token IDs:", ids[0, :, 0].tolist())
 
-    print(res)
\ No newline at end of file
+    print(res['text'])
@@ -0,0 +1,127 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from audio_format.opus import Opus_Encoder
+
+
+class LongAudioTranscriber:
+    """
+    长音频分段识别
+
+    音频按块流式读入（文件经 Opus_Encoder.iter_pcm 读取，不整体载入内存），先送入流式 VAD 切分语音段，
+    每个闭合的语音段立即提交到识别线程池并行解码；在途的语音段数不超过 max_in_flight，
+    结果按时间顺序逐段 yield。首段文字的延迟与峰值内存只取决于段长与在途段数，与文件总长无关。
+
+    asr 需提供 vad_generate(chunk, cache, is_final, chunk_size) 与 pcm_to_text(pcm)（如 FunASRWrapper）；
+    也可另传 decoder（任意提供 submit(pcm) -> Future 的对象，如 ASRBatchScheduler），由其负责解码。
+    """
+
+    def __init__(self, asr, config=None, decoder=None):
+        config = config or {}
+        self.asr = asr
+        self.decoder = decoder
+        self.sample_rate = 16000
+        self.max_workers = int(config.get("max_workers", 2))
+        self.max_in_flight = int(config.get("max_in_flight", 4))
+        # 每次送入 VAD 的音频块长度
+        self.vad_chunk_ms = int(config.get("vad_chunk_ms", 1000))
+        # 没有未闭合语音段时，缓冲区保留的最近音频，供 VAD 回溯语音起点
+        self.lookback_ms = int(config.get("lookback_ms", 2000))
+        self.min_segment_ms = int(config.get("min_segment_ms", 200))
+
+    def _iter_chunks(self, source):
+        """按 vad_chunk_ms 逐块返回 float32 PCM；source 为文件路径或 16kHz 单声道 PCM 数组"""
+        chunk_samples = self.sample_rate * self.vad_chunk_ms // 1000
+        if isinstance(source, np.ndarray):
+            pcm = source.astype(np.float32) / 32768.0 if source.dtype == np.int16 else source
+            for start in range(0, len(pcm), chunk_samples):
+                yield pcm[start:start + chunk_samples]
+            return
+        opus = Opus_Encoder()
+        for chunk in opus.iter_pcm(source, chunk_samples * 2):
+            yield np.frombuffer(chunk, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def _submit(self, executor, pcm):
+        if self.decoder is not None:
+            return self.decoder.submit(pcm)
+        return executor.submit(self.asr.pcm_to_text, pcm)
+
+    def iter_segments(self, source):
+        """
+        逐段 yield 识别结果（按时间顺序）
+
+        每项为 dict：start_ms、end_ms、text，以及从开始到该段产出的耗时 elapsed_ms
+        """
+        started = time.perf_counter()
+        cache = {}
+        buffer = np.zeros(0, dtype=np.float32)
+        buffer_start = 0          # buffer[0] 对应的采样点序号
+        received = 0              # 已读入的采样点数
+        open_start = None         # 未闭合语音段的起点（毫秒）
+        pending = deque()         # (start_ms, end_ms, Future)，按时间顺序
+
+        def result(start_ms, end_ms, future):
+            return {
+                'start_ms': start_ms,
+                'end_ms': end_ms,
+                'text': future.result(),
+                'elapsed_ms': (time.perf_counter() - started) * 1000,
+            }
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="asr-segment") \
+            if self.decoder is None else None
+        try:
+            chunks = self._iter_chunks(source)
+            chunk = next(chunks, None)
+            while chunk is not None:
+                next_chunk = next(chunks, None)
+                is_final = next_chunk is None
+                buffer = np.concatenate([buffer, chunk])
+                received += len(chunk)
+
+                segments = self.asr.vad_generate(chunk, cache, is_final, self.vad_chunk_ms)
+                for begin_ms, end_ms in segments:
+                    if begin_ms >= 0:
+                        open_start = begin_ms
+                    if end_ms < 0:
+                        continue
+                    # end 为 -1 之外的情况：一个语音段闭合
+                    start_ms, open_start = open_start if open_start is not None else 0, None
+                    if end_ms - start_ms < self.min_segment_ms:
+                        continue
+                    begin = max(start_ms * self.sample_rate // 1000 - buffer_start, 0)
+                    end = end_ms * self.sample_rate // 1000 - buffer_start
+                    # 复制出语音段，缓冲区随后可以整体截断
+                    segment = buffer[begin:end].copy()
+                    while len(pending) >= self.max_in_flight:
+                        yield result(*pending.popleft())
+                    pending.append((start_ms, end_ms, self._submit(executor, segment)))
+
+                # 丢弃不再需要的音频：保留未闭合语音段，或最近 lookback_ms
+                if open_start is not None:
+                    keep_from = open_start * self.sample_rate // 1000
+                else:
+                    keep_from = received - self.sample_rate * self.lookback_ms // 1000
+                if keep_from > buffer_start:
+                    buffer = buffer[keep_from - buffer_start:]
+                    buffer_start = keep_from
+
+                # 顺带产出已经完成的结果，不阻塞读入
+                while pending and pending[0][2].done():
+                    yield result(*pending.popleft())
+                chunk = next_chunk
+
+            while pending:
+                yield result(*pending.popleft())
+        finally:
+            for _, _, future in pending:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def transcribe(self, source):
+        """识别整段长音频，返回拼接后的全文"""
+        return "".join(segment['text'] for segment in self.iter_segments(source))
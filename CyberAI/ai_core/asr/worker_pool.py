@@ -0,0 +1,407 @@
+import asyncio
+import gc
+import multiprocessing
+import os
+import stat
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import wait
+
+import numpy as np
+
+from audio_format.opus import Opus_Encoder
+from utils.metrics import metrics
+
+# 子进程连续多少次在就绪前退出后不再重启该进程（避免启动即崩溃时反复 fork）
+MAX_STARTUP_FAILURES = 3
+
+
+def _close_inherited_fds(keep):
+    """
+    关闭 fork 继承的管道与套接字（keep 中的 fd 除外）
+
+    推理进程可能由父进程中的任意线程 fork（进程退出后由收集线程重新 fork），会继承父进程此刻打开的
+    FFmpeg 管道、网关的 asyncio 子进程管道与 WebSocket 连接等。子进程长期存活，持有这些 fd 会让
+    父进程一侧永远等不到 EOF。fd 用 /dev/null 覆盖而不是 close，继承来的文件对象被回收时
+    关闭的仍是同一个 fd 号，不会误关子进程之后打开的文件。普通文件（如共享内存中的权重）不受影响。
+    """
+    fd_dir = "/proc/self/fd" if os.path.isdir("/proc/self/fd") else "/dev/fd"
+    try:
+        fds = [int(name) for name in os.listdir(fd_dir)]
+    except (OSError, ValueError):
+        return
+    devnull = os.open(os.devnull, os.O_RDWR)
+    try:
+        for fd in fds:
+            if fd <= 2 or fd == devnull or fd in keep:
+                continue
+            try:
+                mode = os.fstat(fd).st_mode
+            except OSError:
+                # listdir 自身使用的目录 fd，已关闭
+                continue
+            if stat.S_ISFIFO(mode) or stat.S_ISSOCK(mode):
+                os.dup2(devnull, fd)
+    finally:
+        os.close(devnull)
+
+
+def _worker_main(index, asr, conn, num_threads, cpus, warmup):
+    """推理工作进程：固定线程数与 CPU 亲和性，预热后循环处理父进程派发的请求"""
+    import torch
+
+    _close_inherited_fds({conn.fileno()})
+    # 指标由父进程按返回的忙碌时间记录，子进程内不再重复统计
+    metrics.enabled = False
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    torch.set_num_threads(num_threads)
+    try:
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # 父进程已启动过并行任务时不能再修改
+        pass
+    if warmup and hasattr(asr, "warmup"):
+        try:
+            asr.warmup()
+        except Exception as e:
+            print(f"ASR 推理进程 {index} 预热失败: {e}")
+    # 就绪消息：request_id 为 None
+    conn.send((None, None, None, 0.0, 0.0))
+
+    while True:
+        try:
+            message = conn.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+        request_id, audio_input = message
+        started = time.perf_counter()
+        audio_seconds = 0.0
+        try:
+            if not isinstance(audio_input, np.ndarray):
+                # 文件在子进程中读取，父进程不必为计算 RTF 读取文件
+                audio_input = Opus_Encoder().load_pcm(audio_input)
+            audio_seconds = len(audio_input) / 16000
+            text, error = asr.pcm_to_text(audio_input), None
+        except Exception as e:
+            text, error = None, f"{type(e).__name__}: {e}"
+        conn.send((request_id, text, error, time.perf_counter() - started, audio_seconds))
+    conn.close()
+
+
+class ASRWorkerPool:
+    """
+    多进程 ASR 推理池
+
+    父进程加载一次模型，再 fork 出 workers 个推理进程：模型权重移入共享内存，
+    子进程通过 fork 继承同一份权重（写时复制，不会整体复制），内存占用不随进程数倍增。
+    每个进程有独立的 torch 线程数（threads_per_worker）并可绑定到各自的 CPU 核，
+    预热完成后才开始接收请求；父进程中的调度只把请求派发给空闲进程，其余请求排队等待。
+    进程意外退出时，正在处理的请求以异常结束，进程被重新 fork，排队的请求由其余进程继续处理。
+
+    需要 fork（Linux/macOS），且父进程不应执行任何推理（包括预热），避免子进程继承已初始化的线程池。
+    接口与 ASRBatchScheduler 一致（submit / transcribe / transcribe_async / get_stats / close），
+    也可作为 LongAudioTranscriber 的 decoder。
+    """
+
+    def __init__(self, asr, config=None):
+        config = config or {}
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise RuntimeError("ASR 多进程模式需要 fork，当前平台请使用单进程模式")
+        self.asr = asr
+        cpu_count = os.cpu_count() or 1
+        self.threads_per_worker = int(config.get("threads_per_worker", 1))
+        self.num_workers = int(config.get("workers", max(cpu_count // self.threads_per_worker, 1)))
+        self.warmup = bool(config.get("warmup", True))
+        self._pin = config.get("pin_cpus", True) and self.num_workers * self.threads_per_worker <= cpu_count
+
+        self._share_weights()
+
+        self._lock = threading.Lock()
+        self._pending = deque()           # (request_id, audio_input, future, submitted)
+        self._futures = {}                # request_id -> (future, worker, submitted)
+        self._idle = deque()              # 已就绪的空闲进程
+        self._alive = set()               # 未退出的进程（含尚未就绪的）
+        self._ready = set()
+        self._startup_failures = [0] * self.num_workers
+        self._restarts = 0
+        self._next_id = 0
+        self._running = True
+        self._reset_stats()
+
+        self._context = multiprocessing.get_context("fork")
+        self._conns = [None] * self.num_workers
+        self._processes = [None] * self.num_workers
+        # 同一管道的写入不能交错（派发与 close 可能在不同线程）
+        self._send_locks = [threading.Lock() for _ in range(self.num_workers)]
+        for index in range(self.num_workers):
+            self._spawn(index)
+
+        self._collector = threading.Thread(target=self._collect, name="asr-worker-collector", daemon=True)
+        self._collector.start()
+        metrics.track_queue("asr_worker_pool", self.queue_depth)
+
+    def _share_weights(self):
+        """把模型参数移入共享内存，并切到推理模式"""
+        module = getattr(getattr(self.asr, "model", None), "model", None)
+        if module is not None and hasattr(module, "share_memory"):
+            module.eval()
+            module.share_memory()
+
+    def _spawn(self, index):
+        """fork 第 index 个推理进程，就绪（预热完成）后才会被派发请求"""
+        cpus = None
+        if self._pin:
+            first = index * self.threads_per_worker
+            cpus = set(range(first, first + self.threads_per_worker))
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(
+            target=_worker_main,
+            args=(index, self.asr, child_conn, self.threads_per_worker, cpus, self.warmup),
+            name=f"asr-worker-{index}",
+            daemon=True,
+        )
+        # fork 前冻结现有对象，避免子进程中的 GC 改写对象头导致整页复制
+        gc.freeze()
+        try:
+            process.start()
+        finally:
+            gc.unfreeze()
+        child_conn.close()
+        with self._lock:
+            self._conns[index] = parent_conn
+            self._processes[index] = process
+            self._alive.add(index)
+        return parent_conn
+
+    def _reset_stats(self):
+        self._started_at = time.perf_counter()
+        self._worker_stats = [{'requests': 0, 'errors': 0, 'busy_seconds': 0.0, 'audio_seconds': 0.0}
+                              for _ in range(self.num_workers)]
+        self._latency_ms_total = 0.0
+        self._latency_ms_max = 0.0
+        self._wait_ms_total = 0.0
+
+    def _assign(self):
+        """
+        为空闲进程分配排队的请求（调用方持有 _lock）
+
+        返回值:
+            [(进程序号, 管道, request_id, 音频输入), ...]，由调用方在锁外通过 _send 发送
+        """
+        assignments = []
+        while self._pending and self._idle:
+            worker = self._idle.popleft()
+            request_id, audio_input, future, submitted = self._pending.popleft()
+            if not future.set_running_or_notify_cancel():
+                self._idle.appendleft(worker)
+                continue
+            self._wait_ms_total += (time.perf_counter() - submitted) * 1000
+            self._futures[request_id] = (future, worker, submitted)
+            assignments.append((worker, self._conns[worker], request_id, audio_input))
+        return assignments
+
+    def _send(self, assignments):
+        """把请求写入各进程的管道；PCM 数组的序列化与写入不占用 _lock"""
+        while assignments:
+            worker, conn, request_id, audio_input = assignments.pop(0)
+            try:
+                with self._send_locks[worker]:
+                    conn.send((request_id, audio_input))
+            except Exception as e:
+                assignments.extend(self._send_failed(worker, request_id, e))
+
+    def _send_failed(self, worker, request_id, error):
+        """发送失败的请求以异常结束；返回因此可以继续派发的请求"""
+        with self._lock:
+            entry = self._futures.pop(request_id, None)
+            assignments = []
+            if entry is not None and not isinstance(error, OSError):
+                # 序列化失败，进程本身正常（Connection.send 先序列化再写入，管道中没有残留数据）；
+                # entry 已被 _worker_died 取走时进程已退出，不能放回空闲队列
+                self._idle.append(worker)
+                assignments = self._assign()
+            # OSError：管道已断开，进程已退出，由收集线程读到 EOF 后处理
+        if entry is not None:
+            entry[0].set_exception(RuntimeError(f"ASR 请求发送到推理进程 {worker} 失败: {error}"))
+        return assignments
+
+    def submit(self, audio_input) -> Future:
+        """提交一个识别请求（PCM 数组或文件路径），返回 concurrent.futures.Future"""
+        future = Future()
+        with self._lock:
+            if not self._running:
+                raise RuntimeError("ASR 推理池已关闭")
+            if not self._alive:
+                raise RuntimeError("ASR 推理池没有可用的推理进程")
+            self._next_id += 1
+            self._pending.append((self._next_id, audio_input, future, time.perf_counter()))
+            assignments = self._assign()
+        self._send(assignments)
+        return future
+
+    def transcribe(self, audio_input, timeout=None):
+        """阻塞等待识别结果"""
+        return self.submit(audio_input).result(timeout=timeout)
+
+    async def transcribe_async(self, audio_input):
+        """在 asyncio 中等待识别结果"""
+        return await asyncio.wrap_future(self.submit(audio_input))
+
+    def queue_depth(self):
+        """排队等待空闲进程的请求数"""
+        with self._lock:
+            return len(self._pending)
+
+    def _collect(self):
+        """接收各进程的结果，回填 Future，并把进程重新标记为空闲；进程退出时重新 fork"""
+        with self._lock:
+            conns = {conn: index for index, conn in enumerate(self._conns)}
+        while conns:
+            for conn in wait(list(conns)):
+                try:
+                    request_id, text, error, busy, audio_seconds = conn.recv()
+                except (EOFError, OSError):
+                    index = conns.pop(conn)
+                    conn.close()
+                    if self._worker_died(index):
+                        conns[self._spawn(index)] = index
+                    continue
+                worker = conns[conn]
+                if request_id is None:
+                    self._worker_ready(worker)
+                    continue
+                finished = time.perf_counter()
+                with self._lock:
+                    future, worker, submitted = self._futures.pop(request_id)
+                    stats = self._worker_stats[worker]
+                    stats['requests'] += 1
+                    stats['busy_seconds'] += busy
+                    stats['audio_seconds'] += audio_seconds
+                    stats['errors'] += error is not None
+                    latency_ms = (finished - submitted) * 1000
+                    self._latency_ms_total += latency_ms
+                    self._latency_ms_max = max(self._latency_ms_max, latency_ms)
+                    self._idle.append(worker)
+                    assignments = self._assign()
+                self._send(assignments)
+                # 推理在子进程中进行，耗时与实时率由父进程按子进程报告的忙碌时间与音频时长记录
+                if error is not None:
+                    metrics.error("asr")
+                else:
+                    metrics.observe("asr", busy, audio_seconds=audio_seconds)
+                if error is not None:
+                    future.set_exception(RuntimeError(f"ASR 推理失败: {error}"))
+                else:
+                    future.set_result(text)
+
+    def _worker_ready(self, worker):
+        """进程预热完成，开始接收请求"""
+        with self._lock:
+            self._ready.add(worker)
+            self._startup_failures[worker] = 0
+            self._idle.append(worker)
+            assignments = self._assign()
+        self._send(assignments)
+
+    def _worker_died(self, worker):
+        """
+        进程退出：其正在处理的请求以异常结束，并从空闲队列中移除
+
+        返回值:
+            是否需要重新 fork 该进程（推理池未关闭，且该进程没有连续在就绪前退出）
+        """
+        self._processes[worker].join(timeout=1)
+        failed = []
+        with self._lock:
+            self._alive.discard(worker)
+            if worker in self._idle:
+                self._idle.remove(worker)
+            if worker in self._ready:
+                self._ready.discard(worker)
+            else:
+                self._startup_failures[worker] += 1
+            lost = [request_id for request_id, entry in self._futures.items() if entry[1] == worker]
+            failed = [self._futures.pop(request_id)[0] for request_id in lost]
+            respawn = self._running and self._startup_failures[worker] < MAX_STARTUP_FAILURES
+            if self._running:
+                exitcode = self._processes[worker].exitcode
+                print(f"ASR 推理进程 {worker} 已退出（exitcode={exitcode}）" + ("，重新启动" if respawn else ""))
+            if respawn:
+                self._restarts += 1
+            elif not self._alive:
+                # 没有任何可用进程，排队的请求不会再被处理
+                failed += [entry[2] for entry in self._pending]
+                self._pending.clear()
+        for future in failed:
+            if not future.done():
+                future.set_exception(RuntimeError(f"ASR 推理进程 {worker} 已退出"))
+        return respawn
+
+    def get_stats(self, reset=False):
+        """
+        获取各进程利用率与实时率（RTF）
+
+        返回值:
+            dict: workers（每个进程的请求数、忙碌时间、利用率、RTF）、总请求数、
+            整体 RTF（推理耗时 / 音频时长）、吞吐（音频秒 / 墙钟秒）、平均排队等待与端到端延迟、
+            存活与空闲的进程数、重启次数
+        """
+        with self._lock:
+            elapsed = time.perf_counter() - self._started_at
+            workers = []
+            for index, stats in enumerate(self._worker_stats):
+                workers.append(dict(
+                    stats,
+                    worker=index,
+                    utilization=stats['busy_seconds'] / elapsed if elapsed > 0 else 0.0,
+                    rtf=stats['busy_seconds'] / stats['audio_seconds'] if stats['audio_seconds'] else 0.0,
+                ))
+            requests = sum(stats['requests'] for stats in workers)
+            busy = sum(stats['busy_seconds'] for stats in workers)
+            audio = sum(stats['audio_seconds'] for stats in workers)
+            result = {
+                'workers': workers,
+                'requests': requests,
+                'errors': sum(stats['errors'] for stats in workers),
+                'avg_utilization': busy / (elapsed * self.num_workers) if elapsed > 0 else 0.0,
+                'rtf': busy / audio if audio else 0.0,
+                'audio_sec_per_sec': audio / elapsed if elapsed > 0 else 0.0,
+                'avg_queue_wait_ms': self._wait_ms_total / requests if requests else 0.0,
+                'avg_latency_ms': self._latency_ms_total / requests if requests else 0.0,
+                'max_latency_ms': self._latency_ms_max,
+                'queue_depth': len(self._pending),
+                'alive_workers': len(self._alive),
+                'idle_workers': len(self._idle),
+                'restarts': self._restarts,
+            }
+            if reset:
+                self._reset_stats()
+        return result
+
+    def close(self, wait=True):
+        """停止全部推理进程；已派发的请求会先处理完，未派发的请求被取消"""
+        with self._lock:
+            if not self._running:
+                return
+            self._running = False
+            metrics.untrack_queue("asr_worker_pool")
+            pending = [entry[2] for entry in self._pending]
+            self._pending.clear()
+            conns = [(index, self._conns[index]) for index in self._alive]
+        for future in pending:
+            future.cancel()
+        for index, conn in conns:
+            try:
+                with self._send_locks[index]:
+                    conn.send(None)
+            except OSError:
+                pass
+        if wait:
+            self._collector.join()
+            for process in self._processes:
+                process.join()
@@ -0,0 +1,196 @@
+"""
+批量将目录中的音频文件转换为 Opus
+
+Opus_Encoder 是进程级单例，不能在多线程中共用，因此按文件分发到 ProcessPoolExecutor，
+每个工作进程在初始化时创建自己的编码器。输出比输入新的文件视为已是最新，直接跳过。
+
+命令行（在 ai_core 目录下执行）:
+    python -m audio_format.bulk_transcode <输入目录> <输出目录> [--format container|custom] [--workers N]
+                                          [--profile archive]
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from audio_format.opus import Opus_Encoder
+from audio_format.opus_container import OpusContainerWriter
+
+# 输出格式 -> 扩展名
+OUTPUT_FORMATS = {
+    'container': '.cyop',   # 带索引的容器（opus_container.py）
+    'custom': '.opus',      # save_opus_raw_custom 的 4 字节长度前缀格式
+}
+
+_encoder = None
+
+
+def _init_worker(ffmpeg_path, profile=None):
+    """工作进程初始化：每个进程一个编码器，profile 为编码档位名称"""
+    global _encoder
+    _encoder = Opus_Encoder(ffmpeg_path)
+    if profile:
+        _encoder.configure({'profile': profile})
+
+
+def _drain(stream, consume):
+    """把生成器产出的每个数据包交给 consume，返回生成器的返回值（时长毫秒）"""
+    while True:
+        try:
+            consume(next(stream))
+        except StopIteration as e:
+            return e.value
+
+
+def _write_packets(encoder, input_path, output_path, output_format):
+    """边编码边写出，返回 (数据包数, 时长毫秒)"""
+    stream = encoder.audio_to_opus_stream(input_path)
+    try:
+        if output_format == 'container':
+            with OpusContainerWriter(output_path, encoder.opus_sample_rate, encoder.opus_channel,
+                                     encoder.opus_frame_time) as writer:
+                duration = _drain(stream, writer.append)
+                return len(writer), duration
+
+        with open(output_path, 'wb') as f:
+            lengths = []
+
+            def write(packet):
+                f.write(len(packet).to_bytes(4, byteorder='big'))
+                f.write(packet)
+                lengths.append(len(packet))
+
+            duration = _drain(stream, write)
+            return len(lengths), duration
+    finally:
+        # 写出失败时结束 FFmpeg 子进程
+        stream.close()
+
+
+def transcode_file(input_path, output_path, output_format='container'):
+    """
+    在工作进程中转换单个文件
+
+    先写入临时文件再替换，转换中断不会留下被误判为最新的输出。
+    返回值:
+        (输入路径, 数据包数, 时长毫秒, 错误信息或 None)
+    """
+    encoder = _encoder or Opus_Encoder()
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    try:
+        packets, duration = _write_packets(encoder, input_path, temp_path, output_format)
+        os.replace(temp_path, output_path)
+        return input_path, packets, duration, None
+    except Exception as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return input_path, 0, 0, f"{type(e).__name__}: {e}"
+
+
+def is_up_to_date(input_path, output_path):
+    """输出存在且修改时间不早于输入"""
+    try:
+        return os.stat(output_path).st_mtime >= os.stat(input_path).st_mtime
+    except FileNotFoundError:
+        return False
+
+
+def plan_jobs(input_dir, output_dir, output_format='container', recursive=True, force=False):
+    """
+    列出需要转换的文件，保持相对目录结构
+
+    返回值:
+        ([(输入路径, 输出路径), ...], 跳过的文件数)
+    """
+    extension = OUTPUT_FORMATS[output_format]
+    jobs = []
+    skipped = 0
+    for root, dirs, files in os.walk(input_dir):
+        if not recursive:
+            dirs.clear()
+        dirs.sort()
+        for file_name in sorted(files):
+            if os.path.splitext(file_name)[1].lower() not in Opus_Encoder.SUPPORTED_FORMATS:
+                continue
+            input_path = os.path.join(root, file_name)
+            relative = os.path.relpath(input_path, input_dir)
+            output_path = os.path.join(output_dir, os.path.splitext(relative)[0] + extension)
+            if not force and is_up_to_date(input_path, output_path):
+                skipped += 1
+                continue
+            jobs.append((input_path, output_path))
+    return jobs, skipped
+
+
+def bulk_transcode(input_dir, output_dir, output_format='container', workers=None,
+                   ffmpeg_path=None, recursive=True, force=False, verbose=True, profile=None):
+    """
+    多进程批量转换
+
+    参数:
+        output_format: container（带索引容器）或 custom（长度前缀格式）
+        workers: 工作进程数，默认为 CPU 核数
+        force: 为 True 时忽略已是最新的输出，全部重新转换
+        profile: Opus 编码档位名称（如 archive），默认使用 default
+
+    返回值:
+        统计字典：files、skipped、failed、packets、audio_seconds、elapsed、files_per_sec、audio_sec_per_sec
+    """
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式: {output_format}，可选 {', '.join(OUTPUT_FORMATS)}")
+
+    jobs, skipped = plan_jobs(input_dir, output_dir, output_format, recursive, force)
+    for output_dir_path in {os.path.dirname(output_path) for _, output_path in jobs}:
+        os.makedirs(output_dir_path, exist_ok=True)
+
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    stats = {'files': 0, 'skipped': skipped, 'failed': 0, 'packets': 0, 'audio_seconds': 0.0}
+    start = time.perf_counter()
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(ffmpeg_path, profile)) as executor:
+            futures = [executor.submit(transcode_file, input_path, output_path, output_format)
+                       for input_path, output_path in jobs]
+            for future in as_completed(futures):
+                input_path, packets, duration, error = future.result()
+                if error:
+                    stats['failed'] += 1
+                    print(f"转换失败 {input_path}: {error}")
+                    continue
+                stats['files'] += 1
+                stats['packets'] += packets
+                stats['audio_seconds'] += duration / 1000
+                if verbose:
+                    print(f"[{stats['files'] + stats['failed']}/{len(jobs)}] {input_path} ({duration}ms)")
+
+    elapsed = time.perf_counter() - start
+    stats['workers'] = workers
+    stats['elapsed'] = elapsed
+    stats['files_per_sec'] = stats['files'] / elapsed if elapsed > 0 else 0.0
+    stats['audio_sec_per_sec'] = stats['audio_seconds'] / elapsed if elapsed > 0 else 0.0
+    return stats
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='批量将音频文件转换为 Opus')
+    parser.add_argument('input_dir', type=str, help='输入目录')
+    parser.add_argument('output_dir', type=str, help='输出目录（保持相对目录结构）')
+    parser.add_argument('--format', type=str, default='container', choices=sorted(OUTPUT_FORMATS),
+                        help='输出格式 (默认: container)')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数 (默认: CPU 核数)')
+    parser.add_argument('--ffmpeg', type=str, default=None, help='FFmpeg 可执行文件路径')
+    parser.add_argument('--no-recursive', action='store_true', help='不处理子目录')
+    parser.add_argument('--force', action='store_true', help='忽略已是最新的输出，全部重新转换')
+    parser.add_argument('--quiet', action='store_true', help='不逐个打印文件')
+    parser.add_argument('--profile', type=str, default=None, help='Opus 编码档位，如 archive（见 audio_format/opus_profile.py）')
+
+    args = parser.parse_args()
+    result = bulk_transcode(args.input_dir, args.output_dir, args.format, args.workers, args.ffmpeg,
+                            recursive=not args.no_recursive, force=args.force, verbose=not args.quiet,
+                            profile=args.profile)
+    print(f"完成 {result['files']} 个，跳过 {result['skipped']} 个，失败 {result['failed']} 个，"
+          f"音频 {result['audio_seconds']:.1f}s，耗时 {result['elapsed']:.2f}s，"
+          f"{result['files_per_sec']:.2f} 文件/s，{result['audio_sec_per_sec']:.1f} 音频秒/s "
+          f"({result['workers']} 进程)")
@@ -0,0 +1,87 @@
+import threading
+from collections import deque
+
+
+class OpusCodecPool:
+    """
+    Opus 编码器/解码器上下文池（线程安全）
+
+    创建 libopus 上下文需要分配并初始化状态，按会话租用、用完归还可避免反复创建。
+    归还时调用 reset_state() 清空编解码状态，下一个会话拿到的上下文与新建的等价。
+    空闲上下文最多保留 max_idle 个，多出的直接丢弃；租用数不设上限，不会阻塞实时会话。
+    """
+
+    def __init__(self, encoder_factory, decoder_factory, max_idle=32):
+        self._factories = {'encoder': encoder_factory, 'decoder': decoder_factory}
+        self.max_idle = max_idle
+        self._lock = threading.Lock()
+        self._idle = {'encoder': deque(), 'decoder': deque()}
+        self._stats = {
+            kind: {'leased': 0, 'created': 0, 'reused': 0, 'discarded': 0, 'peak_leased': 0}
+            for kind in self._factories
+        }
+
+    def _lease(self, kind):
+        with self._lock:
+            stats = self._stats[kind]
+            stats['leased'] += 1
+            stats['peak_leased'] = max(stats['peak_leased'], stats['leased'])
+            if self._idle[kind]:
+                stats['reused'] += 1
+                return self._idle[kind].pop()
+            stats['created'] += 1
+        try:
+            return self._factories[kind]()
+        except Exception:
+            with self._lock:
+                self._stats[kind]['leased'] -= 1
+                self._stats[kind]['created'] -= 1
+            raise
+
+    def _release(self, kind, context):
+        # 清空状态放在锁外，不阻塞其他会话
+        context.reset_state()
+        with self._lock:
+            self._stats[kind]['leased'] -= 1
+            if len(self._idle[kind]) < self.max_idle:
+                self._idle[kind].append(context)
+            else:
+                self._stats[kind]['discarded'] += 1
+
+    def lease_encoder(self):
+        return self._lease('encoder')
+
+    def release_encoder(self, encoder):
+        self._release('encoder', encoder)
+
+    def discard_encoder(self, encoder):
+        """结束租用但不放回空闲队列（如编码参数已过期）"""
+        with self._lock:
+            self._stats['encoder']['leased'] -= 1
+            self._stats['encoder']['discarded'] += 1
+
+    def lease_decoder(self):
+        return self._lease('decoder')
+
+    def release_decoder(self, decoder):
+        self._release('decoder', decoder)
+
+    def get_stats(self):
+        """
+        获取池状态，用于确定池大小
+
+        返回值:
+            {'encoder': {...}, 'decoder': {...}}，各含 leased（当前租出）、idle（当前空闲）、
+            peak_leased、created、reused、discarded
+        """
+        with self._lock:
+            return {
+                kind: dict(stats, idle=len(self._idle[kind]))
+                for kind, stats in self._stats.items()
+            }
+
+    def clear(self):
+        """丢弃全部空闲上下文（已租出的不受影响）"""
+        with self._lock:
+            for idle in self._idle.values():
+                idle.clear()
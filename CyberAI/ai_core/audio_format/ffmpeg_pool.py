@@ -0,0 +1,191 @@
+import atexit
+import os
+import shutil
+import subprocess
+import threading
+
+
+class FFmpegDecoderPool:
+    """
+    预先启动的 FFmpeg 解码进程池
+
+    每个进程以 `-i pipe:0` 启动后阻塞等待输入。解码时取出一个空闲进程，由写线程把文件内容送入 stdin，
+    从 stdout 读取 s16le PCM，同时在后台补充新进程，fork/exec 与 FFmpeg 初始化不在调用路径上。
+    FFmpeg 读到输入结束即退出，所以一个进程只解码一个文件。
+    moov 可能位于文件末尾的 mp4/m4a/mov 不能从管道读取，仍按路径启动 FFmpeg。
+    进程在第一次解码时才开始预启动；fork 出的子进程不会使用父进程预启动的进程，
+    并在 fork 后立即关闭继承的管道，否则子进程持有 FFmpeg 的 stdin，父进程的解码要等子进程退出才能结束。
+    """
+
+    SEEKABLE_FORMATS = ('.mp4', '.m4a', '.mov', '.3gp')
+
+    def __init__(self, ffmpeg_path, sample_rate=16000, channels=1, size=2):
+        self.ffmpeg_path = ffmpeg_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.size = size
+        self._lock = threading.Lock()
+        self._idle = []
+        self._active = set()              # 正在解码的进程
+        self._pid = os.getpid()
+        self._refilling = False
+        self._closed = False
+        self.stats = {'decodes': 0, 'prespawned': 0, 'spawned_on_demand': 0}
+        atexit.register(self.close)
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._after_fork_in_child)
+
+    def _after_fork_in_child(self):
+        """fork 出的子进程：丢弃父进程的 FFmpeg 进程，关闭继承的管道，重建 fork 时可能被其他线程持有的锁"""
+        self._lock = threading.Lock()
+        self._refilling = False
+        self._pid = os.getpid()
+        inherited = self._idle + list(self._active)
+        self._idle, self._active = [], set()
+        devnull = os.open(os.devnull, os.O_RDWR)
+        try:
+            for process in inherited:
+                for pipe in (process.stdin, process.stdout):
+                    if pipe is not None and not pipe.closed:
+                        # 用 /dev/null 覆盖而不是直接 close：文件对象被回收时仍会关闭这个 fd 号，
+                        # 若已被子进程复用给其他文件，会误关后者
+                        os.dup2(devnull, pipe.fileno())
+        finally:
+            os.close(devnull)
+
+    def _command(self, source):
+        return [
+            self.ffmpeg_path,
+            '-loglevel', 'error',
+            '-i', source,
+            '-ar', str(self.sample_rate),
+            '-ac', str(self.channels),
+            '-f', 's16le',
+            'pipe:1',
+        ]
+
+    def _spawn(self, source="pipe:0"):
+        stdin = subprocess.PIPE if source == "pipe:0" else subprocess.DEVNULL
+        return subprocess.Popen(self._command(source), stdin=stdin, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+
+    def _take(self):
+        """取一个空闲进程，池为空时立即启动一个"""
+        with self._lock:
+            if self._pid != os.getpid():
+                # fork 出的子进程：空闲进程属于父进程，不能使用
+                self._idle = []
+                self._pid = os.getpid()
+            while self._idle:
+                process = self._idle.pop()
+                if process.poll() is None:
+                    self.stats['prespawned'] += 1
+                    return process
+            self.stats['spawned_on_demand'] += 1
+        return self._spawn()
+
+    def _schedule_refill(self):
+        with self._lock:
+            if self._refilling or self._closed:
+                return
+            self._refilling = True
+        threading.Thread(target=self._refill, name="ffmpeg-prespawn", daemon=True).start()
+
+    def _refill(self):
+        try:
+            while True:
+                with self._lock:
+                    if self._closed or len(self._idle) >= self.size:
+                        return
+                try:
+                    process = self._spawn()
+                except OSError:
+                    return
+                with self._lock:
+                    if self._closed:
+                        process.kill()
+                        process.wait()
+                        return
+                    self._idle.append(process)
+        finally:
+            with self._lock:
+                self._refilling = False
+
+    def prestart(self):
+        """提前启动空闲进程（例如服务启动时），否则在第一次解码时开始"""
+        self._schedule_refill()
+
+    def iter_pcm(self, audio_file_path, chunk_bytes):
+        """按 chunk_bytes 大小逐块返回解码得到的 PCM，最后一块可能不足"""
+        if not os.path.exists(audio_file_path):
+            raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
+
+        writer = None
+        try:
+            if os.path.splitext(audio_file_path)[1].lower() in self.SEEKABLE_FORMATS:
+                process = self._spawn(audio_file_path)
+            else:
+                process = self._take()
+                writer = threading.Thread(target=self._feed, args=(process, audio_file_path),
+                                          name="ffmpeg-feed", daemon=True)
+                writer.start()
+        except FileNotFoundError:
+            print(f"找不到 FFmpeg 可执行文件: {self.ffmpeg_path}")
+            raise
+        with self._lock:
+            self.stats['decodes'] += 1
+            self._active.add(process)
+        self._schedule_refill()
+
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+            returncode = process.wait()
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, process.args)
+        finally:
+            # 调用方提前停止迭代时结束子进程，避免残留
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            if writer is not None:
+                writer.join()
+            with self._lock:
+                self._active.discard(process)
+
+    @staticmethod
+    def _feed(process, audio_file_path):
+        try:
+            with open(audio_file_path, "rb") as f:
+                shutil.copyfileobj(f, process.stdin, 64 * 1024)
+        except OSError:
+            # FFmpeg 提前退出（输入无法解码或调用方停止读取）
+            pass
+        finally:
+            try:
+                process.stdin.close()
+            except OSError:
+                pass
+
+    def set_ffmpeg_path(self, ffmpeg_path):
+        """更换 FFmpeg 路径，已预启动的进程作废"""
+        self.ffmpeg_path = ffmpeg_path
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+            owned = self._pid == os.getpid()
+        if owned:
+            for process in idle:
+                process.kill()
+                process.wait()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+        self.clear()
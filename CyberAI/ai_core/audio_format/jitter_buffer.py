@@ -0,0 +1,322 @@
+"""
+接收端自适应抖动缓冲区
+
+命令行（在 ai_core 目录下执行）模拟有丢包与抖动的网络，报告补偿帧数、增加的延迟与时间轴偏差:
+    python -m audio_format.jitter_buffer [--seconds 20] [--loss 0.05] [--jitter-ms 40] [--fec] [--bitrate 24000] [--seed 0]
+"""
+
+import asyncio
+import time
+from math import ceil
+
+import numpy as np
+import opuslib_next
+
+from utils.metrics import metrics
+
+
+class OpusJitterBuffer:
+    """
+    按序号重排并补偿丢包的 Opus 抖动缓冲区
+
+    网络送来的数据包带序号，push() 按序号存放，乱序到达的包在播放前归位；pull() 按帧节拍取出下一帧 PCM：
+    包已到达则正常解码；错过播放时间的包在流带有带内 FEC（fec=True）且下一个包已到达时用其 FEC 恢复，
+    否则由解码器做丢包隐藏（PLC）。丢包不会使输出变短，下游（ASR、播放）看到的是时间轴连续的帧流。
+
+    目标延迟为 帧时长 + jitter_factor × 到达抖动（RFC 3550 的平滑估计），限制在 [min_delay_ms, max_delay_ms] 内。
+    稳定到达时每个包在缓冲区中等待约一个目标延迟（无抖动时为一帧）。缓冲区取空时补一帧 PLC 而不前进序号：
+    等待的包若只是迟到，到达后顺延一帧播放（延迟增加一帧）；若之后先到的是更晚的包，说明它已丢失，
+    补出的帧即代替了它，直接跳过，时间轴与延迟不变。积压超出目标延迟 2 帧以上时丢弃静音帧，
+    逐步回到目标延迟；积压超过 max_delay_ms 时跳过最早的包。
+    """
+
+    def __init__(self, session, frame_ms=60, min_delay_ms=None, max_delay_ms=1000, jitter_factor=3.0,
+                 seq_modulo=65536, quiet_level=300, fec=False):
+        """
+        参数:
+            session: OpusCodecSession，解码器在整个流期间保持状态，close() 时归还
+            fec: 发送端是否开启带内 FEC（如 voip-low-latency 档位）；未开启时丢包一律做 PLC
+            seq_modulo: 序号回绕的模（RTP 为 65536），None 表示序号不回绕
+            quiet_level: 峰值低于该值（int16）的帧视为静音，可在积压时丢弃
+        """
+        self.session = session
+        self.frame_ms = frame_ms
+        self.frame_seconds = frame_ms / 1000
+        self.min_delay_ms = frame_ms if min_delay_ms is None else min_delay_ms
+        self.max_delay_ms = max(max_delay_ms, self.min_delay_ms)
+        self.jitter_factor = jitter_factor
+        self.seq_modulo = seq_modulo
+        self.quiet_level = quiet_level
+        self.fec = fec
+        self._packets = {}  # 序号 -> (数据包, 到达时间)
+        self._next_seq = None
+        self._highest = None
+        self._transit = None
+        self._jitter = 0.0
+        self._latency_sum = 0.0
+        # 缓冲区取空后补出、尚未对应到具体序号的帧数
+        self._underrun_frames = 0
+        self._started = False
+        self._ended = False
+        self.stats = {'received': 0, 'decoded': 0, 'fec': 0, 'plc': 0, 'underruns': 0,
+                      'reordered': 0, 'late': 0, 'duplicate': 0, 'dropped': 0}
+
+    def _count(self, kind):
+        self.stats[kind] += 1
+        metrics.jitter_frame(kind)
+
+    def _extend(self, seq):
+        """回绕的序号展开为单调递增的整数（以收到的最大序号为参照）"""
+        if self.seq_modulo is None or self._highest is None:
+            return seq
+        delta = (seq - self._highest) % self.seq_modulo
+        if delta >= self.seq_modulo // 2:
+            delta -= self.seq_modulo
+        return self._highest + delta
+
+    def _update_jitter(self, seq, arrival):
+        # 相对传输时延 = 到达时间 - 按序号推算的发送时间，其逐包变化量的平滑均值即到达抖动
+        transit = arrival - seq * self.frame_seconds
+        if self._transit is not None:
+            deviation = abs(transit - self._transit)
+            self._jitter += (deviation - self._jitter) / 16
+            metrics.jitter_delay("jitter", deviation)
+        self._transit = transit
+
+    def target_delay_ms(self):
+        delay = self.frame_ms + self.jitter_factor * self._jitter * 1000
+        return min(max(delay, self.min_delay_ms), self.max_delay_ms)
+
+    def _target_frames(self):
+        return max(1, ceil(self.target_delay_ms() / self.frame_ms))
+
+    def depth(self):
+        """已缓冲的帧数（从下一个待播放的序号到收到的最大序号，含尚未到达的空位）"""
+        return 0 if self._highest is None else max(self._highest - self._next_seq + 1, 0)
+
+    def push(self, seq, packet, arrival=None):
+        """
+        放入一个数据包，arrival 为到达时间（time.monotonic() 时基，默认取当前时间）
+
+        返回值:
+            是否被缓冲；已错过播放时间的包与重复包被丢弃并计数
+        """
+        arrival = time.monotonic() if arrival is None else arrival
+        seq = self._extend(seq)
+        self.stats['received'] += 1
+        if self._next_seq is None or (not self._started and seq < self._next_seq):
+            self._next_seq = seq
+        if seq < self._next_seq:
+            self._count('late')
+            return False
+        if seq in self._packets:
+            self._count('duplicate')
+            return False
+        self._update_jitter(seq, arrival)
+        if self._highest is None or seq > self._highest:
+            self._highest = seq
+        else:
+            self.stats['reordered'] += 1
+        self._packets[seq] = (bytes(packet), arrival)
+        overflow = self.depth() - max(1, ceil(self.max_delay_ms / self.frame_ms))
+        if overflow > 0:
+            self._skip(overflow)
+        return True
+
+    def _skip(self, count):
+        for seq in range(self._next_seq, self._next_seq + count):
+            self._packets.pop(seq, None)
+            self._count('dropped')
+        self._next_seq += count
+
+    def end(self):
+        """发送端已结束：不再等待缓冲，pull() 取完剩余的包后返回 None"""
+        self._ended = True
+
+    def pull(self, now=None):
+        """
+        取出下一帧 int16 PCM，应按帧时长的节拍调用
+
+        返回值:
+            PCM 帧；首次缓冲未满或 end() 之后已取完时为 None
+        """
+        now = time.monotonic() if now is None else now
+        if not self._started:
+            if not self._packets:
+                return None
+            # 第一个包等满目标延迟（或已缓冲的帧数超过目标）才开始播放
+            waited = now - min(arrival for _, arrival in self._packets.values())
+            if not self._ended and self.depth() <= self._target_frames() and waited * 1000 < self.target_delay_ms():
+                return None
+            self._started = True
+        if not self._packets:
+            if self._ended:
+                return None
+            # 缓冲区已空：补一帧但不前进序号
+            self.stats['underruns'] += 1
+            self._underrun_frames += 1
+            return self._conceal(None)
+        frame = self._play(now)
+        # 积压超出目标延迟（留 2 帧回差）时丢弃静音帧
+        if (self._packets and self.depth() > self._target_frames() + 2
+                and frame.max(initial=0) < self.quiet_level and frame.min(initial=0) > -self.quiet_level):
+            self._count('dropped')
+            frame = self._play(now)
+        return frame
+
+    def _play(self, now):
+        seq = self._next_seq
+        self._next_seq += 1
+        entry = self._packets.pop(seq, None)
+        while entry is None and self._underrun_frames:
+            # 取空时补出的帧已经代替了这个丢失的包，不再补一次（否则输出多出一帧、延迟永久增加一帧）
+            self._underrun_frames -= 1
+            seq = self._next_seq
+            self._next_seq += 1
+            entry = self._packets.pop(seq, None)
+        self._underrun_frames = 0
+        if entry is None:
+            # 错过播放时间：按丢包补偿，之后再到达的按 late 丢弃
+            following = self._packets.get(seq + 1)
+            return self._conceal(following[0] if following else None)
+        packet, arrival = entry
+        try:
+            frame = self.session.decode_packet(packet)
+        except opuslib_next.OpusError as e:
+            print(f"解码错误: {e}，以丢包补偿代替")
+            following = self._packets.get(seq + 1)
+            return self._conceal(following[0] if following else None)
+        self._count('decoded')
+        self._latency_sum += now - arrival
+        metrics.jitter_delay("added_latency", now - arrival)
+        return frame
+
+    def _conceal(self, next_packet):
+        # 流中没有 FEC 数据时 libopus 对 decode_fec 同样只做 PLC，不能计为 FEC 恢复
+        if self.fec and next_packet is not None:
+            self._count('fec')
+            return self.session.conceal_frame(next_packet)
+        self._count('plc')
+        return self.session.conceal_frame()
+
+    async def frames(self):
+        """按帧时长的节拍逐帧输出 PCM（首次缓冲期间不输出），end() 之后取完即结束"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time()
+        while True:
+            frame = self.pull()
+            if frame is not None:
+                yield frame
+            elif self._ended:
+                return
+            deadline += self.frame_seconds
+            await asyncio.sleep(max(0.0, deadline - loop.time()))
+
+    def get_stats(self):
+        """
+        返回值:
+            dict：各类帧计数，以及 jitter_ms（到达抖动估计）、target_delay_ms（目标延迟）、
+            avg_added_latency_ms（包在缓冲区中的平均等待时间）、depth（当前缓冲帧数）
+        """
+        decoded = self.stats['decoded']
+        return dict(self.stats,
+                    depth=self.depth(),
+                    jitter_ms=round(self._jitter * 1000, 2),
+                    target_delay_ms=round(self.target_delay_ms(), 1),
+                    avg_added_latency_ms=round(self._latency_sum / decoded * 1000, 2) if decoded else None)
+
+    def close(self):
+        self._packets.clear()
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def simulate(seconds=20.0, loss=0.05, jitter_ms=40.0, fec=False, seed=0, options=None, bitrate=24000):
+    """
+    模拟有丢包与抖动的网络：每个包的到达时间 = 发送时间 + 指数分布的排队时延（均值 jitter_ms），
+    按 loss 的概率丢弃；接收端按帧节拍调用 pull()。同时给出不用抖动缓冲、直接丢弃缺失包时的输出时长作对比，
+    以及丢失的包以 None 占位经 opus_to_pcm 补偿后相对完整解码的信噪比（开启 FEC 时应更高）。
+
+    libopus 只在 SILK 码率高于约 18～20kbps（随 packet_loss_perc 变化）时才编码 FEC 数据，
+    码率过低时开启 FEC 没有效果，因此两种情况都固定使用 bitrate。
+    """
+    from audio_format.opus import Opus_Encoder
+
+    opus = Opus_Encoder()
+    rng = np.random.default_rng(seed)
+    frame_ms = opus.opus_frame_time
+    t = np.arange(int(seconds * opus.opus_sample_rate)) / opus.opus_sample_rate
+    pcm = (np.sin(2 * np.pi * 220 * t) * (0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)) * 8000).astype(np.int16)
+
+    # 单独创建编码器，不改动上下文池中编码器的 FEC 设置
+    encoder = opuslib_next.Encoder(opus.opus_sample_rate, opus.opus_channel, "voip")
+    encoder.bitrate = bitrate
+    if fec:
+        encoder.inband_fec = 1
+        encoder.packet_loss_perc = max(1, int(loss * 100))
+    frame_bytes = opus.opus_frame_size * opus.opus_sample_width
+    data = pcm.tobytes()
+    packets = [encoder.encode(data[i:i + frame_bytes].ljust(frame_bytes, b"\x00"), opus.opus_frame_size)
+               for i in range(0, len(data), frame_bytes)]
+
+    arrivals = sorted((seq * frame_ms / 1000 + rng.exponential(jitter_ms / 1000), seq)
+                      for seq in range(len(packets)) if rng.random() >= loss)
+    received = [packets[seq] for _, seq in sorted(arrivals, key=lambda item: item[1])]
+    arrived = {seq for _, seq in arrivals}
+    clean = opus.opus_to_pcm(packets).astype(np.float64)
+    concealed = opus.opus_to_pcm([packet if seq in arrived else None for seq, packet in enumerate(packets)])
+    error = np.sum((concealed.astype(np.float64) - clean) ** 2)
+    conceal_snr_db = 10 * np.log10(np.sum(clean ** 2) / error) if error else float("inf")
+
+    output = 0
+    with opus.open_jitter_buffer(**dict(options or {}, fec=fec)) as buffer:
+        index, tick = 0, 0
+        while True:
+            # 节拍时间按序号计算而不是逐次累加，避免浮点误差让恰好同时到达的包晚一个节拍
+            now = arrivals[0][0] + tick * frame_ms / 1000
+            while index < len(arrivals) and arrivals[index][0] <= now:
+                buffer.push(arrivals[index][1], packets[arrivals[index][1]], arrivals[index][0])
+                index += 1
+            if index == len(arrivals):
+                buffer.end()
+            frame = buffer.pull(now)
+            if frame is None and buffer._ended:
+                break
+            output += 0 if frame is None else len(frame)
+            tick += 1
+        stats = buffer.get_stats()
+    return {
+        'packets': len(packets),
+        'input_ms': len(packets) * frame_ms,
+        'output_ms': output * 1000 // opus.opus_sample_rate,
+        'drop_missing_output_ms': len(opus.opus_to_pcm(received)) * 1000 // opus.opus_sample_rate,
+        'conceal_snr_db': round(float(conceal_snr_db), 1),
+        'stats': stats,
+    }
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='模拟丢包与抖动，评估抖动缓冲区')
+    parser.add_argument('--seconds', type=float, default=20.0, help='模拟音频时长（秒）')
+    parser.add_argument('--loss', type=float, default=0.05, help='丢包率 (默认: 0.05)')
+    parser.add_argument('--jitter-ms', type=float, default=40.0, help='排队时延均值（毫秒，指数分布）')
+    parser.add_argument('--fec', action='store_true', help='编码端开启带内 FEC，抖动缓冲区用其恢复丢包')
+    parser.add_argument('--bitrate', type=int, default=24000, help='编码码率（默认: 24000，过低时 libopus 不编码 FEC）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子')
+
+    args = parser.parse_args()
+    report = simulate(args.seconds, args.loss, args.jitter_ms, args.fec, args.seed, bitrate=args.bitrate)
+    stats = report['stats']
+    print(f"数据包 {report['packets']} 个，输入 {report['input_ms']}ms，输出 {report['output_ms']}ms"
+          f"（直接丢弃缺失包时为 {report['drop_missing_output_ms']}ms），丢包补偿信噪比 {report['conceal_snr_db']}dB")
+    print(f"正常解码 {stats['decoded']}，FEC {stats['fec']}，PLC {stats['plc']}（其中缓冲区取空 {stats['underruns']}），"
+          f"乱序归位 {stats['reordered']}，迟到丢弃 {stats['late']}，积压丢弃 {stats['dropped']}")
+    print(f"到达抖动 {stats['jitter_ms']}ms，目标延迟 {stats['target_delay_ms']}ms，"
+          f"平均增加延迟 {stats['avg_added_latency_ms']}ms")
@@ -1,73 +1,274 @@
+import ctypes
 import os
+import shutil
 import subprocess
+import threading
 import wave
-from pydub import AudioSegment
 import opuslib_next
 import numpy as np
-import pickle  
 from typing import List 
 from utils.util import Util  # 导入 Util 类
+from utils.metrics import metrics
+from audio_format import opus_profile, pcm_loader
+from audio_format.codec_pool import OpusCodecPool
+from audio_format.ffmpeg_pool import FFmpegDecoderPool
+from audio_format.jitter_buffer import OpusJitterBuffer
+from audio_format.opus_buffer import OpusPacketBuffer
+from audio_format.opus_container import OpusContainerReader, save_opus_container
+from audio_format.silence_gate import SilenceGate
+
+class OpusStreamEncoder:
+    """增量 Opus 编码器：缓存不足一帧的 PCM，凑满一帧立即编码"""
+
+    def __init__(self, encoder, sample_rate, channel, sample_width, frame_time, on_close=None):
+        self.encoder = encoder
+        self._on_close = on_close
+        self.sample_rate = sample_rate
+        self.channel = channel
+        self.sample_width = sample_width
+        self.frame_num = int(sample_rate * frame_time / 1000)
+        self.frame_bytes_size = self.frame_num * sample_width * channel
+        self.total_bytes = 0
+        self._pending = bytearray()
+
+    def encode(self, pcm_data) -> List[bytes]:
+        """送入一段 s16le PCM，返回本次凑满的帧编码得到的数据包"""
+        self.total_bytes += len(pcm_data)
+        self._pending += pcm_data
+        packets = []
+        frame_count = len(self._pending) // self.frame_bytes_size
+        for i in range(frame_count):
+            frame = bytes(self._pending[i * self.frame_bytes_size:(i + 1) * self.frame_bytes_size])
+            packets.append(self.encoder.encode(frame, self.frame_num))
+        del self._pending[:frame_count * self.frame_bytes_size]
+        return packets
+
+    def flush(self) -> List[bytes]:
+        """编码剩余不足一帧的数据（用零填充）"""
+        if not self._pending:
+            return []
+        frame = bytes(self._pending) + b'\x00' * (self.frame_bytes_size - len(self._pending))
+        self._pending.clear()
+        return [self.encoder.encode(frame, self.frame_num)]
+
+    def duration_ms(self):
+        """已送入 PCM 的时长（毫秒），由采样数计算"""
+        samples = self.total_bytes // (self.sample_width * self.channel)
+        return samples * 1000 // self.sample_rate
+
+    def close(self):
+        """结束编码，编码器来自上下文池时归还"""
+        if self.encoder is None:
+            return
+        encoder, self.encoder = self.encoder, None
+        self._pending.clear()
+        if self._on_close:
+            self._on_close(encoder)
+
+
+class OpusCodecSession:
+    """
+    一个流式会话的编解码上下文
+
+    首次编码/解码时从 Opus_Encoder 的上下文池租用编码器/解码器，整个会话期间保持
+    编解码状态，分块送入的音频在块边界处连续、无拼接瑕疵；close() 时归还上下文池。
+    """
+
+    def __init__(self, opus):
+        self.opus = opus
+        self.frame_num = opus.opus_frame_size
+        self.frame_bytes_size = self.frame_num * opus.opus_sample_width * opus.opus_channel
+        self._stream_encoder = None
+        self._decoder = None
+        # 单个数据包最长 120ms，解码输出缓冲区按此预分配并复用
+        self._max_frame_size = opus.opus_sample_rate * 120 // 1000
+        self._pcm = None
+        # 补帧默认按最近一个数据包的帧长，对端的帧长可能与本端档位不同
+        self._last_frame_size = self.frame_num
+
+    def _get_stream_encoder(self):
+        if self._stream_encoder is None:
+            self._stream_encoder = self.opus.create_stream_encoder()
+        return self._stream_encoder
+
+    def encode_frame(self, pcm_frame) -> bytes:
+        """编码恰好一帧 s16le PCM，不足一帧用零填充"""
+        if len(pcm_frame) < self.frame_bytes_size:
+            pcm_frame = bytes(pcm_frame) + b'\x00' * (self.frame_bytes_size - len(pcm_frame))
+        stream_encoder = self._get_stream_encoder()
+        stream_encoder.total_bytes += self.frame_bytes_size
+        return stream_encoder.encoder.encode(bytes(pcm_frame), self.frame_num)
+
+    def encode(self, pcm_data) -> List[bytes]:
+        """送入任意长度的 PCM，返回凑满的帧编码得到的数据包"""
+        return self._get_stream_encoder().encode(pcm_data)
+
+    def flush(self) -> List[bytes]:
+        """编码剩余不足一帧的 PCM"""
+        if self._stream_encoder is None:
+            return []
+        return self._stream_encoder.flush()
+
+    def _decode(self, packet, frame_size, fec):
+        if self._decoder is None:
+            self._decoder = self.opus.codec_pool.lease_decoder()
+            self._pcm = np.empty(self._max_frame_size * self.opus.opus_channel, dtype=np.int16)
+        if packet is None:
+            data, length = None, 0
+        elif isinstance(packet, bytes):
+            data, length = packet, len(packet)
+        else:
+            view = np.frombuffer(packet, dtype=np.uint8)
+            data, length = ctypes.c_char_p(view.ctypes.data), len(view)
+        samples = opuslib_next.api.decoder.libopus_decode(
+            self._decoder.decoder_state, data, length,
+            self._pcm.ctypes.data_as(opuslib_next.api.c_int16_pointer), frame_size, fec)
+        if samples < 0:
+            raise opuslib_next.OpusError(samples)
+        if packet is not None and not fec:
+            self._last_frame_size = samples
+        return self._pcm[:samples * self.opus.opus_channel].copy()
+
+    def decode_packet(self, packet) -> np.ndarray:
+        """解码一个数据包，返回 int16 PCM（副本）"""
+        return self._decode(packet, self._max_frame_size, 0)
+
+    def conceal_frame(self, next_packet=None, frame_size=None) -> np.ndarray:
+        """
+        补出一帧丢失的音频（默认帧长为最近解码的数据包的帧长，尚未解码过时为本端档位的帧长）
+
+        给出丢失包之后的数据包时用其带内 FEC 恢复（编码端未开启 FEC 时 libopus 退化为 PLC），
+        否则由解码器根据之前的音频做丢包隐藏（PLC）。next_packet 仍须随后正常解码。
+        """
+        frame_size = frame_size or self._last_frame_size
+        return self._decode(next_packet, frame_size, 1 if next_packet is not None else 0)
+
+    def duration_ms(self):
+        """已编码 PCM 的时长（毫秒）"""
+        return self._stream_encoder.duration_ms() if self._stream_encoder else 0
+
+    def close(self):
+        """结束会话，归还编码器与解码器"""
+        if self._stream_encoder is not None:
+            self._stream_encoder.close()
+            self._stream_encoder = None
+        if self._decoder is not None:
+            decoder, self._decoder = self._decoder, None
+            self._pcm = None
+            self.opus.codec_pool.release_decoder(decoder)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
 
 class Opus_Encoder:
     _instance = None
+    _initialized = False
+    _lock = threading.Lock()
+    # FFmpeg 可正常解码的常见输入格式
+    SUPPORTED_FORMATS = ('.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg', '.wma', '.aiff', '.au', '.mp4')
 
     def __new__(cls,*args, **kwargs):
-        if cls._instance is None:
-            cls._instance = super(Opus_Encoder, cls).__new__(cls)
+        with cls._lock:
+            if cls._instance is None:
+                cls._instance = super(Opus_Encoder, cls).__new__(cls)
         return cls._instance
 
     def __init__(self, ffmpeg_path=None):
+        # 单例：只初始化一次，之后的构造只在显式传入路径时更新 FFmpeg 路径
+        with self._lock:
+            if self._initialized:
+                if ffmpeg_path is not None:
+                    self._set_ffmpeg_path(os.path.abspath(ffmpeg_path))
+                return
+            self._init(ffmpeg_path)
+            self._initialized = True
+
+    def _init(self, ffmpeg_path):
         self.sample_rate = 16000
         self.channel = 1
         self.sample_width = 2
         self.opus_sample_rate = 16000
         self.opus_channel = 1
         self.opus_sample_width = 2
-        self.opus_frame_time = 60
-        self.opus_frame_size = int(self.opus_sample_rate * self.opus_frame_time / 1000)
+        # 编码档位（应用类型、帧时长、码率控制），见 configure()
+        self._apply_profile(opus_profile.PROFILES["default"])
         
+        # 压缩格式的解码进程池，在第一次使用时预启动
+        self.ffmpeg_pool = FFmpegDecoderPool(None, self.sample_rate, self.channel)
+
         # 如果没有提供 ffmpeg 路径，则使用相对路径
         if ffmpeg_path is None:
             # 使用 Util.get_process_dir() 获取项目根目录，然后拼接 FFmpeg 路径
-            self.ffmpeg_path = os.path.join(Util.get_process_dir(), 'ai_core', 'ffmpeg-master-latest-win64-gpl', 'bin', 'ffmpeg.exe')
+            ffmpeg_path = os.path.join(Util.get_process_dir(), 'ai_core', 'ffmpeg-master-latest-win64-gpl', 'bin', 'ffmpeg.exe')
+            if not os.path.exists(ffmpeg_path):
+                # 随项目附带的是 Windows 版本，其他平台使用 PATH 中的 ffmpeg
+                ffmpeg_path = shutil.which("ffmpeg") or ffmpeg_path
+            self._set_ffmpeg_path(ffmpeg_path)
         else:
             # 如果提供的是相对路径，转换为绝对路径
-            self.ffmpeg_path = os.path.abspath(ffmpeg_path)
-        
-        # 设置环境变量，确保能找到 FFmpeg
-        os.environ['PATH'] = os.path.dirname(self.ffmpeg_path) + os.pathsep + os.environ['PATH']
+            self._set_ffmpeg_path(os.path.abspath(ffmpeg_path))
 
-    def convert_to_pcm_with_ffmpeg(self, audio_file_path):
-        """使用 FFmpeg 将音频文件转换为 PCM 格式"""
-        # 验证输入文件是否存在
-        if not os.path.exists(audio_file_path):
-            raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
-        
-        # 使用输入文件的目录创建临时文件，而不是固定路径
-        base_name = os.path.splitext(os.path.basename(audio_file_path))[0]
-        temp_dir = os.path.dirname(audio_file_path) or '.'
-        temp_pcm_path = os.path.join(temp_dir, f"{base_name}_temp.pcm")
-        
-        # 使用 FFmpeg 转换为 PCM
-        cmd = [
+        # 编码器/解码器上下文池，按会话租用
+        self.codec_pool = OpusCodecPool(
+            self._create_encoder,
+            lambda: opuslib_next.Decoder(self.opus_sample_rate, self.opus_channel),
+        )
+
+    def _apply_profile(self, profile):
+        self.profile = profile
+        self.opus_frame_time = profile.frame_ms
+        self.opus_frame_size = int(self.opus_sample_rate * self.opus_frame_time / 1000)
+
+    def configure(self, config=None):
+        """
+        按配置（config["Opus"]）选择编码档位，见 opus_profile.py
+
+        应在创建编码会话之前调用（如服务启动时）；空闲的编码器上下文随之丢弃，
+        仍在使用的编码器保持原档位直到会话结束，归还时丢弃。解码不受档位影响，任意帧长的数据包都能解码。
+        """
+        profile = opus_profile.resolve_profile(config)
+        with self._lock:
+            self._apply_profile(profile)
+        self.codec_pool.clear()
+        return profile
+
+    def _set_ffmpeg_path(self, ffmpeg_path):
+        self.ffmpeg_path = ffmpeg_path
+        self.ffmpeg_pool.set_ffmpeg_path(ffmpeg_path)
+        # 设置环境变量，确保能找到 FFmpeg；目录已在 PATH 中时不再重复添加
+        ffmpeg_dir = os.path.dirname(ffmpeg_path)
+        if ffmpeg_dir not in os.environ.get('PATH', '').split(os.pathsep):
+            os.environ['PATH'] = ffmpeg_dir + os.pathsep + os.environ.get('PATH', '')
+
+    def _ffmpeg_pcm_cmd(self, audio_file_path):
+        """构造将输入文件解码为 s16le PCM 并输出到 stdout 的 FFmpeg 命令"""
+        return [
             self.ffmpeg_path,
+            '-nostdin',
+            '-loglevel', 'error',
             '-i', audio_file_path,  # 输入文件
             '-ar', str(self.sample_rate),  # 采样率
             '-ac', str(self.channel),      # 声道数
             '-f', 's16le',                # 输出格式为 16 位 PCM
-            temp_pcm_path                 # 输出文件
+            'pipe:1'                      # 输出到标准输出，不写临时文件
         ]
-        
+
+    def convert_to_pcm_with_ffmpeg(self, audio_file_path):
+        """使用 FFmpeg 将音频文件转换为 PCM 格式"""
+        # 验证输入文件是否存在
+        if not os.path.exists(audio_file_path):
+            raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
+
         try:
-            subprocess.run(cmd, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-            
-            with open(temp_pcm_path, 'rb') as f:
-                pcm_data = f.read()
-                
-            # 删除临时文件
-            os.remove(temp_pcm_path)
-            
-            return pcm_data
+            with metrics.span("ffmpeg") as span:
+                result = subprocess.run(self._ffmpeg_pcm_cmd(audio_file_path), check=True,
+                                        stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+                span.set_audio_seconds(len(result.stdout) / (self.sample_rate * self.channel * self.sample_width))
+            return result.stdout
         except subprocess.CalledProcessError as e:
             print(f"FFmpeg 转换失败: {e}")
             raise
@@ -75,73 +276,171 @@ class Opus_Encoder:
             print(f"找不到 FFmpeg 可执行文件: {self.ffmpeg_path}")
             raise
 
-    def audio_to_opus(self, audio_file_path):
-        """将音频文件转换为 Opus 格式，支持多种输入格式"""
-        # 验证输入文件是否存在
+    def iter_pcm_with_ffmpeg(self, audio_file_path, chunk_bytes):
+        """从 FFmpeg 的 stdout 管道中按 chunk_bytes 大小逐块读取 PCM 数据，最后一块可能不足"""
         if not os.path.exists(audio_file_path):
             raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
-        
+
+        try:
+            process = subprocess.Popen(self._ffmpeg_pcm_cmd(audio_file_path),
+                                       stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+        except FileNotFoundError:
+            print(f"找不到 FFmpeg 可执行文件: {self.ffmpeg_path}")
+            raise
+
+        try:
+            while True:
+                chunk = process.stdout.read(chunk_bytes)
+                if not chunk:
+                    break
+                yield chunk
+            returncode = process.wait()
+            if returncode != 0:
+                raise subprocess.CalledProcessError(returncode, process.args)
+        finally:
+            # 调用方提前停止迭代时结束子进程，避免残留
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+
+    def iter_pcm(self, audio_file_path, chunk_bytes):
+        """
+        按 chunk_bytes 大小逐块返回 16kHz 单声道 s16le PCM，最后一块可能不足
+
+        先读取文件头判断输入格式：
+            - 已是目标格式的 WAV 与无文件头的 .pcm/.raw：内存映射采样数据，直接切块
+            - 其他整数 / 浮点 WAV：进程内用 NumPy 混音并重采样
+            - 压缩格式：交给预启动的 FFmpeg 解码进程池
+        """
+        if not os.path.exists(audio_file_path):
+            raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
+        info = pcm_loader.probe_wav(audio_file_path)
+        raw = info is None and os.path.splitext(audio_file_path)[1].lower() in pcm_loader.RAW_PCM_EXTENSIONS
+        if raw or pcm_loader.is_native(info, self.sample_rate, self.channel):
+            pcm = pcm_loader.map_native_pcm(audio_file_path, info).view(np.uint8)
+            for offset in range(0, len(pcm), chunk_bytes):
+                yield memoryview(pcm[offset:offset + chunk_bytes])
+        elif pcm_loader.is_supported(info) and self.channel == 1:
+            yield from pcm_loader.rechunk(
+                pcm_loader.iter_converted_pcm(audio_file_path, info, self.sample_rate), chunk_bytes)
+        else:
+            yield from self.ffmpeg_pool.iter_pcm(audio_file_path, chunk_bytes)
+
+    def load_pcm(self, audio_file_path) -> np.ndarray:
+        """
+        读取整个音频文件为 16kHz 单声道 int16 数组
+
+        已是目标格式的 WAV/PCM 返回只读的内存映射数组（不复制），其他输入同 iter_pcm
+        """
+        if not os.path.exists(audio_file_path):
+            raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
+        info = pcm_loader.probe_wav(audio_file_path)
+        raw = info is None and os.path.splitext(audio_file_path)[1].lower() in pcm_loader.RAW_PCM_EXTENSIONS
+        if raw or pcm_loader.is_native(info, self.sample_rate, self.channel):
+            return pcm_loader.map_native_pcm(audio_file_path, info)
+        if pcm_loader.is_supported(info) and self.channel == 1:
+            blocks = list(pcm_loader.iter_converted_pcm(audio_file_path, info, self.sample_rate))
+            return np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.int16)
+        return np.frombuffer(b"".join(self.ffmpeg_pool.iter_pcm(audio_file_path, 1 << 20)), dtype=np.int16)
+
+    def _create_encoder(self):
+        """按当前档位初始化 Opus 编码器"""
+        return opus_profile.create_encoder(self.profile, self.opus_sample_rate, self.opus_channel)
+
+    def _release_encoder(self, encoder):
+        """归还编码器；档位已在使用期间更换时丢弃，不再复用"""
+        if encoder.profile is self.profile:
+            self.codec_pool.release_encoder(encoder)
+        else:
+            self.codec_pool.discard_encoder(encoder)
+
+    def audio_to_opus_stream(self, audio_file_path):
+        """
+        流式将音频文件转换为 Opus 数据包
+
+        经 iter_pcm 按档位的帧长读取 PCM（WAV 在进程内读取，压缩格式经 FFmpeg 解码），每编码一帧立即 yield 一个数据包，
+        内存占用与文件长度无关。生成器结束时的返回值为音频时长（毫秒），
+        由采样数计算得到。
+        """
         # 获取文件扩展名
         _, file_ext = os.path.splitext(audio_file_path)
-        supported_formats = ['.mp3', '.wav', '.flac', '.m4a', '.aac', '.ogg', '.wma', '.aiff', '.au', '.mp4']
-        
-        if file_ext.lower() not in supported_formats:
+        if file_ext.lower() not in self.SUPPORTED_FORMATS:
             print(f"警告: 文件格式 {file_ext} 可能不被完全支持，尝试处理...")
-        
-        # 使用 FFmpeg 转换音频为 PCM
-        raw_data = self.convert_to_pcm_with_ffmpeg(audio_file_path)
-        
-        # 获取音频信息
-        audio = AudioSegment.from_file(audio_file_path)
-        duration = len(audio)
-        print(f"音频总时长: {duration}ms")
-        print(f"音频格式: {file_ext}, 采样率: {audio.frame_rate}Hz, 声道数: {audio.channels}")
 
-        print(f"音频PCM数据大小: {len(raw_data)}字节")
-
-        # 初始化 Opus 编码器
+        stream_encoder = self.create_stream_encoder()
         try:
-            # 尝试使用正确的 API 初始化编码器
-            encoder = opuslib_next.Encoder(
-                self.opus_sample_rate, 
-                self.opus_channel, 
-                opuslib_next.OPUS_APPLICATION_AUDIO
-            )
-        except (TypeError, AttributeError):
-            # 如果上面的初始化方式不正确，尝试其他方式
-            try:
-                # 尝试直接使用整数值代替 Application.AUDIO
-                encoder = opuslib_next.Encoder(
-                    self.opus_sample_rate, 
-                    self.opus_channel, 
-                    2049  # AUDIO 应用类型
-                )
-            except (TypeError, AttributeError):
-                # 如果还是失败，尝试不传入应用类型参数，使用默认值
-                encoder = opuslib_next.Encoder(
-                    self.opus_sample_rate, 
-                    self.opus_channel
-                )
-        
-        frame_num = int(self.opus_sample_rate * self.opus_frame_time / 1000)
-        frame_bytes_size = frame_num * self.opus_sample_width * self.opus_channel
+            for chunk in self.iter_pcm(audio_file_path, stream_encoder.frame_bytes_size):
+                yield from stream_encoder.encode(chunk)
+            yield from stream_encoder.flush()
+            return stream_encoder.duration_ms()
+        finally:
+            stream_encoder.close()
+
+    def create_stream_encoder(self):
+        """
+        创建增量编码器：可分多次送入任意长度的 PCM，按完整帧输出 Opus 数据包
+
+        编码器从上下文池租用，用完须调用 close() 归还
+        """
+        return OpusStreamEncoder(self.codec_pool.lease_encoder(), self.opus_sample_rate,
+                                 self.opus_channel, self.opus_sample_width, self.opus_frame_time,
+                                 on_close=self._release_encoder)
+
+    def open_session(self) -> OpusCodecSession:
+        """打开一个流式编解码会话，会话结束（close 或 with 块退出）时归还上下文"""
+        return OpusCodecSession(self)
 
-        opus_datas = []
+    def open_jitter_buffer(self, **options) -> OpusJitterBuffer:
+        """
+        为一路带序号的实时 Opus 流创建抖动缓冲区（见 jitter_buffer.py），解码器在 close() 时归还
 
-        for i in range(0, len(raw_data), frame_bytes_size):
-            frame = raw_data[i:i + frame_bytes_size]
-            if len(frame) < frame_bytes_size:
-                # 用零填充不足的帧
-                frame += b'\x00' * (frame_bytes_size - len(frame))
+        options 传给 OpusJitterBuffer，如 min_delay_ms、max_delay_ms、jitter_factor、seq_modulo、fec；
+        fec 默认取当前档位的 inband_fec（收发两端使用同一档位）
+        """
+        options.setdefault("fec", bool(self.profile.inband_fec))
+        return OpusJitterBuffer(self.open_session(), frame_ms=self.opus_frame_time, **options)
 
-            # 将字节数据转换为 numpy 数组，然后编码
-            np_frame = np.frombuffer(frame, dtype=np.int16)
-            np_bytes = np_frame.tobytes()
-            opus_data = encoder.encode(np_bytes, frame_num)
-            opus_datas.append(opus_data)
+    def audio_to_opus(self, audio_file_path, as_buffer=False):
+        """
+        将音频文件转换为 Opus 格式，支持多种输入格式
+
+        as_buffer 为 True 时数据包收集到紧凑的 OpusPacketBuffer 中，否则返回 List[bytes]
+        """
+        # 验证输入文件是否存在
+        if not os.path.exists(audio_file_path):
+            raise FileNotFoundError(f"音频文件不存在: {audio_file_path}")
+
+        opus_datas = OpusPacketBuffer() if as_buffer else []
+        stream = self.audio_to_opus_stream(audio_file_path)
+        while True:
+            try:
+                opus_datas.append(next(stream))
+            except StopIteration as e:
+                duration = e.value
+                break
+
+        print(f"音频总时长: {duration}ms")
+        print(f"Opus 数据包数量: {len(opus_datas)}")
 
         return opus_datas, duration
     
+    def audio_to_opus_trimmed(self, audio_file_path, silence_gate=None, as_buffer=False):
+        """
+        先去掉或压缩静音（见 silence_gate.py）再编码，静音帧不再占用数据包
+
+        参数:
+            silence_gate: SilenceGate，默认使用默认参数
+        返回值:
+            (Opus 数据包序列, 裁剪后的时长毫秒, TimestampMap)；TimestampMap 把裁剪后音频上的时间换算回原文件
+        """
+        result = (silence_gate or SilenceGate(sample_rate=self.opus_sample_rate)).trim(self.load_pcm(audio_file_path))
+        opus_datas = OpusPacketBuffer() if as_buffer else []
+        with self.open_session() as session:
+            opus_datas.extend(session.encode(result.pcm.tobytes()))
+            opus_datas.extend(session.flush())
+        return opus_datas, len(result.pcm) * 1000 // self.opus_sample_rate, result.timestamps
+
     def save_opus_to_file(self, opus_data_list, output_path):
         """将 Opus 数据保存到文件"""
         with open(output_path, 'wb') as f:
@@ -156,8 +455,8 @@ class Opus_Encoder:
                 f.write(len(frame).to_bytes(4, byteorder='big'))  # 写入帧长度
                 f.write(frame)
 
-    def load_opus_raw_custom(self, input_path):
-        frames = []
+    def load_opus_raw_custom(self, input_path, as_buffer=False):
+        frames = OpusPacketBuffer() if as_buffer else []
         with open(input_path, 'rb') as f:
             data = f.read()
             index = 0
@@ -169,37 +468,112 @@ class Opus_Encoder:
                 index += frame_length
         return frames
     
-    def save_opus_raw(self, opus_data_list, output_path):
-        """将原始 Opus 数据保存到文件"""
-        with open(output_path, 'wb') as f:
-            pickle.dump(opus_data_list, f)
+    def save_opus_container(self, opus_datas, output_path):
+        """将 Opus 数据包保存为带索引的容器文件（见 opus_container.py）"""
+        return save_opus_container(opus_datas, output_path, self.opus_sample_rate,
+                                   self.opus_channel, self.opus_frame_time)
 
-    def load_opus_raw(self, input_path):
-        """从文件加载原始 Opus 数据"""
-        with open(input_path, 'rb') as f:
-            opus_data_list = pickle.load(f)
-        return opus_data_list
+    def load_opus_container(self, input_path) -> OpusContainerReader:
+        """以 mmap 方式打开容器文件，数据包以零拷贝 memoryview 访问，可按时间 O(1) 定位"""
+        return OpusContainerReader(input_path)
 
-    def opus_to_wav_file(self,output_file, opus_data : List[bytes] ) -> str:
-        #output_file = "test.wav"
-        decoder = opuslib_next.Decoder(self.opus_sample_rate, self.opus_channel)
-        pcm_data = []
-        for frame in opus_data:
-            try:
-                pcm_frame = decoder.decode(frame, self.opus_frame_size )
-                pcm_data.append(pcm_frame)
-            except opuslib_next.OpusError as e:
-                print(f"解码错误: {e}")
-        
+    @staticmethod
+    def _iter_packet_pointers(opus_data):
+        """
+        逐个返回 (数据指针, 长度)，供 libopus 直接读取，不复制数据包；None（丢失的包）返回 (None, 0)
+
+        bytes 直接交给 ctypes；OpusPacketBuffer 只取一次底层地址再按偏移计算；
+        其他缓冲区（如容器 mmap 中的只读 memoryview）通过 numpy 取得地址。
+        """
+        if isinstance(opus_data, OpusPacketBuffer):
+            payload = np.frombuffer(opus_data.payload, dtype=np.uint8)
+            base = payload.ctypes.data
+            offsets = opus_data.offsets
+            for i in range(len(offsets) - 1):
+                yield ctypes.c_char_p(base + offsets[i]), offsets[i + 1] - offsets[i]
+            del payload
+            return
+        for packet in opus_data:
+            if packet is None:
+                yield None, 0
+            elif isinstance(packet, bytes):
+                yield packet, len(packet)
+            else:
+                view = np.frombuffer(packet, dtype=np.uint8)
+                yield ctypes.c_char_p(view.ctypes.data), len(view)
+
+    def opus_to_pcm(self, opus_data) -> np.ndarray:
+        """
+        将 Opus 数据包解码为一段连续的 int16 PCM 缓冲区（不落盘）
+
+        opus_data 可以是 List[bytes]、OpusPacketBuffer 或容器读取器，
+        libopus 直接读取数据包内存并把 PCM 写入预分配的 numpy 数组，全程无中间拷贝。
+        列表中的 None 表示丢失的包，与无法解码的包一样用 FEC/PLC 补出一帧。
+        """
+        decoder = self.codec_pool.lease_decoder()
+        try:
+            return self._decode_all(decoder, opus_data)
+        finally:
+            self.codec_pool.release_decoder(decoder)
+
+    def _decode_all(self, decoder, opus_data) -> np.ndarray:
+        """
+        逐包解码到预分配的缓冲区
+
+        无法解码的包、空包与 None（已知丢失）不跳过，而是补出一帧：下一个包带 FEC 时用其恢复，
+        否则做丢包隐藏（PLC），输出时长与数据包数一致，后续的时间戳不会前移。
+        """
+        # 单个数据包最长 120ms
+        max_frame_size = self.opus_sample_rate * 120 // 1000
+        decode = opuslib_next.api.decoder.libopus_decode
+        # 按帧数预分配连续缓冲区，逐帧直接解码到其中
+        pcm = np.empty(len(opus_data) * self.opus_frame_size * self.opus_channel, dtype=np.int16)
+        offset = 0
+        # 补帧的帧长取最近一个正常解码的数据包，数据可能来自其他档位
+        frame_size = self.opus_frame_size
+        packets = self._iter_packet_pointers(opus_data)
+        current = next(packets, None)
+        while current is not None:
+            packet, length = current
+            following = next(packets, None)
+            if len(pcm) - offset < max_frame_size * self.opus_channel:
+                # 数据包帧长大于预期时扩容
+                pcm = np.concatenate([pcm[:offset], np.empty(len(pcm) + max_frame_size * self.opus_channel, dtype=np.int16)])
+            out = pcm[offset:].ctypes.data_as(opuslib_next.api.c_int16_pointer)
+            samples = decode(decoder.decoder_state, packet, length, out, max_frame_size, 0) if length else -1
+            if samples < 0:
+                if length:
+                    print(f"解码错误: {opuslib_next.OpusError(samples)}，以丢包补偿代替")
+                if following is not None and following[1]:
+                    samples = decode(decoder.decoder_state, following[0], following[1], out, frame_size, 1)
+                else:
+                    samples = decode(decoder.decoder_state, None, 0, out, frame_size, 0)
+                if samples < 0:
+                    samples = frame_size
+                    pcm[offset:offset + samples * self.opus_channel] = 0
+            elif samples:
+                frame_size = samples
+            offset += samples * self.opus_channel
+            current = following
+        return pcm[:offset]
+
+    def pcm_to_wav_file(self, output_file, pcm: np.ndarray) -> str:
+        """将 int16 PCM 缓冲区写入 WAV 文件"""
         with wave.open(output_file, 'wb') as wav_file:
             wav_file.setnchannels(self.opus_channel)
             wav_file.setsampwidth(self.opus_sample_width)
             wav_file.setframerate(self.opus_sample_rate)
-            #print(f"PCM 数据: {pcm_data}")
-            #print(b''.join(pcm_data))
-            wav_file.writeframes(b''.join(pcm_data))
+            wav_file.writeframes(pcm.tobytes())
         return output_file
 
+    def opus_to_wav_file(self,output_file, opus_data : List[bytes] ) -> str:
+        #output_file = "test.wav"
+        return self.pcm_to_wav_file(output_file, self.opus_to_pcm(opus_data))
+
+
+if hasattr(os, "register_at_fork"):
+    # fork 时若其他线程正持有单例锁，子进程中的这把锁永远不会被释放（如 ASR 推理进程读取文件时）
+    os.register_at_fork(after_in_child=lambda: setattr(Opus_Encoder, "_lock", threading.Lock()))
 
 
 if __name__ == "__main__":
@@ -226,8 +600,8 @@ if __name__ == "__main__":
     print(opus_data)
     print("\n")
 
-    opus.save_opus_raw(opus_data, "test.opus")
-    opus_data = opus.load_opus_raw("test.opus")
+    opus.save_opus_container(opus_data, "test.cyop")
+    opus_data = list(opus.load_opus_container("test.cyop"))
 
     print("变换 Opus 数据包示例:")
     print(opus_data)
@@ -0,0 +1,104 @@
+from array import array
+
+
+class OpusPacketBuffer:
+    """
+    紧凑的 Opus 数据包序列
+
+    所有数据包首尾相接存放在一个可增长的 bytearray 中，另用 array('I') 记录边界偏移，
+    每个会话只有两个 Python 对象，代替成百上千个小 bytes 对象，降低内存开销与 GC 压力。
+    索引、迭代返回指向内部存储的 memoryview（零拷贝）；持有这些 memoryview 期间
+    bytearray 不能扩容，append 会抛出 BufferError，需要长期保存的数据包请用 bytes() 复制。
+    """
+
+    __slots__ = ('_data', '_offsets')
+
+    def __init__(self, packets=None):
+        self._data = bytearray()
+        self._offsets = array('I', [0])
+        if packets is not None:
+            self.extend(packets)
+
+    @classmethod
+    def from_payload(cls, payload, offsets):
+        """由连续的数据区与边界偏移（长度为数据包数 + 1，首项为 0）构造，仅复制一次数据区"""
+        buffer = cls()
+        buffer._data = bytearray(payload)
+        buffer._offsets = array('I', offsets)
+        return buffer
+
+    def append(self, packet):
+        """追加一个数据包（任意支持缓冲区协议的对象）"""
+        self._data += packet
+        self._offsets.append(len(self._data))
+
+    def extend(self, packets):
+        if isinstance(packets, OpusPacketBuffer):
+            base = len(self._data)
+            self._data += packets._data
+            self._offsets.extend(base + offset for offset in packets._offsets[1:])
+            return
+        for packet in packets:
+            self.append(packet)
+
+    def clear(self):
+        self._data.clear()
+        self._offsets = array('I', [0])
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            start, stop, step = item.indices(len(self))
+            if step == 1:
+                stop = max(start, stop)
+                base = self._offsets[start]
+                return OpusPacketBuffer.from_payload(
+                    memoryview(self._data)[base:self._offsets[stop]],
+                    [offset - base for offset in self._offsets[start:stop + 1]],
+                )
+            return OpusPacketBuffer(self[i] for i in range(start, stop, step))
+        if item < 0:
+            item += len(self)
+        if not 0 <= item < len(self):
+            raise IndexError("数据包索引越界")
+        return memoryview(self._data)[self._offsets[item]:self._offsets[item + 1]]
+
+    def __iter__(self):
+        view = memoryview(self._data)
+        offsets = self._offsets
+        for i in range(len(offsets) - 1):
+            yield view[offsets[i]:offsets[i + 1]]
+
+    def __bytes__(self):
+        """全部数据包的连续字节（复制一份）"""
+        return bytes(self._data)
+
+    @property
+    def payload(self) -> memoryview:
+        """全部数据包的连续字节（零拷贝）；本类不实现缓冲区协议，需要 memoryview 时用此属性"""
+        return memoryview(self._data)
+
+    @property
+    def offsets(self) -> array:
+        """数据包边界偏移，第 i 个包为 payload[offsets[i]:offsets[i + 1]]"""
+        return self._offsets
+
+    @property
+    def nbytes(self):
+        return len(self._data)
+
+    def tolist(self):
+        """转换为兼容旧接口的 List[bytes]"""
+        view = memoryview(self._data)
+        offsets = self._offsets
+        return [bytes(view[offsets[i]:offsets[i + 1]]) for i in range(len(offsets) - 1)]
+
+    def __eq__(self, other):
+        if isinstance(other, OpusPacketBuffer):
+            return self._data == other._data and self._offsets == other._offsets
+        return NotImplemented
+
+    def __repr__(self):
+        return f"OpusPacketBuffer(packets={len(self)}, bytes={len(self._data)})"
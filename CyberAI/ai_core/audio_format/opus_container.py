@@ -0,0 +1,278 @@
+"""
+带索引的 Opus 数据包容器
+
+文件布局（小端）:
+    头部 32 字节: magic "CYOP" | 版本 u16 | 声道数 u16 | 采样率 u32 | 帧时长(微秒) u32 |
+                 数据包数 u32 | 索引偏移 u64 | 保留 4 字节
+    数据区: 所有 Opus 数据包首尾相接
+    索引区（8 字节对齐）: 数据包数 + 1 个 u64 文件偏移，第 i 个包为 [offset[i], offset[i+1])
+
+读取时通过 mmap 映射文件，数据包以零拷贝的 memoryview 返回，按时间定位为 O(1)。
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from audio_format.opus_buffer import OpusPacketBuffer
+
+MAGIC = b"CYOP"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIQ4x")
+
+
+class OpusContainerWriter:
+    """
+    流式追加写入容器，close() 时写入索引并回填头部
+
+    数据先写入临时文件，close() 成功后才替换为 output_path；
+    with 块内出现异常或调用 abort() 时删除临时文件，不会留下看似有效的半截输出。
+    """
+
+    def __init__(self, output_path, sample_rate=16000, channels=1, frame_duration_ms=60):
+        self.output_path = output_path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frame_duration_us = int(round(frame_duration_ms * 1000))
+        self._temp_path = f"{output_path}.{os.getpid()}.tmp"
+        self._file = open(self._temp_path, 'wb')
+        # 头部先写占位，packet_count 为 0 表示文件未写完
+        self._file.write(HEADER.pack(MAGIC, VERSION, channels, sample_rate, self.frame_duration_us, 0, 0))
+        self._offsets = array('Q', [HEADER.size])
+
+    def append(self, packet):
+        """追加一个数据包（bytes、bytearray 或 memoryview）"""
+        self._file.write(packet)
+        self._offsets.append(self._offsets[-1] + len(packet))
+
+    def extend(self, packets):
+        if isinstance(packets, OpusPacketBuffer):
+            # 数据区整体写入一次，偏移直接平移
+            base = self._offsets[-1]
+            self._file.write(packets.payload)
+            self._offsets.extend(base + offset for offset in packets.offsets[1:])
+            return
+        for packet in packets:
+            self.append(packet)
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def close(self):
+        if self._file is None:
+            return
+        end = self._offsets[-1]
+        padding = (-end) % 8
+        self._file.write(b'\x00' * padding)
+        index_offset = end + padding
+        offsets = self._offsets
+        if sys.byteorder != 'little':
+            offsets = array('Q', offsets)
+            offsets.byteswap()
+        self._file.write(offsets.tobytes())
+        self._file.seek(0)
+        self._file.write(HEADER.pack(MAGIC, VERSION, self.channels, self.sample_rate,
+                                     self.frame_duration_us, len(self), index_offset))
+        self._file.close()
+        self._file = None
+        os.replace(self._temp_path, self.output_path)
+
+    def abort(self):
+        """放弃写入：关闭并删除临时文件，output_path 保持不变"""
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        try:
+            os.remove(self._temp_path)
+        except OSError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+
+class OpusContainerReader:
+    """
+    通过 mmap 读取容器
+
+    packet(i)、迭代与切片返回的都是指向映射内存的 memoryview，不复制数据。
+    这些 memoryview 仍被引用时映射不会真正关闭。
+    """
+
+    def __init__(self, input_path):
+        self.input_path = input_path
+        with open(input_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < HEADER.size:
+                raise ValueError(f"不是有效的 Opus 容器文件: {input_path}")
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, channels, sample_rate, frame_duration_us, packet_count, index_offset = \
+            HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self._mmap.close()
+            raise ValueError(f"不是有效的 Opus 容器文件: {input_path}")
+        if version != VERSION:
+            self._mmap.close()
+            raise ValueError(f"不支持的容器版本: {version}")
+        if index_offset == 0:
+            self._mmap.close()
+            raise ValueError(f"容器文件未正常关闭（缺少索引）: {input_path}")
+        if index_offset % 8 or index_offset + 8 * (packet_count + 1) > size:
+            self._mmap.close()
+            raise ValueError(f"容器文件索引越界（文件可能被截断）: {input_path}")
+
+        self.version = version
+        self.channels = channels
+        self.sample_rate = sample_rate
+        self.frame_duration_us = frame_duration_us
+        self.frame_duration_ms = frame_duration_us / 1000
+        self.packet_count = packet_count
+
+        self._view = memoryview(self._mmap)
+        index_bytes = self._view[index_offset:index_offset + 8 * (packet_count + 1)]
+        if sys.byteorder == 'little':
+            self._index = index_bytes.cast('Q')
+        else:
+            self._index = array('Q', index_bytes)
+            self._index.byteswap()
+        if self._index[0] != HEADER.size or self._index[packet_count] > index_offset:
+            self.close()
+            raise ValueError(f"容器文件索引与数据区不一致: {input_path}")
+
+    @property
+    def duration_ms(self):
+        return self.packet_count * self.frame_duration_us / 1000
+
+    def __len__(self):
+        return self.packet_count
+
+    def packet(self, i) -> memoryview:
+        """返回第 i 个数据包（零拷贝）"""
+        if i < 0:
+            i += self.packet_count
+        if not 0 <= i < self.packet_count:
+            raise IndexError("数据包索引越界")
+        return self._view[self._index[i]:self._index[i + 1]]
+
+    def __getitem__(self, item):
+        if isinstance(item, slice):
+            return [self.packet(i) for i in range(*item.indices(self.packet_count))]
+        return self.packet(item)
+
+    def __iter__(self):
+        index = self._index
+        view = self._view
+        for i in range(self.packet_count):
+            yield view[index[i]:index[i + 1]]
+
+    def index_at_time(self, time_ms):
+        """时间（毫秒）对应的数据包序号，O(1)"""
+        i = int(time_ms * 1000 // self.frame_duration_us)
+        return min(max(i, 0), self.packet_count)
+
+    def iter_from_time(self, time_ms):
+        """从指定时间开始迭代数据包"""
+        for i in range(self.index_at_time(time_ms), self.packet_count):
+            yield self.packet(i)
+
+    def payload(self, start=0, end=None) -> memoryview:
+        """数据包 [start, end) 在文件中连续存放的原始字节（零拷贝）"""
+        end = self.packet_count if end is None else end
+        return self._view[self._index[start]:self._index[end]]
+
+    def offsets(self, start=0, end=None):
+        """数据包 [start, end] 的边界偏移（相对 payload(start, end) 起点）"""
+        end = self.packet_count if end is None else end
+        base = self._index[start]
+        return [self._index[i] - base for i in range(start, end + 1)]
+
+    def to_buffer(self, start=0, end=None):
+        """将数据包 [start, end) 复制为一个 OpusPacketBuffer（数据区整体复制一次）"""
+        return OpusPacketBuffer.from_payload(self.payload(start, end), self.offsets(start, end))
+
+    def close(self):
+        if self._mmap is None:
+            return
+        if isinstance(self._index, memoryview):
+            self._index.release()
+        self._view.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            # 仍有调用方持有数据包 memoryview，映射在其释放后由 GC 回收
+            pass
+        self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def save_opus_container(opus_datas, output_path, sample_rate=16000, channels=1, frame_duration_ms=60):
+    """将数据包序列写入容器文件"""
+    with OpusContainerWriter(output_path, sample_rate, channels, frame_duration_ms) as writer:
+        writer.extend(opus_datas)
+    return output_path
+
+
+def convert_custom_to_container(input_path, output_path, sample_rate=16000, channels=1, frame_duration_ms=60):
+    """
+    将 save_opus_raw_custom 写出的 4 字节长度前缀格式转换为容器格式（流式读取，不整体载入内存）
+
+    返回值:
+        转换的数据包数量
+    """
+    with open(input_path, 'rb') as f, \
+            OpusContainerWriter(output_path, sample_rate, channels, frame_duration_ms) as writer:
+        while True:
+            length_bytes = f.read(4)
+            if not length_bytes:
+                break
+            if len(length_bytes) < 4:
+                raise ValueError(f"文件在帧长度处截断: {input_path}")
+            frame_length = int.from_bytes(length_bytes, byteorder='big')
+            frame = f.read(frame_length)
+            if len(frame) < frame_length:
+                raise ValueError(f"文件在帧数据处截断: {input_path}")
+            writer.append(frame)
+        return len(writer)
+
+
+# 命令行支持
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Opus 容器工具')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    convert_parser = subparsers.add_parser('convert', help='将长度前缀格式转换为容器格式')
+    convert_parser.add_argument('input', type=str, help='save_opus_raw_custom 写出的文件')
+    convert_parser.add_argument('output', type=str, help='输出容器文件')
+    convert_parser.add_argument('--sample-rate', type=int, default=16000, help='采样率 (默认: 16000)')
+    convert_parser.add_argument('--channels', type=int, default=1, help='声道数 (默认: 1)')
+    convert_parser.add_argument('--frame-ms', type=float, default=60, help='帧时长毫秒 (默认: 60)')
+
+    info_parser = subparsers.add_parser('info', help='显示容器信息')
+    info_parser.add_argument('input', type=str, help='容器文件')
+
+    args = parser.parse_args()
+
+    if args.command == 'convert':
+        count = convert_custom_to_container(args.input, args.output, args.sample_rate, args.channels, args.frame_ms)
+        print(f"转换完成，共 {count} 个 Opus 数据包: {args.output}")
+    else:
+        with OpusContainerReader(args.input) as reader:
+            print(f"采样率: {reader.sample_rate}Hz, 声道数: {reader.channels}, "
+                  f"帧时长: {reader.frame_duration_ms}ms, 数据包数: {len(reader)}, 时长: {reader.duration_ms:.0f}ms")
@@ -0,0 +1,106 @@
+"""
+Opus 编码档位
+
+一个档位确定编码器的应用类型、帧时长与码率控制参数，由配置 Opus.profile 选择:
+    default           AUDIO、60ms 帧，其余为 libopus 默认值（与未配置时一致）
+    voip-low-latency  VOIP、20ms 帧、20kbps VBR、DTX（静音只发 1 字节的包）、带内 FEC
+    archive           AUDIO、60ms 帧、32kbps 无约束 VBR、复杂度 10，用于存档与缓存
+
+Opus.profiles 中可覆盖内置档位的参数或定义新档位（base 指定继承的档位，默认 default）。
+参数为 None 时保留 libopus 默认值。采样率与声道数固定为 Opus_Encoder 的 16kHz 单声道。
+"""
+
+from collections import namedtuple
+
+import opuslib_next
+
+APPLICATIONS = dict(opuslib_next.APPLICATION_TYPES_MAP)
+SIGNALS = {'auto': opuslib_next.AUTO, 'voice': opuslib_next.SIGNAL_VOICE, 'music': opuslib_next.SIGNAL_MUSIC}
+# 数据包帧时长（毫秒），2.5/5ms 只能用 CELT 模式，不适合语音
+FRAME_TIMES = (10, 20, 40, 60)
+
+OpusProfile = namedtuple(
+    "OpusProfile",
+    "name application frame_ms bitrate complexity vbr vbr_constraint dtx inband_fec packet_loss_perc signal")
+
+_UNSET = dict(bitrate=None, complexity=None, vbr=None, vbr_constraint=None, dtx=None,
+              inband_fec=None, packet_loss_perc=None, signal=None)
+
+PROFILES = {
+    'default': OpusProfile(name="default", application="audio", frame_ms=60, **_UNSET),
+    # libopus 只在 SILK 码率高于约 18～20kbps（随 packet_loss_perc 变化）时才编码 FEC 数据，16kbps 时 FEC 不起作用
+    'voip-low-latency': OpusProfile(**dict(
+        _UNSET, name="voip-low-latency", application="voip", frame_ms=20, bitrate=20000, complexity=5,
+        vbr=True, dtx=True, inband_fec=True, packet_loss_perc=10, signal="voice")),
+    'archive': OpusProfile(**dict(
+        _UNSET, name="archive", application="audio", frame_ms=60, bitrate=32000, complexity=10,
+        vbr=True, vbr_constraint=False)),
+}
+
+
+def _validate(profile):
+    if profile.application not in APPLICATIONS:
+        raise ValueError(f"Opus 档位 {profile.name}: application 须为 {', '.join(APPLICATIONS)}")
+    if profile.frame_ms not in FRAME_TIMES:
+        raise ValueError(f"Opus 档位 {profile.name}: frame_ms 须为 {FRAME_TIMES} 之一")
+    if profile.bitrate is not None and not 500 <= profile.bitrate <= 512000:
+        raise ValueError(f"Opus 档位 {profile.name}: bitrate 须在 500～512000 之间")
+    if profile.complexity is not None and not 0 <= profile.complexity <= 10:
+        raise ValueError(f"Opus 档位 {profile.name}: complexity 须在 0～10 之间")
+    if profile.packet_loss_perc is not None and not 0 <= profile.packet_loss_perc <= 100:
+        raise ValueError(f"Opus 档位 {profile.name}: packet_loss_perc 须在 0～100 之间")
+    if profile.signal is not None and profile.signal not in SIGNALS:
+        raise ValueError(f"Opus 档位 {profile.name}: signal 须为 {', '.join(SIGNALS)}")
+    return profile
+
+
+def load_profiles(config=None):
+    """内置档位合并配置中 Opus.profiles 的覆盖与新增，返回 {名称: OpusProfile}"""
+    config = config or {}
+    profiles = dict(PROFILES)
+    for name, overrides in (config.get("profiles") or {}).items():
+        overrides = dict(overrides or {})
+        base = profiles.get(overrides.pop("base", name)) or profiles["default"]
+        unknown = set(overrides) - set(OpusProfile._fields)
+        if unknown:
+            raise ValueError(f"Opus 档位 {name}: 未知参数 {', '.join(sorted(unknown))}")
+        profiles[name] = _validate(base._replace(name=name, **overrides))
+    return profiles
+
+
+def resolve_profile(config=None):
+    """按配置（config["Opus"]）返回所选档位，未配置时为 default"""
+    config = config or {}
+    name = config.get("profile") or "default"
+    profiles = load_profiles(config)
+    if name not in profiles:
+        raise ValueError(f"未知的 Opus 档位: {name}（可选 {', '.join(profiles)}）")
+    return profiles[name]
+
+
+def create_encoder(profile, sample_rate, channels):
+    """按档位创建编码器并设置参数，编码器的 profile 属性记录所用档位"""
+    encoder = opuslib_next.Encoder(sample_rate, channels, APPLICATIONS[profile.application])
+    if profile.bitrate is not None:
+        encoder.bitrate = int(profile.bitrate)
+    if profile.complexity is not None:
+        encoder.complexity = int(profile.complexity)
+    if profile.vbr is not None:
+        encoder.vbr = int(bool(profile.vbr))
+    if profile.vbr_constraint is not None:
+        encoder.vbr_constraint = int(bool(profile.vbr_constraint))
+    if profile.dtx is not None:
+        encoder.dtx = int(bool(profile.dtx))
+    if profile.inband_fec is not None:
+        encoder.inband_fec = int(bool(profile.inband_fec))
+    if profile.packet_loss_perc is not None:
+        encoder.packet_loss_perc = int(profile.packet_loss_perc)
+    if profile.signal is not None:
+        encoder.signal = SIGNALS[profile.signal]
+    encoder.profile = profile
+    return encoder
+
+
+def algorithmic_delay_ms(encoder, sample_rate):
+    """编码端算法延迟：一帧的缓冲时长加编码器前瞻（lookahead）"""
+    return encoder.profile.frame_ms + encoder.lookahead * 1000 / sample_rate
@@ -0,0 +1,201 @@
+import os
+import struct
+from collections import namedtuple
+from math import ceil, gcd
+
+import numpy as np
+
+WAVE_FORMAT_PCM = 0x0001
+WAVE_FORMAT_IEEE_FLOAT = 0x0003
+WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+# 无文件头的 PCM 文件按目标格式（16kHz 单声道 s16le）读取
+RAW_PCM_EXTENSIONS = ('.pcm', '.raw')
+
+WavInfo = namedtuple("WavInfo", "format_tag channels sample_rate bits_per_sample block_align data_offset frames")
+
+
+def probe_wav(path):
+    """
+    读取 WAV 文件头（RIFF fmt/data 块），不读取采样数据
+
+    返回值:
+        WavInfo；不是 WAV 文件或文件头不完整时返回 None。
+        WAVE_FORMAT_EXTENSIBLE 按子格式归为 PCM 或 IEEE_FLOAT；data 块长度缺失或超出文件（流式写出的 WAV）时按文件大小计算。
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        header = f.read(12)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            return None
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                return None
+            chunk_id, size = struct.unpack("<4sI", chunk)
+            if chunk_id == b"fmt ":
+                data = f.read(size)
+                if len(data) < 16:
+                    return None
+                format_tag, channels, sample_rate, _, block_align, bits = struct.unpack("<HHIIHH", data[:16])
+                if format_tag == WAVE_FORMAT_EXTENSIBLE and len(data) >= 26:
+                    format_tag = struct.unpack("<H", data[24:26])[0]
+                fmt = (format_tag, channels, sample_rate, bits, block_align)
+                if size & 1:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b"data":
+                if fmt is None or not fmt[4]:
+                    return None
+                offset = f.tell()
+                size = min(size, file_size - offset) if size else file_size - offset
+                format_tag, channels, sample_rate, bits, block_align = fmt
+                return WavInfo(format_tag, channels, sample_rate, bits, block_align, offset, size // block_align)
+            else:
+                f.seek(size + (size & 1), os.SEEK_CUR)
+
+
+def is_supported(info):
+    """能否在进程内转换：整数 PCM（8/16/24/32 位）或浮点（32/64 位）"""
+    if info is None or info.channels < 1 or info.sample_rate < 1:
+        return False
+    if info.format_tag == WAVE_FORMAT_PCM:
+        return info.bits_per_sample in (8, 16, 24, 32) and info.block_align == info.channels * info.bits_per_sample // 8
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        return info.bits_per_sample in (32, 64) and info.block_align == info.channels * info.bits_per_sample // 8
+    return False
+
+
+def is_native(info, sample_rate=16000, channels=1):
+    """采样数据已经是目标格式（s16le、目标采样率与声道数），可直接映射"""
+    return (info is not None and info.format_tag == WAVE_FORMAT_PCM and info.bits_per_sample == 16
+            and info.sample_rate == sample_rate and info.channels == channels)
+
+
+def map_samples(path, info):
+    """以只读内存映射打开采样数据，返回 (frames, channels) 数组（24 位为 (frames, channels, 3) 的 uint8）"""
+    if info.frames == 0:
+        return np.zeros((0, info.channels), dtype=np.int16)
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        dtype = np.dtype("<f4") if info.bits_per_sample == 32 else np.dtype("<f8")
+    elif info.bits_per_sample == 24:
+        return np.memmap(path, dtype=np.uint8, mode="r", offset=info.data_offset,
+                         shape=(info.frames, info.channels, 3))
+    else:
+        dtype = {8: np.dtype(np.uint8), 16: np.dtype("<i2"), 32: np.dtype("<i4")}[info.bits_per_sample]
+    return np.memmap(path, dtype=dtype, mode="r", offset=info.data_offset, shape=(info.frames, info.channels))
+
+
+def map_native_pcm(path, info=None):
+    """
+    目标格式的 PCM 直接内存映射为 int16 数组（只读、零拷贝）
+
+    info 为 None 时按无文件头的 s16le 处理
+    """
+    offset = info.data_offset if info is not None else 0
+    frames = info.frames if info is not None else (os.path.getsize(path) - offset) // 2
+    if frames == 0:
+        return np.zeros(0, dtype=np.int16)
+    return np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(frames,))
+
+
+def to_float_mono(frames, info):
+    """一段采样数据转为 [-1, 1] 区间的单声道 float32（多声道取平均）"""
+    if info.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+        samples = np.asarray(frames, dtype=np.float32)
+    elif info.bits_per_sample == 8:
+        samples = (np.asarray(frames, dtype=np.float32) - 128.0) / 128.0
+    elif info.bits_per_sample == 24:
+        raw = np.asarray(frames, dtype=np.int32)
+        samples = ((raw[..., 0] | (raw[..., 1] << 8) | (raw[..., 2] << 16)) << 8 >> 8).astype(np.float32) / 8388608.0
+    else:
+        samples = np.asarray(frames, dtype=np.float32) / float(1 << (info.bits_per_sample - 1))
+    return samples.mean(axis=1) if samples.shape[1] > 1 else samples[:, 0]
+
+
+class Resampler:
+    """
+    多相加窗 sinc 重采样（纯 NumPy，向量化）
+
+    src_rate/dst_rate 约分为 up/down 后，输出第 k 点对应输入位置 k*down/up，其小数部分只有 up 种，
+    每种相位的滤波器系数预先算好；截止频率取两者中较低的奈奎斯特频率（留 5% 余量）以抑制混叠。
+    process() 对任意输出区间计算结果，输入从 samples(start, stop) 回调按需读取，可对内存映射的长文件分块处理。
+    """
+
+    def __init__(self, src_rate, dst_rate, zero_crossings=8, rolloff=0.95):
+        divisor = gcd(src_rate, dst_rate)
+        self.up = dst_rate // divisor
+        self.down = src_rate // divisor
+        cutoff = min(1.0, dst_rate / src_rate) * rolloff
+        self.half_width = int(ceil(zero_crossings / cutoff))
+        self.offsets = np.arange(-self.half_width + 1, self.half_width + 1)
+        # taps[tap, phase]：相位 phase/up 处第 tap 个输入点的权重
+        distance = self.offsets[:, None] - (np.arange(self.up) / self.up)[None, :]
+        window = 0.5 + 0.5 * np.cos(np.pi * np.clip(distance / self.half_width, -1, 1))
+        self.taps = np.ascontiguousarray(cutoff * np.sinc(cutoff * distance) * window, dtype=np.float32)
+
+    def output_length(self, input_length):
+        return (input_length * self.up + self.down - 1) // self.down
+
+    def process(self, samples, input_length, start, stop):
+        """
+        计算输出区间 [start, stop) 的采样
+
+        参数:
+            samples: samples(a, b) 返回输入 [a, b) 区间的 float32 单声道数组
+            input_length: 输入总采样数，区间外按 0 处理
+        """
+        k = np.arange(start, stop, dtype=np.int64)
+        base = k * self.down // self.up
+        phase = k * self.down % self.up
+        first = max(int(base[0]) + self.offsets[0], 0) if len(k) else 0
+        last = min(int(base[-1]) + self.offsets[-1] + 1, input_length) if len(k) else 0
+        window = np.zeros(0, dtype=np.float32) if last <= first else samples(first, last)
+        # 两端各补零，越界的输入点取到 0
+        padded = np.concatenate([np.zeros(1, dtype=np.float32), window, np.zeros(1, dtype=np.float32)])
+        position = base - first + 1
+        out = np.zeros(len(k), dtype=np.float32)
+        # 按抽头循环、每次处理整个输出区间，比构造 (输出数, 抽头数) 的索引矩阵少一半内存访问
+        for offset, weights in zip(self.offsets, self.taps):
+            out += padded[np.clip(position + offset, 0, len(padded) - 1)] * weights[phase]
+        return out
+
+
+def iter_converted_pcm(path, info, sample_rate=16000, block_seconds=1.0):
+    """
+    进程内把 WAV 转为目标采样率的单声道 int16，按块（约 block_seconds 秒）逐块返回
+
+    输入经内存映射按需读取，内存占用与文件长度无关
+    """
+    frames = map_samples(path, info)
+
+    def samples(start, stop):
+        return to_float_mono(frames[start:stop], info)
+
+    if info.sample_rate == sample_rate:
+        convert = None
+        total = info.frames
+    else:
+        convert = Resampler(info.sample_rate, sample_rate)
+        total = convert.output_length(info.frames)
+    block = max(int(sample_rate * block_seconds), 1)
+    for start in range(0, total, block):
+        stop = min(start + block, total)
+        if convert is None:
+            pcm = samples(start, stop)
+        else:
+            pcm = convert.process(samples, info.frames, start, stop)
+        yield (np.clip(pcm, -1.0, 1.0) * 32767.0).round().astype(np.int16)
+
+
+def rechunk(blocks, chunk_bytes):
+    """把任意长度的 PCM 块重新切分为 chunk_bytes 大小的 bytes（最后一块可能不足）"""
+    pending = bytearray()
+    for block in blocks:
+        pending += memoryview(block).cast("B")
+        full = len(pending) - len(pending) % chunk_bytes
+        for offset in range(0, full, chunk_bytes):
+            yield bytes(pending[offset:offset + chunk_bytes])
+        del pending[:full]
+    if pending:
+        yield bytes(pending)
@@ -0,0 +1,169 @@
+"""
+基于帧能量与过零率的静音裁剪
+
+整段 int16 PCM 一次性分帧（NumPy 向量化，不逐帧循环），按下列规则判定语音帧:
+    能量 ≥ 上门限，或 能量 ≥ 下门限 且 过零率 ≥ zcr_threshold（能量低的清辅音）
+上门限取 level_dbfs 与「噪声底（最安静 10% 帧的能量）+ noise_margin_db」中较大者，但不超过峰值帧能量 - noise_margin_db；
+下门限比上门限低 weak_margin_db。短于 min_speech_ms 的语音段视为噪声，其余语音段向前延伸 preroll_ms、
+向后延伸 hangover_ms，再各留 keep_silence_ms / 2 的静音：长于 keep_silence_ms 的静音被压缩为 keep_silence_ms，
+开头与结尾的静音只保留一半，keep_silence_ms 为 0 时静音全部去掉。
+
+trim() 返回裁剪后的 PCM 与 TimestampMap，用于把裁剪后音频上的时间（如词级时间戳）换算回原音频。
+"""
+
+from collections import namedtuple
+
+import numpy as np
+
+GateResult = namedtuple("GateResult", "pcm spans timestamps")
+
+
+class TimestampMap:
+    """
+    裁剪后音频上的时间 → 原音频上的时间
+
+    spans 为保留的原音频区间 [(起点, 终点), ...]（采样点，按时间顺序、互不重叠），
+    裁剪后的音频即这些区间首尾相接。
+    """
+
+    def __init__(self, spans, sample_rate=16000, original_samples=None):
+        spans = np.asarray(spans, dtype=np.int64).reshape(-1, 2)
+        self.sample_rate = sample_rate
+        self.spans = spans
+        self._lengths = spans[:, 1] - spans[:, 0]
+        # 每个区间在裁剪后音频中的起点
+        self._offsets = np.concatenate([[0], np.cumsum(self._lengths)[:-1]]).astype(np.int64)
+        self.kept_samples = int(self._lengths.sum())
+        self.original_samples = int(spans[-1, 1]) if original_samples is None and len(spans) else \
+            int(original_samples or 0)
+
+    @property
+    def kept_ratio(self):
+        return self.kept_samples / self.original_samples if self.original_samples else 0.0
+
+    def to_original(self, samples, end=False):
+        """
+        裁剪后音频的采样点位置换算为原音频位置（标量或数组）
+
+        end 为 True 时按终点处理：恰好落在两个区间交界处的位置归前一个区间的终点，而不是后一个区间的起点
+        """
+        positions = np.asarray(samples, dtype=np.int64)
+        if not len(self.spans):
+            return positions
+        index = np.searchsorted(self._offsets, positions, side="left" if end else "right") - 1
+        index = np.clip(index, 0, len(self.spans) - 1)
+        mapped = self.spans[index, 0] + np.minimum(positions - self._offsets[index], self._lengths[index])
+        return mapped if mapped.ndim else int(mapped)
+
+    def to_original_ms(self, ms, end=False):
+        samples = np.rint(np.asarray(ms, dtype=np.float64) * self.sample_rate / 1000).astype(np.int64)
+        mapped = np.asarray(self.to_original(samples, end), dtype=np.float64) * 1000 / self.sample_rate
+        return mapped if mapped.ndim else int(round(float(mapped)))
+
+    def remap(self, items, start_key="start_ms", end_key="end_ms"):
+        """把 [{'start_ms', 'end_ms', ...}, ...]（如词级时间戳）换算到原音频，返回新列表"""
+        if not items:
+            return []
+        starts = self.to_original_ms([item[start_key] for item in items])
+        ends = self.to_original_ms([item[end_key] for item in items], end=True)
+        return [dict(item, **{start_key: int(round(start)), end_key: int(round(stop))})
+                for item, start, stop in zip(items, starts, ends)]
+
+
+class SilenceGate:
+    """帧能量 + 过零率静音门，参数见模块文档"""
+
+    def __init__(self, config=None, sample_rate=16000):
+        config = config or {}
+        self.sample_rate = sample_rate
+        self.frame_ms = int(config.get("frame_ms", 20))
+        self.level_dbfs = float(config.get("level_dbfs", -45))
+        self.noise_margin_db = float(config.get("noise_margin_db", 12))
+        self.weak_margin_db = float(config.get("weak_margin_db", 10))
+        self.zcr_threshold = float(config.get("zcr_threshold", 0.25))
+        self.min_speech_ms = int(config.get("min_speech_ms", 60))
+        self.preroll_ms = int(config.get("preroll_ms", 100))
+        self.hangover_ms = int(config.get("hangover_ms", 300))
+        self.keep_silence_ms = int(config.get("keep_silence_ms", 200))
+        self.frame_size = max(self.sample_rate * self.frame_ms // 1000, 1)
+
+    def frame_features(self, pcm):
+        """
+        每帧的能量（dBFS）与过零率，最后不足一帧的部分补零
+
+        返回值:
+            (db, zcr)，均为长度为帧数的 float 数组
+        """
+        pcm = np.asarray(pcm)
+        count = -(-len(pcm) // self.frame_size)
+        frames = np.zeros(count * self.frame_size, dtype=np.float32)
+        frames[:len(pcm)] = pcm
+        frames = frames.reshape(count, self.frame_size)
+        if pcm.dtype == np.int16:
+            frames /= 32768.0
+        power = np.einsum("ij,ij->i", frames, frames) / self.frame_size
+        db = 10 * np.log10(np.maximum(power, 1e-10))
+        signs = np.signbit(frames)
+        zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / (self.frame_size - 1 or 1)
+        return db, zcr
+
+    def speech_frames(self, pcm):
+        """逐帧的语音判定（bool 数组），尚未去掉过短的语音段、未加前后延伸"""
+        db, zcr = self.frame_features(pcm)
+        if not len(db):
+            return np.zeros(0, dtype=bool)
+        floor = np.percentile(db, 10)
+        upper = np.clip(floor + self.noise_margin_db, self.level_dbfs,
+                        max(self.level_dbfs, db.max() - self.noise_margin_db))
+        lower = upper - self.weak_margin_db
+        return (db >= upper) | ((db >= lower) & (zcr >= self.zcr_threshold))
+
+    @staticmethod
+    def _runs(mask):
+        """bool 数组中连续 True 段的 (起点, 终点) 数组"""
+        edges = np.diff(np.concatenate([[0], mask.astype(np.int8), [0]]))
+        return np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+
+    def _expand(self, starts, ends, before, after, limit):
+        """各段向前延伸 before、向后延伸 after（采样点），重叠的段合并"""
+        if not len(starts):
+            return np.zeros((0, 2), dtype=np.int64)
+        starts = np.maximum(starts - before, 0)
+        ends = np.minimum(ends + after, limit)
+        reach = np.maximum.accumulate(ends)
+        # 起点超过之前所有段的最远终点时开始新的一段
+        new = np.concatenate([[True], starts[1:] > reach[:-1]])
+        group_ends = np.concatenate([np.flatnonzero(new)[1:] - 1, [len(starts) - 1]])
+        return np.stack([starts[new], reach[group_ends]], axis=1)
+
+    def speech_regions(self, pcm):
+        """
+        语音区间（采样点），含 preroll_ms / hangover_ms 的延伸，不含保留的静音
+
+        返回值:
+            (n, 2) int64 数组
+        """
+        starts, ends = self._runs(self.speech_frames(pcm))
+        keep = (ends - starts) * self.frame_ms >= self.min_speech_ms
+        starts, ends = starts[keep] * self.frame_size, ends[keep] * self.frame_size
+        return self._expand(starts, ends, self.sample_rate * self.preroll_ms // 1000,
+                            self.sample_rate * self.hangover_ms // 1000, len(pcm))
+
+    def trim(self, pcm):
+        """
+        去掉或压缩静音
+
+        返回值:
+            GateResult(pcm, spans, timestamps)：裁剪后的 PCM（全部为静音时长度为 0）、保留的原音频区间、TimestampMap
+        """
+        pcm = np.asarray(pcm)
+        regions = self.speech_regions(pcm)
+        margin = self.sample_rate * self.keep_silence_ms // 2000
+        spans = self._expand(regions[:, 0], regions[:, 1], margin, margin, len(pcm))
+        if len(spans) == 1 and spans[0, 0] == 0 and spans[0, 1] == len(pcm):
+            trimmed = pcm
+        elif len(spans):
+            trimmed = np.concatenate([pcm[start:end] for start, end in spans])
+        else:
+            trimmed = pcm[:0]
+        return GateResult(trimmed, spans, TimestampMap(spans, self.sample_rate, len(pcm)))
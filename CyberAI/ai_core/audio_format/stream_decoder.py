@@ -0,0 +1,130 @@
+import asyncio
+
+try:
+    import av  # 可选依赖：PyAV，可在进程内增量解码
+except ImportError:
+    av = None
+
+
+async def _skip_id3(chunks):
+    """跳过流开头的 ID3v2 标签（PyAV 的 mp3 解析器不会处理它）"""
+    head = b''
+    async for chunk in chunks:
+        if head is None:
+            yield chunk
+            continue
+        head += chunk
+        if len(head) < 10:
+            continue
+        if head[:3] == b'ID3':
+            # 标签长度为 4 字节 synchsafe 整数，不含 10 字节头
+            size = 10 + ((head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9])
+            if head[5] & 0x10:
+                size += 10
+            if len(head) < size:
+                continue
+            head = head[size:]
+        if head:
+            yield head
+        head = None
+    if head:
+        yield head
+
+
+async def decode_stream_with_pyav(chunks, codec_name="mp3", sample_rate=16000, channels=1):
+    """
+    在进程内增量解码压缩音频流
+
+    参数:
+        chunks: 异步迭代的压缩音频字节块
+        codec_name: 输入编码格式（如 mp3）
+        sample_rate/channels: 输出 s16le PCM 的采样率与声道数
+
+    逐块 yield 重采样后的 s16le PCM 字节
+    """
+    if av is None:
+        raise ImportError("未安装 PyAV (av)，无法在进程内解码")
+
+    codec = av.CodecContext.create(codec_name, "r")
+    resampler = av.AudioResampler(format="s16", layout="mono" if channels == 1 else "stereo", rate=sample_rate)
+
+    def _convert(frames):
+        pcm = []
+        for frame in frames:
+            for resampled in resampler.resample(frame):
+                pcm.append(resampled.to_ndarray().tobytes())
+        return b''.join(pcm)
+
+    async for chunk in _skip_id3(chunks):
+        for packet in codec.parse(chunk):
+            try:
+                pcm = _convert(codec.decode(packet))
+            except av.error.InvalidDataError as e:
+                print(f"跳过无法解码的数据包: {e}")
+                continue
+            if pcm:
+                yield pcm
+
+    # 冲刷解码器与重采样器中剩余的数据
+    pcm = _convert(codec.decode(None))
+    pcm += b''.join(resampled.to_ndarray().tobytes() for resampled in resampler.resample(None))
+    if pcm:
+        yield pcm
+
+
+async def decode_stream_with_ffmpeg(chunks, ffmpeg_path, input_format="mp3", sample_rate=16000,
+                                    channels=1, read_size=4096):
+    """
+    通过 FFmpeg 管道增量解码压缩音频流：边写 stdin 边读 stdout，不落盘
+
+    逐块 yield s16le PCM 字节；迭代提前结束或任务取消时结束子进程
+    """
+    process = await asyncio.create_subprocess_exec(
+        ffmpeg_path,
+        '-nostdin',
+        '-loglevel', 'error',
+        '-f', input_format,
+        '-i', 'pipe:0',
+        '-ar', str(sample_rate),
+        '-ac', str(channels),
+        '-f', 's16le',
+        'pipe:1',
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+    )
+
+    async def feed():
+        try:
+            async for chunk in chunks:
+                process.stdin.write(chunk)
+                await process.stdin.drain()
+        finally:
+            process.stdin.close()
+
+    feeder = asyncio.create_task(feed())
+    try:
+        while True:
+            pcm = await process.stdout.read(read_size)
+            if not pcm:
+                break
+            yield pcm
+        # 输入端异常（如 TTS 网络错误）在此抛出
+        await feeder
+        returncode = await process.wait()
+        if returncode != 0:
+            raise RuntimeError(f"FFmpeg 解码失败，返回码 {returncode}")
+    finally:
+        feeder.cancel()
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+
+
+def decode_stream(chunks, ffmpeg_path, input_format="mp3", sample_rate=16000, channels=1, decoder="auto"):
+    """
+    选择解码方式：decoder 为 auto 时优先使用进程内的 PyAV，未安装则使用 FFmpeg 管道
+    """
+    if decoder == "pyav" or (decoder == "auto" and av is not None):
+        return decode_stream_with_pyav(chunks, input_format, sample_rate, channels)
+    return decode_stream_with_ffmpeg(chunks, ffmpeg_path, input_format, sample_rate, channels)
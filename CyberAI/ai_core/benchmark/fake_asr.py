@@ -0,0 +1,21 @@
+import time
+
+
+class FakeASR:
+    """
+    不加载模型的 ASR 替身，接口与 FunASRWrapper.pcm_to_text 相同
+
+    每次识别阻塞 delay 秒再加上音频时长 × rtf 秒，然后返回固定文本，
+    用于在没有模型的环境中压测网关与流水线。
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.text = config.get("text", "你好，你是谁？")
+        self.delay = float(config.get("delay", 0.02))
+        self.rtf = float(config.get("rtf", 0.02))
+        self.sample_rate = 16000
+
+    def pcm_to_text(self, pcm):
+        time.sleep(self.delay + len(pcm) / self.sample_rate * self.rtf)
+        return self.text
@@ -0,0 +1,48 @@
+import asyncio
+
+import numpy as np
+
+from audio_format.opus import Opus_Encoder
+
+
+class FakeTTS:
+    """
+    不访问网络的 TTS 替身，接口与 Edge_TTS 的 text_to_opus_stream / text_to_opus 相同
+
+    按文本长度生成固定的正弦音频（每字 ms_per_char 毫秒）并编码为 Opus，
+    在首个数据包前等待 first_packet_delay 秒、之后每个数据包间隔 packet_delay 秒，
+    用于在基准测试中模拟合成延迟。
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.first_packet_delay = float(config.get("first_packet_delay", 0.1))
+        self.packet_delay = float(config.get("packet_delay", 0.0))
+        self.ms_per_char = int(config.get("ms_per_char", 200))
+        self.frequency = float(config.get("frequency", 440))
+        self._canned = {}
+
+    def _canned_packets(self, duration_ms):
+        """同一时长的音频只编码一次"""
+        packets = self._canned.get(duration_ms)
+        if packets is None:
+            opus = Opus_Encoder()
+            samples = opus.opus_sample_rate * duration_ms // 1000
+            t = np.arange(samples) / opus.opus_sample_rate
+            pcm = (np.sin(2 * np.pi * self.frequency * t) * 8000).astype(np.int16).tobytes()
+            with opus.open_session() as session:
+                packets = session.encode(pcm) + session.flush()
+            self._canned[duration_ms] = packets
+        return packets
+
+    async def text_to_opus_stream(self, text):
+        packets = self._canned_packets(max(len(text), 1) * self.ms_per_char)
+        await asyncio.sleep(self.first_packet_delay)
+        for index, packet in enumerate(packets):
+            if index and self.packet_delay:
+                await asyncio.sleep(self.packet_delay)
+            yield packet
+
+    async def text_to_opus(self, text):
+        packets = [packet async for packet in self.text_to_opus_stream(text)]
+        return packets, max(len(text), 1) * self.ms_per_char
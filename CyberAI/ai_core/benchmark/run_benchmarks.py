@@ -0,0 +1,414 @@
+"""
+阶段级延迟基准测试
+
+覆盖 Opus 编解码吞吐、各编码档位的码率 / CPU / 算法延迟、静音裁剪吞吐、进程内 WAV 读取与 FFmpeg 转换耗时、ASR 实时率（RTF）、端到端首包音频延迟（TTFA）与指标埋点开销。
+端到端测试使用本地 OpenAI 兼容桩服务（llm/stub_server.py）与 FakeTTS，不访问真实 ChatGLM 与 Edge 服务。
+结果写入 JSON；指定基线时逐项比较，超出容差的退化会列出并以非零状态码退出。
+耗时类指标取多次运行的最小值（排除调度、缓存等噪声，只会偏慢不会偏快），
+亚毫秒级指标另设绝对变化下限（floor），低于下限的变化不算退化；
+实时倍数与对应的耗时指标是同一次测量的倒数，只显示，由耗时指标做退化判断。
+
+命令行（在 ai_core 目录下执行）:
+    python -m benchmark.run_benchmarks [--suites opus profiles silence load ffmpeg asr e2e metrics]
+                                       [--output 结果.json] [--baseline 基线.json] [--tolerance 0.2] [--save-baseline]
+"""
+
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+import wave
+from datetime import datetime
+
+import numpy as np
+
+from audio_format import opus_profile
+from audio_format.opus import Opus_Encoder
+from audio_format.silence_gate import SilenceGate
+from utils.metrics import PipelineMetrics
+from utils.util import Util
+
+SUITES = ("opus", "profiles", "silence", "load", "ffmpeg", "asr", "e2e", "metrics")
+DEFAULT_BASELINE = os.path.join(Util.get_process_dir(), "output", "benchmark", "baseline.json")
+
+
+class SkipBenchmark(Exception):
+    """当前环境无法运行该项测试（缺少依赖等）"""
+
+
+def metric(value, unit, better, tolerance=None, floor=None, gate=True):
+    """
+    better 为 lower 或 higher，比较基线时据此判断退化方向
+
+    tolerance 为该项的相对容差（覆盖命令行的 --tolerance），floor 为绝对变化下限（与 value 同单位），
+    两者都超出才算退化；gate 为 False 的项只显示不参与比较
+    """
+    result = {'value': round(float(value), 4), 'unit': unit, 'better': better}
+    if not gate:
+        result['gate'] = False
+    if tolerance is not None:
+        result['tolerance'] = tolerance
+    if floor is not None:
+        result['floor'] = floor
+    return result
+
+
+def _timed(fn, repeats):
+    """运行 repeats 次，返回 (最短耗时秒, 最后一次的返回值)"""
+    times = []
+    result = None
+    for _ in range(repeats):
+        started = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - started)
+    return min(times), result
+
+
+def synth_pcm(seconds, sample_rate=16000):
+    """生成带幅度调制的多频正弦信号（int16），频谱比纯音更接近语音"""
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((220, 440, 880, 1760)))
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 3 * t)
+    return (signal * envelope * 6000).astype(np.int16)
+
+
+def _write_wav(path, pcm, sample_rate=16000, channels=1):
+    with wave.open(path, 'wb') as wav_file:
+        wav_file.setnchannels(channels)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return path
+
+
+def bench_opus(seconds=30, repeats=15):
+    opus = Opus_Encoder()
+    pcm = synth_pcm(seconds, opus.opus_sample_rate).tobytes()
+
+    def encode():
+        with opus.open_session() as session:
+            return session.encode(pcm) + session.flush()
+
+    encode_seconds, packets = _timed(encode, repeats)
+    decode_seconds, _ = _timed(lambda: opus.opus_to_pcm(packets), repeats)
+    return {
+        'encode_x_realtime': metric(seconds / encode_seconds, "x", "higher", gate=False),
+        'encode_us_per_frame': metric(encode_seconds / len(packets) * 1e6, "us", "lower", floor=100),
+        'decode_x_realtime': metric(seconds / decode_seconds, "x", "higher", gate=False),
+        'decode_us_per_frame': metric(decode_seconds / len(packets) * 1e6, "us", "lower", floor=30),
+        'bytes_per_second': metric(sum(len(p) for p in packets) / seconds, "B/s", "lower"),
+    }
+
+
+def bench_profiles(opus_config=None, seconds=30, repeats=7):
+    """
+    各编码档位（含配置 Opus.profiles 中定义的）：每秒音频的字节数、编码 CPU 时间与算法延迟
+
+    输入为语音与静音各占一半的合成信号，开启 DTX 的档位在静音段只发 1 字节的包
+    """
+    opus = Opus_Encoder()
+    pcm = synth_pcm(seconds, opus.opus_sample_rate)
+    pcm[(np.arange(len(pcm)) // opus.opus_sample_rate) % 2 == 1] = 0
+    data = pcm.tobytes()
+    results = {}
+    for name, profile in opus_profile.load_profiles(opus_config).items():
+        frame_size = opus.opus_sample_rate * profile.frame_ms // 1000
+        frame_bytes = frame_size * opus.opus_sample_width
+        frames = [data[i:i + frame_bytes] for i in range(0, len(data) - frame_bytes + 1, frame_bytes)]
+        cpu_times = []
+        for _ in range(repeats):
+            encoder = opus_profile.create_encoder(profile, opus.opus_sample_rate, opus.opus_channel)
+            started = time.process_time()
+            packets = [encoder.encode(frame, frame_size) for frame in frames]
+            cpu_times.append(time.process_time() - started)
+        audio_seconds = len(frames) * profile.frame_ms / 1000
+        results[f'{name}.bytes_per_second'] = metric(sum(len(p) for p in packets) / audio_seconds, "B/s", "lower")
+        results[f'{name}.encode_cpu_ms_per_s'] = metric(min(cpu_times) * 1000 / audio_seconds, "ms", "lower", floor=3)
+        results[f'{name}.latency_ms'] = metric(opus_profile.algorithmic_delay_ms(encoder, opus.opus_sample_rate),
+                                               "ms", "lower")
+    return results
+
+
+def bench_silence(gate_config=None, seconds=600, repeats=10):
+    """静音裁剪：整段 PCM 一次处理的实时倍数，输入为 -60dBFS 噪声底上语音与静音各占一半"""
+    pcm = synth_pcm(seconds)
+    silent = (np.arange(len(pcm)) // 16000) % 4 >= 2
+    noise = np.random.default_rng(0).standard_normal(len(pcm)) * 32768 * 10 ** (-60 / 20)
+    pcm = np.where(silent, noise, pcm).astype(np.int16)
+    gate = SilenceGate(gate_config)
+    trim_seconds, result = _timed(lambda: gate.trim(pcm), repeats)
+    return {
+        'trim_x_realtime': metric(seconds / trim_seconds, "x", "higher", gate=False),
+        'trim_ms_per_minute': metric(trim_seconds * 1000 / (seconds / 60), "ms", "lower", floor=3),
+        'kept_ratio': metric(result.timestamps.kept_ratio, "", "lower"),
+    }
+
+
+def bench_load(seconds=30, repeats=10):
+    """进程内读取 WAV：16kHz 单声道直接映射，44.1kHz 立体声经 NumPy 重采样与混音"""
+    opus = Opus_Encoder()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        native = _write_wav(os.path.join(temp_dir, "native.wav"), synth_pcm(seconds))
+        stereo = np.repeat(synth_pcm(seconds, 44100)[:, None], 2, axis=1)
+        resample = _write_wav(os.path.join(temp_dir, "44k_stereo.wav"), stereo, 44100, channels=2)
+        native_seconds, _ = _timed(lambda: opus.load_pcm(native), repeats)
+        resample_seconds, _ = _timed(lambda: opus.load_pcm(resample), repeats)
+    return {
+        'native_ms': metric(native_seconds * 1000, "ms", "lower", floor=1),
+        'resample_ms': metric(resample_seconds * 1000, "ms", "lower", floor=50),
+        'resample_x_realtime': metric(seconds / resample_seconds, "x", "higher", gate=False),
+    }
+
+
+def bench_ffmpeg(seconds=30, repeats=3):
+    opus = Opus_Encoder()
+    if not os.path.exists(opus.ffmpeg_path) and shutil.which(opus.ffmpeg_path) is None:
+        raise SkipBenchmark(f"找不到 FFmpeg: {opus.ffmpeg_path}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = _write_wav(os.path.join(temp_dir, "bench.wav"), synth_pcm(seconds))
+        convert_seconds, _ = _timed(lambda: opus.convert_to_pcm_with_ffmpeg(path), repeats)
+        to_opus_seconds, _ = _timed(lambda: opus.audio_to_opus(path), repeats)
+    return {
+        'convert_ms': metric(convert_seconds * 1000, "ms", "lower", floor=30),
+        'convert_x_realtime': metric(seconds / convert_seconds, "x", "higher", gate=False),
+        'file_to_opus_ms': metric(to_opus_seconds * 1000, "ms", "lower", floor=50),
+    }
+
+
+def bench_asr(asr_config, audio_path=None, seconds=10, repeats=3):
+    from utils.registry import ComponentRegistry
+
+    registry = ComponentRegistry()
+    try:
+        asr = registry.create(asr_config, "ASR")
+    except ImportError as e:
+        raise SkipBenchmark(f"ASR 依赖未安装: {e}")
+    opus = Opus_Encoder()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if audio_path is None:
+            audio_path = _write_wav(os.path.join(temp_dir, "bench.wav"), synth_pcm(seconds))
+        # 任意采样率、声道数的 WAV 与压缩格式都转为 16kHz 单声道 PCM，RTF 按转换后的时长计算
+        pcm = opus.load_pcm(audio_path)
+        seconds = len(pcm) / opus.opus_sample_rate
+        with opus.open_session() as session:
+            packets = session.encode(pcm.tobytes()) + session.flush()
+
+        registry.warmup(asr, "ASR", background=False)
+        file_seconds, _ = _timed(lambda: asr.audio_file_to_text(audio_path), repeats)
+        pcm_seconds, _ = _timed(lambda: asr.pcm_to_text(pcm), repeats)
+        opus_seconds, _ = _timed(lambda: asr.opus_data_to_text(packets), repeats)
+
+    timing = registry.timing_report()['components']['ASR']
+    return {
+        'load_ms': metric(timing['load_ms'], "ms", "lower", floor=1000),
+        'warmup_ms': metric(timing['warmup_ms'], "ms", "lower", floor=200),
+        'file_rtf': metric(file_seconds / seconds, "", "lower", floor=0.005),
+        'pcm_rtf': metric(pcm_seconds / seconds, "", "lower", floor=0.005),
+        'opus_rtf': metric(opus_seconds / seconds, "", "lower", floor=0.005),
+    }
+
+
+async def _bench_e2e(runs, first_token_delay, token_delay, tts_config):
+    from benchmark.fake_tts import FakeTTS
+    from llm.chatglm import ChatGLM_LLM
+    from llm.stub_server import StubLLMServer
+    from pipeline.voice_pipeline import VoicePipeline
+
+    stats = []
+    async with StubLLMServer(first_token_delay=first_token_delay, token_delay=token_delay) as server:
+        llm = ChatGLM_LLM({"model_name": "stub", "api_key": "stub", "url": server.url})
+        pipeline = VoicePipeline(llm, FakeTTS(tts_config))
+        try:
+            # 第一轮建立连接、编码缓存，不计入结果
+            await pipeline.run("预热")
+            for _ in range(runs):
+                await pipeline.run("你好，你是谁？")
+                stats.append(dict(pipeline.last_stats))
+        finally:
+            await ChatGLM_LLM.close_async_clients()
+    return stats
+
+
+def bench_e2e(runs=10, first_token_delay=0.05, token_delay=0.01, tts_config=None):
+    tts_config = tts_config or {"first_packet_delay": 0.1, "packet_delay": 0.0}
+    stats = asyncio.run(_bench_e2e(runs, first_token_delay, token_delay, tts_config))
+    ttfa = [s['first_packet_ms'] for s in stats]
+    # 扣除模拟的 LLM 与 TTS 延迟后，剩下的是流水线自身的开销
+    simulated_ms = (first_token_delay + float(tts_config.get("first_packet_delay", 0.1))) * 1000
+    return {
+        'ttfa_ms_p50': metric(statistics.median(ttfa), "ms", "lower", floor=10),
+        'ttfa_ms_max': metric(max(ttfa), "ms", "lower", floor=20),
+        'ttfa_overhead_ms_p50': metric(statistics.median(ttfa) - simulated_ms, "ms", "lower", floor=10),
+        'first_token_ms_p50': metric(statistics.median(s['first_token_ms'] for s in stats), "ms", "lower", floor=10),
+        'total_ms_p50': metric(statistics.median(s['total_ms'] for s in stats), "ms", "lower", floor=20),
+    }
+
+
+def bench_metrics(iterations=20000, repeats=10):
+    """
+    指标埋点开销：单个 span 的耗时，以及按一次端到端请求中的 span 数估算的开销占比
+    """
+    probe = PipelineMetrics(namespace="bench")
+
+    def spans():
+        for _ in range(iterations):
+            with probe.span("stage", 1.0):
+                pass
+
+    span_seconds, _ = _timed(spans, repeats)
+    probe.enabled = False
+    disabled_seconds, _ = _timed(spans, repeats)
+    probe.enabled = True
+    render_seconds, _ = _timed(probe.render, repeats * 10)
+
+    from utils.metrics import metrics
+    stats = asyncio.run(_bench_e2e(3, 0.05, 0.01, {"first_packet_delay": 0.1, "packet_delay": 0.0}))
+    trace = metrics.recent_traces(1)[-1]
+    span_us = span_seconds / iterations * 1e6
+    # 每个 span 与追踪本身各计一次
+    overhead_ms = (len(trace['spans']) + 1) * span_us / 1000
+    return {
+        'span_us': metric(span_us, "us", "lower", floor=2),
+        'disabled_span_us': metric(disabled_seconds / iterations * 1e6, "us", "lower", floor=0.5),
+        'render_ms': metric(render_seconds * 1000, "ms", "lower", floor=0.1),
+        'e2e_overhead_pct': metric(overhead_ms / stats[-1]['total_ms'] * 100, "%", "lower", floor=0.02),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """
+    与基线逐项比较：变化不超过该项的 floor，或相对变化不超过该项的 tolerance（未设置时用参数 tolerance）时不算退化
+
+    返回值:
+        [(测试项, 指标, 基线值, 当前值, 相对变化), ...]，只包含超出容差的退化项
+    """
+    regressions = []
+    for suite, metrics in results['suites'].items():
+        base_metrics = baseline.get('suites', {}).get(suite, {})
+        if 'skipped' in metrics or 'skipped' in base_metrics:
+            continue
+        for name, current in metrics.items():
+            base = base_metrics.get(name)
+            if base is None or not base['value'] or not current.get('gate', True):
+                continue
+            if abs(current['value'] - base['value']) <= current.get('floor', 0.0):
+                continue
+            limit = current.get('tolerance', tolerance)
+            change = (current['value'] - base['value']) / abs(base['value'])
+            worse = change > limit if current['better'] == "lower" else change < -limit
+            if worse:
+                regressions.append((suite, name, base['value'], current['value'], change))
+    return regressions
+
+
+def run_benchmarks(suites=SUITES, config=None, asr_audio=None):
+    config = config or {}
+    results = {
+        'meta': {
+            'time': datetime.now().isoformat(timespec="seconds"),
+            'python': sys.version.split()[0],
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+        },
+        'suites': {},
+    }
+    runners = {
+        'opus': bench_opus,
+        'profiles': lambda: bench_profiles(config.get("Opus")),
+        'silence': lambda: bench_silence(((config.get("ASR") or {}).get("FunASR") or {}).get("silence_gate")),
+        'load': bench_load,
+        'ffmpeg': bench_ffmpeg,
+        'asr': lambda: bench_asr((config.get("ASR") or {}).get("FunASR") or {"type": "FunASRWrapper"}, asr_audio),
+        'e2e': bench_e2e,
+        'metrics': bench_metrics,
+    }
+    for suite in suites:
+        print(f"运行 {suite} ...")
+        try:
+            results['suites'][suite] = runners[suite]()
+        except SkipBenchmark as e:
+            print(f"  跳过: {e}")
+            results['suites'][suite] = {'skipped': str(e)}
+    return results
+
+
+def format_results(results, baseline=None):
+    lines = []
+    for suite, metrics in results['suites'].items():
+        if 'skipped' in metrics:
+            lines.append(f"[{suite}] 跳过: {metrics['skipped']}")
+            continue
+        lines.append(f"[{suite}]")
+        base_metrics = (baseline or {}).get('suites', {}).get(suite, {})
+        width = max([24] + [len(name) + 2 for name in metrics])
+        for name, current in metrics.items():
+            line = f"  {name:<{width}}{current['value']:>12.3f} {current['unit']}"
+            base = base_metrics.get(name) if isinstance(base_metrics, dict) else None
+            if base and base.get('value'):
+                line += f"  (基线 {base['value']:.3f}, {(current['value'] - base['value']) / abs(base['value']):+.1%})"
+            lines.append(line)
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import yaml
+
+    parser = argparse.ArgumentParser(description='CyberAI 阶段级延迟基准测试')
+    parser.add_argument('--suites', nargs='+', default=list(SUITES), choices=SUITES, help='要运行的测试项')
+    parser.add_argument('--config_path', type=str, default=None,
+                        help='配置文件路径（ASR 测试使用其中的 ASR.FunASR，编码测试使用其中的 Opus）')
+    parser.add_argument('--asr-audio', type=str, default=None, help='ASR 测试用的音频文件（默认使用合成信号）')
+    parser.add_argument('--output', type=str, default=None, help='结果 JSON 文件路径')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help=f'基线 JSON 文件路径（默认: {DEFAULT_BASELINE}，不存在时不比较）')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='允许的相对退化 (默认: 0.2)')
+    parser.add_argument('--save-baseline', action='store_true', help='把本次结果保存为基线')
+
+    args = parser.parse_args()
+    baseline_path = args.baseline or DEFAULT_BASELINE
+    if args.baseline and not args.save_baseline and not os.path.exists(args.baseline):
+        # 显式指定的基线不存在时不能静默跳过比较，否则退化检查形同虚设
+        parser.error(f"基线文件不存在: {args.baseline}")
+    config = {}
+    if args.config_path:
+        with open(args.config_path, "r", encoding="utf-8") as file:
+            config = yaml.safe_load(file)
+        Opus_Encoder().configure(config.get("Opus"))
+
+    results = run_benchmarks(args.suites, config, args.asr_audio)
+    baseline = None
+    if not args.save_baseline:
+        if os.path.exists(baseline_path):
+            with open(baseline_path, "r", encoding="utf-8") as f:
+                baseline = json.load(f)
+        else:
+            print(f"未找到基线 {baseline_path}，不做比较（可用 --save-baseline 保存）")
+    print(format_results(results, baseline))
+
+    output = args.output or os.path.join(Util.get_process_dir(), "output", "benchmark",
+                                         f"result_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"结果已保存: {output}")
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(os.path.abspath(baseline_path)), exist_ok=True)
+        with open(baseline_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+        print(f"基线已更新: {baseline_path}")
+    elif baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"\n性能退化（容差 {args.tolerance:.0%}）:")
+            for suite, name, base, current, change in regressions:
+                print(f"  {suite}.{name}: {base:.3f} -> {current:.3f} ({change:+.1%})")
+            sys.exit(1)
+        print("未发现超出容差的退化")
@@ -0,0 +1,217 @@
+"""
+语音网关压测客户端
+
+connections 个连接并发，各自发送 turns 句语音（Opus 数据包 + end），统计从发送 end 到
+收到识别结果、第一个回复数据包、回复结束的往返延迟（p50 / p99）；另外保持 idle 个空闲连接，
+用于观察网关持有大量空闲连接时的表现。指定 interrupt_after_ms 时，收到第一个回复数据包后再过该时长
+按实时节奏发送语音打断回复，统计从开口到收到 interrupted 的延迟与作废的音频。
+
+命令行（在 ai_core 目录下执行）:
+    python -m gateway.load_client [ws://127.0.0.1:8765] [--connections 50] [--turns 5] [--idle 1000]
+                                  [--audio 16k单声道.wav] [--seconds 2] [--realtime] [--interrupt-after-ms 500]
+                                  [--profile voip-low-latency] [--json 输出文件]
+"""
+
+import asyncio
+import json
+import time
+import wave
+
+import numpy as np
+from websockets.asyncio.client import connect
+
+from audio_format.opus import Opus_Encoder
+
+
+def percentile(values, q):
+    return float(np.percentile(values, q)) if values else None
+
+
+def load_packets(audio_path=None, seconds=2.0):
+    """把 16kHz 单声道 WAV（或 seconds 秒的合成信号）编码为 Opus 数据包列表"""
+    opus = Opus_Encoder()
+    if audio_path:
+        with wave.open(audio_path, "rb") as wav_file:
+            if wav_file.getframerate() != opus.opus_sample_rate or wav_file.getnchannels() != opus.opus_channel:
+                raise ValueError(f"需要 {opus.opus_sample_rate}Hz 单声道 WAV: {audio_path}")
+            pcm = wav_file.readframes(wav_file.getnframes())
+    else:
+        t = np.arange(int(seconds * opus.opus_sample_rate)) / opus.opus_sample_rate
+        pcm = (np.sin(2 * np.pi * 220 * t) * 6000).astype(np.int16).tobytes()
+    with opus.open_session() as session:
+        return session.encode(pcm) + session.flush()
+
+
+async def _barge_in(websocket, packets, delay_ms, frame_ms, started):
+    """等待 delay_ms 后按实时节奏发送语音，开始发送的时刻记入 started"""
+    await asyncio.sleep(delay_ms / 1000)
+    started.append(time.perf_counter())
+    for packet in packets:
+        await websocket.send(packet)
+        await asyncio.sleep(frame_ms / 1000)
+    return started
+
+
+async def _talk(url, packets, turns, realtime, frame_ms, results, errors, interrupt_after_ms=None):
+    """一个活跃连接：逐句发送并等待完整回复（或打断回复）"""
+    try:
+        async with connect(url, compression=None, max_size=None) as websocket:
+            json.loads(await websocket.recv())  # ready
+            for _ in range(turns):
+                for packet in packets:
+                    await websocket.send(packet)
+                    if realtime:
+                        await asyncio.sleep(frame_ms / 1000)
+                ended = time.perf_counter()
+                await websocket.send(json.dumps({'type': "end"}))
+                turn = {'asr_ms': None, 'first_packet_ms': None, 'total_ms': None, 'packets': 0,
+                        'interrupt_ms': None, 'abandoned_audio_ms': None}
+                barge_in, barge_in_started = None, []
+                try:
+                    while True:
+                        message = await websocket.recv()
+                        elapsed_ms = (time.perf_counter() - ended) * 1000
+                        if isinstance(message, bytes):
+                            if turn['first_packet_ms'] is None:
+                                turn['first_packet_ms'] = elapsed_ms
+                                if interrupt_after_ms is not None:
+                                    barge_in = asyncio.create_task(
+                                        _barge_in(websocket, packets, interrupt_after_ms, frame_ms, barge_in_started))
+                            turn['packets'] += 1
+                            continue
+                        event = json.loads(message)
+                        if event['type'] == "asr":
+                            turn['asr_ms'] = elapsed_ms
+                        elif event['type'] == "reply_end":
+                            turn['total_ms'] = elapsed_ms
+                            break
+                        elif event['type'] == "interrupted":
+                            if barge_in_started:
+                                turn['interrupt_ms'] = (time.perf_counter() - barge_in_started[0]) * 1000
+                            turn['abandoned_audio_ms'] = event['abandoned_audio_ms']
+                            break
+                        elif event['type'] == "error":
+                            raise RuntimeError(event['message'])
+                finally:
+                    if barge_in is not None:
+                        barge_in.cancel()
+                        # 打断用的语音不作为下一句
+                        await websocket.send(json.dumps({'type': "reset"}))
+                results.append(turn)
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+
+
+async def _hold_idle(url, gate, connected, release, errors):
+    """一个空闲连接：握手后保持到压测结束；gate 限制同时进行的握手数，避免超出监听队列"""
+    try:
+        async with gate:
+            websocket = await connect(url, compression=None)
+            await websocket.recv()  # ready
+        connected.append(1)
+        try:
+            await release.wait()
+        finally:
+            await websocket.close()
+    except Exception as e:
+        errors.append(f"{type(e).__name__}: {e}")
+
+
+async def run_load_test(url, connections=50, turns=5, idle=0, packets=None, realtime=False,
+                        frame_ms=None, connect_concurrency=200, interrupt_after_ms=None):
+    """
+    参数:
+        frame_ms: 数据包帧时长，用于实时发送的节奏，默认为 Opus_Encoder 当前档位的帧时长
+
+    返回值:
+        dict：各项延迟的 p50/p99（毫秒）、完成回合数、吞吐（回合/秒）、空闲连接数与错误列表
+    """
+    packets = packets if packets is not None else load_packets()
+    frame_ms = frame_ms or Opus_Encoder().opus_frame_time
+    results, errors, idle_errors, connected = [], [], [], []
+    release = asyncio.Event()
+
+    gate = asyncio.Semaphore(connect_concurrency)
+    idle_started = time.perf_counter()
+    idle_tasks = [asyncio.create_task(_hold_idle(url, gate, connected, release, idle_errors))
+                  for _ in range(idle)]
+    while len(connected) + len(idle_errors) < idle:
+        await asyncio.sleep(0.01)
+    idle_connect_seconds = time.perf_counter() - idle_started
+
+    started = time.perf_counter()
+    await asyncio.gather(*[_talk(url, packets, turns, realtime, frame_ms, results, errors, interrupt_after_ms)
+                           for _ in range(connections)])
+    elapsed = time.perf_counter() - started
+    release.set()
+    await asyncio.gather(*idle_tasks)
+
+    def summary(key):
+        values = [turn[key] for turn in results if turn[key] is not None]
+        return {'p50': percentile(values, 50), 'p99': percentile(values, 99), 'max': max(values, default=None)}
+
+    return {
+        'connections': connections,
+        'turns': len(results),
+        'turns_per_sec': len(results) / elapsed if elapsed > 0 else 0.0,
+        'asr_ms': summary('asr_ms'),
+        'first_packet_ms': summary('first_packet_ms'),
+        'total_ms': summary('total_ms'),
+        'interrupted': sum(turn['interrupt_ms'] is not None for turn in results),
+        'interrupt_ms': summary('interrupt_ms'),
+        'abandoned_audio_ms': sum(turn['abandoned_audio_ms'] or 0 for turn in results),
+        'idle_connected': len(connected),
+        'idle_connect_seconds': idle_connect_seconds,
+        'errors': errors + idle_errors,
+    }
+
+
+def format_report(report):
+    def row(name, values):
+        if values['p50'] is None:
+            return f"  {name:<16} -"
+        return f"  {name:<16} p50 {values['p50']:8.1f}  p99 {values['p99']:8.1f}  max {values['max']:8.1f}"
+
+    lines = [
+        f"活跃连接 {report['connections']}，完成 {report['turns']} 个回合，{report['turns_per_sec']:.1f} 回合/s",
+        f"空闲连接 {report['idle_connected']}（建立耗时 {report['idle_connect_seconds']:.1f}s）",
+        "往返延迟（毫秒，从发送 end 起）:",
+        row("识别结果", report['asr_ms']),
+        row("首个回复数据包", report['first_packet_ms']),
+        row("回复结束", report['total_ms']),
+    ]
+    if report['interrupted']:
+        lines.append(f"打断 {report['interrupted']} 次，作废音频 {report['abandoned_audio_ms'] / 1000:.1f}s，"
+                     "从开口到收到 interrupted（毫秒）:")
+        lines.append(row("打断", report['interrupt_ms']))
+    lines.append(f"错误 {len(report['errors'])} 个")
+    lines.extend(f"  {error}" for error in report['errors'][:5])
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='CyberAI 语音网关压测客户端')
+    parser.add_argument('url', nargs='?', default="ws://127.0.0.1:8765", help='网关地址')
+    parser.add_argument('--connections', type=int, default=50, help='并发的活跃连接数 (默认: 50)')
+    parser.add_argument('--turns', type=int, default=5, help='每个活跃连接的回合数 (默认: 5)')
+    parser.add_argument('--idle', type=int, default=0, help='额外保持的空闲连接数 (默认: 0)')
+    parser.add_argument('--audio', type=str, default=None, help='16kHz 单声道 WAV，默认使用合成信号')
+    parser.add_argument('--seconds', type=float, default=2.0, help='合成信号时长（秒）')
+    parser.add_argument('--realtime', action='store_true', help='按帧时长实时发送，模拟设备上传')
+    parser.add_argument('--interrupt-after-ms', type=float, default=None,
+                        help='收到第一个回复数据包后经过该时长开口打断（默认不打断）')
+    parser.add_argument('--profile', type=str, default=None, help='上行语音的 Opus 编码档位（见 audio_format/opus_profile.py）')
+    parser.add_argument('--json', type=str, default=None, help='把结果写入 JSON 文件')
+
+    args = parser.parse_args()
+    if args.profile:
+        Opus_Encoder().configure({'profile': args.profile})
+    report = asyncio.run(run_load_test(args.url, args.connections, args.turns, args.idle,
+                                       load_packets(args.audio, args.seconds), args.realtime,
+                                       interrupt_after_ms=args.interrupt_after_ms))
+    print(format_report(report))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
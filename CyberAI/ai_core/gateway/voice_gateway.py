@@ -0,0 +1,492 @@
+"""
+WebSocket 语音网关
+
+设备通过 WebSocket 上传 Opus 数据包（16kHz 单声道，帧时长任意），
+网关识别后经 LLM/TTS 流水线把回复语音以 Opus 数据包流式下发。
+
+协议（每个连接）:
+    服务端 → 客户端  文本 {"type": "ready", "sample_rate", "channels", "frame_ms"}   连接建立后，frame_ms 为下行数据包的帧时长（Opus.profile）
+    客户端 → 服务端  二进制消息                                                   一个 Opus 数据包
+    客户端 → 服务端  文本 {"type": "end"}                                         一句话结束，开始识别与回复
+    客户端 → 服务端  文本 {"type": "reset"}                                       丢弃尚未结束的音频
+    客户端 → 服务端  文本 {"type": "interrupt"}                                   打断当前回复（客户端自行检测到说话时）
+    服务端 → 客户端  文本 {"type": "asr", "text", "latency_ms"}                   识别结果
+    服务端 → 客户端  二进制消息                                                   回复语音的 Opus 数据包
+    服务端 → 客户端  文本 {"type": "reply_end", "text", "packets", "first_packet_ms", "total_ms", "speculative"}
+    服务端 → 客户端  文本 {"type": "interrupted", "reason", "packets", "abandoned_tokens", "abandoned_audio_ms", "latency_ms"}
+                                                                              回复被打断，之后不再有本回合的数据包与 reply_end
+    服务端 → 客户端  文本 {"type": "error", "message"}
+
+打断（barge-in）：回复期间上行音频连续 barge_in_min_ms 毫秒的能量高于 barge_in_level_dbfs 时视为用户开口，
+取消当前回合的识别、LLM 流、TTS 合成与编码，等其释放资源后发送 interrupted；打断时的语音保留为下一句的开头。
+
+推测请求（speculative.enabled）：上传过程中每收到 partial_interval_ms 的新音频，对整句已收到的部分识别一次，
+部分结果稳定 stable_ms 后提前发起 LLM 请求（见 pipeline/speculative.py）；最终结果一致时沿用该请求，否则重新请求。
+
+命令行（在 ai_core 目录下执行）:
+    python -m gateway.voice_gateway [--host 127.0.0.1] [--port 8765] [--stub]
+"""
+
+import asyncio
+import contextvars
+import json
+import time
+
+import numpy as np
+import opuslib_next
+from websockets.asyncio.server import serve
+from websockets.exceptions import ConnectionClosed
+
+from audio_format.opus import Opus_Encoder
+from pipeline.speculative import SpeculativeLLM
+from pipeline.voice_pipeline import VoicePipeline
+from utils.metrics import metrics
+
+_DONE = object()
+
+
+class _VoiceConnection:
+    """
+    一个设备连接
+
+    上行数据包到达即解码并累积 PCM，收到 end 后启动一个回合（识别 → 流水线 → 下发），
+    同一连接的回合依次进行，回合任务即该对话的取消范围：打断或断开时取消它并等待其结束。
+    解码器在第一个音频包到达时才从上下文池租用、回合开始时归还，空闲连接只占用 WebSocket 本身的少量内存。
+    """
+
+    def __init__(self, gateway, websocket):
+        self.gateway = gateway
+        self.websocket = websocket
+        self._session = None
+        self._chunks = []
+        self._samples = 0
+        self._overflow = False
+        self._turn = None
+        self._progress = None
+        self._speech_ms = 0
+        self._speculator = None
+        self._partial = None
+        self._partial_samples = 0
+
+    async def run(self):
+        opus = self.gateway.opus
+        await self._send_json({
+            'type': "ready",
+            'sample_rate': opus.opus_sample_rate,
+            'channels': opus.opus_channel,
+            'frame_ms': opus.opus_frame_time,
+        })
+        async for message in self.websocket:
+            if isinstance(message, bytes):
+                await self._on_audio(message)
+            else:
+                await self._on_control(message)
+        if self._turn is not None:
+            await self._turn
+
+    async def _send_json(self, payload):
+        await self.websocket.send(json.dumps(payload, ensure_ascii=False))
+
+    async def _on_audio(self, packet):
+        if self._overflow:
+            return
+        if self._session is None:
+            self._session = self.gateway.opus.open_session()
+        try:
+            pcm = self._session.decode_packet(packet)
+        except opuslib_next.OpusError as e:
+            metrics.error("gateway.decode")
+            await self._send_json({'type': "error", 'message': f"Opus 解码失败: {e}"})
+            return
+        self._chunks.append(pcm)
+        self._samples += len(pcm)
+        if self._turn is not None and not self._turn.done():
+            if self.gateway.barge_in:
+                await self._detect_barge_in(pcm)
+        elif self.gateway.speculative:
+            self._schedule_partial()
+        if self._samples * 1000 > self.gateway.max_utterance_ms * self.gateway.opus.opus_sample_rate:
+            # 超长的一句只保留前 max_utterance_ms，其余丢弃直到 end
+            self._overflow = True
+            await self._send_json({'type': "error", 'message': f"单句音频超过 {self.gateway.max_utterance_ms}ms"})
+
+    async def _on_control(self, message):
+        try:
+            event = json.loads(message)
+        except ValueError:
+            await self._send_json({'type': "error", 'message': "无法解析的控制消息"})
+            return
+        kind = event.get("type") if isinstance(event, dict) else None
+        if kind == "end":
+            pcm = self._take_utterance()
+            if self._turn is not None:
+                # 上一回合下发完毕前不读取新消息，上行由 WebSocket 的接收队列与 TCP 窗口限流
+                await self._turn
+            # 上一回合正常结束时可能正处在一段检测中的语音里，计数不能带入新回合，否则会提前打断
+            self._speech_ms = 0
+            # 下发进度在创建任务时建立：任务开始运行前被取消时也能读取
+            self._progress = {'packets': 0, 'abandoned_tokens': 0, 'abandoned_packets': 0}
+            self._turn = asyncio.create_task(self._run_turn(pcm, self._progress))
+        elif kind == "reset":
+            self._take_utterance()
+            if self._speculator is not None:
+                self._speculator.cancel()
+        elif kind == "interrupt":
+            await self._interrupt("client")
+        else:
+            await self._send_json({'type': "error", 'message': f"未知的控制消息: {kind}"})
+
+    def _take_utterance(self):
+        """取出已累积的 PCM 并归还解码器"""
+        pcm = np.concatenate(self._chunks) if self._chunks else np.zeros(0, dtype=np.int16)
+        self._chunks = []
+        self._samples = 0
+        self._overflow = False
+        self._partial_samples = 0
+        if self._partial is not None:
+            # 这一句已结束，未完成的部分识别不再需要（排队中的请求不会推理）
+            self._partial.cancel()
+            self._partial = None
+        if self._session is not None:
+            self._session.close()
+            self._session = None
+        return pcm
+
+    def _schedule_partial(self):
+        """每收到 partial_interval_ms 的新音频，对整句已收到的部分识别一次（同一时间只有一个），结果交给推测器"""
+        gateway = self.gateway
+        if self._partial is not None and not self._partial.done():
+            return
+        if (self._samples - self._partial_samples) * 1000 < gateway.partial_interval_ms * gateway.opus.opus_sample_rate:
+            return
+        if self._speculator is None:
+            self._speculator = SpeculativeLLM(gateway.llm, gateway.speculative_config, gateway.speculation_stats)
+        self._partial_samples = self._samples
+        self._partial = asyncio.create_task(self._run_partial(np.concatenate(self._chunks)))
+
+    async def _run_partial(self, pcm):
+        try:
+            text = await self.gateway.transcribe(pcm)
+        except Exception:
+            metrics.error("gateway.partial_asr")
+            return
+        self._speculator.observe(text)
+
+    async def _detect_barge_in(self, pcm):
+        """回复期间上行音频的能量连续 barge_in_min_ms 高于阈值时打断"""
+        gateway = self.gateway
+        if not len(pcm) or np.sqrt(np.mean(np.square(pcm, dtype=np.float32))) < gateway.barge_in_rms:
+            self._speech_ms = 0
+            return
+        self._speech_ms += len(pcm) * 1000 // gateway.opus.opus_sample_rate
+        if self._speech_ms >= gateway.barge_in_min_ms:
+            await self._interrupt("speech")
+
+    async def _cancel_turn(self):
+        """取消进行中的回合并等待其结束（识别请求出队、LLM/TTS 流关闭、编解码上下文归还），返回其下发进度"""
+        turn, self._turn = self._turn, None
+        self._speech_ms = 0
+        if turn is None:
+            return None
+        turn.cancel()
+        await asyncio.wait([turn])
+        return self._progress
+
+    async def _interrupt(self, reason):
+        if self._turn is None or self._turn.done():
+            return
+        started = time.perf_counter()
+        progress = await self._cancel_turn()
+        latency = time.perf_counter() - started
+        self.gateway.stats['interrupted'] += 1
+        metrics.observe("gateway.barge_in", latency)
+        await self._send_json({
+            'type': "interrupted",
+            'reason': reason,
+            'packets': progress['packets'],
+            'abandoned_tokens': progress['abandoned_tokens'],
+            'abandoned_audio_ms': progress['abandoned_packets'] * self.gateway.opus.opus_frame_time,
+            'latency_ms': round(latency * 1000, 1),
+        })
+
+    async def _run_turn(self, pcm, progress):
+        gateway = self.gateway
+        ended = time.perf_counter()
+        try:
+            async with gateway.turn_slot():
+                with metrics.trace("gateway.turn", audio_ms=len(pcm) * 1000 // gateway.opus.opus_sample_rate):
+                    with metrics.span("gateway.turn"):
+                        await self._reply(pcm, ended, progress)
+        except ConnectionClosed:
+            pass
+        except Exception as e:
+            gateway.stats['errors'] += 1
+            try:
+                await self._send_json({'type': "error", 'message': f"{type(e).__name__}: {e}"})
+            except ConnectionClosed:
+                pass
+
+    async def _reply(self, pcm, ended, progress):
+        gateway = self.gateway
+        text = await gateway.transcribe(pcm) if len(pcm) else ""
+        await self._send_json({'type': "asr", 'text': text,
+                               'latency_ms': round((time.perf_counter() - ended) * 1000, 1)})
+        stats = {'text': "", 'packets': 0, 'first_packet_ms': None, 'total_ms': None, 'speculative': False}
+        # 用最终结果结算推测请求：一致时沿用，否则已被取消
+        speculation = self._speculator.take(text) if self._speculator is not None else None
+        if text.strip():
+            pipeline = VoicePipeline(gateway.llm, gateway.tts, gateway.pipeline_config, gateway.opus.opus_frame_time)
+            packets = asyncio.Queue(maxsize=gateway.send_queue_packets)
+            producer = asyncio.create_task(self._produce(pipeline, text, packets, speculation))
+            try:
+                while True:
+                    packet = await packets.get()
+                    if packet is _DONE:
+                        break
+                    # 客户端接收过慢时 send 在写缓冲区超过 write_limit 后等待，队列满后流水线随之暂停
+                    await asyncio.wait_for(self.websocket.send(packet), gateway.send_timeout)
+                    if stats['first_packet_ms'] is None:
+                        stats['first_packet_ms'] = round((time.perf_counter() - ended) * 1000, 1)
+                        metrics.observe("gateway.first_audio", stats['first_packet_ms'] / 1000, ended)
+                    stats['packets'] += 1
+                    progress['packets'] = stats['packets']
+                await producer
+            finally:
+                producer.cancel()
+                if speculation is not None:
+                    speculation.cancel()
+                # 被打断时等流水线取消完成（TTS 与编码资源已释放），再统计作废的 token 与音频
+                await asyncio.wait([producer])
+                self._count_abandoned(pipeline, packets, progress)
+            stats['text'] = pipeline.last_stats.get('text', "")
+            stats['speculative'] = speculation is not None
+        stats['total_ms'] = round((time.perf_counter() - ended) * 1000, 1)
+        gateway.stats['turns'] += 1
+        await self._send_json(dict(stats, type="reply_end"))
+
+    def _count_abandoned(self, pipeline, packets, progress):
+        """流水线内作废的部分由 VoicePipeline 记录指标，这里补上已生成但还在发送队列中的数据包"""
+        queued = 0
+        while not packets.empty():
+            queued += packets.get_nowait() is not _DONE
+        progress['abandoned_tokens'] = pipeline.last_stats.get('abandoned_tokens', 0)
+        progress['abandoned_packets'] = pipeline.last_stats.get('abandoned_packets', 0) + queued
+        metrics.abandoned("audio_seconds", queued * self.gateway.opus.opus_frame_time / 1000)
+
+    @staticmethod
+    async def _produce(pipeline, text, packets, speculation=None):
+        async for packet in pipeline.stream(text, speculation.tokens() if speculation is not None else None):
+            await packets.put(packet)
+        await packets.put(_DONE)
+
+    async def close(self):
+        await self._cancel_turn()
+        self._take_utterance()
+        if self._speculator is not None:
+            self._speculator.cancel()
+
+
+class VoiceGateway:
+    """
+    asyncio WebSocket 语音网关
+
+    背压与限额:
+        - 上行：每个连接的接收队列最多 max_inbound_queue 条消息，单条消息最大 max_message_bytes，
+          队列满时停止读取套接字，由 TCP 窗口反压到设备；单句音频最长 max_utterance_ms
+        - 下行：流水线与发送之间是容量为 send_queue_packets 的队列，单个数据包发送超过 send_timeout 秒视为失败
+        - 全局：同时进行识别与回复的回合数不超过 max_concurrent_turns，其余回合排队；连接数超过 max_connections 时拒绝
+    打断：barge_in 为 True 时按 barge_in_min_ms 与 barge_in_level_dbfs 检测回复期间的用户语音并取消当前回合
+    推测：speculative.enabled 为 True 时用部分识别结果提前发起 LLM 请求，命中统计汇总在 speculation_stats
+    关闭 permessage-deflate 压缩，空闲连接不分配压缩上下文。
+
+    asr 可以是 FunASRWrapper（在线程池中调用 pcm_to_text），也可以是提供 transcribe_async 的
+    ASRBatchScheduler / ASRWorkerPool。
+    """
+
+    def __init__(self, asr, llm, tts, config=None, pipeline_config=None):
+        config = config or {}
+        self.asr = asr
+        self.llm = llm
+        self.tts = tts
+        self.pipeline_config = pipeline_config or {}
+        self.host = config.get("host", "127.0.0.1")
+        self.port = int(config.get("port", 8765))
+        self.max_connections = int(config.get("max_connections", 10000))
+        self.max_concurrent_turns = int(config.get("max_concurrent_turns", 32))
+        self.max_utterance_ms = int(config.get("max_utterance_ms", 30000))
+        self.max_message_bytes = int(config.get("max_message_bytes", 4096))
+        self.max_inbound_queue = int(config.get("max_inbound_queue", 16))
+        self.send_queue_packets = int(config.get("send_queue_packets", 32))
+        self.send_timeout = float(config.get("send_timeout", 10))
+        self.ping_interval = config.get("ping_interval", 30)
+        self.barge_in = bool(config.get("barge_in", True))
+        self.barge_in_min_ms = int(config.get("barge_in_min_ms", 180))
+        self.barge_in_rms = 32768 * 10 ** (float(config.get("barge_in_level_dbfs", -35)) / 20)
+        self.speculative_config = config.get("speculative") or {}
+        self.speculative = bool(self.speculative_config.get("enabled", False)) \
+            and hasattr(llm, "generate_response_stream_async")
+        self.partial_interval_ms = int(self.speculative_config.get("partial_interval_ms", 300))
+        self.speculation_stats = SpeculativeLLM.new_stats()
+        self.opus = Opus_Encoder()
+
+        self.stats = {'connections': 0, 'connections_total': 0, 'rejected': 0, 'turns': 0, 'interrupted': 0,
+                      'errors': 0}
+        self._waiting_turns = 0
+        self._turn_semaphore = None
+        self._server = None
+
+    @property
+    def url(self):
+        return f"ws://{self.host}:{self.port}"
+
+    def turn_slot(self):
+        """回合并发限额（在事件循环中首次使用时创建）"""
+        if self._turn_semaphore is None:
+            self._turn_semaphore = asyncio.Semaphore(self.max_concurrent_turns)
+        return _TurnSlot(self)
+
+    async def transcribe(self, pcm):
+        if hasattr(self.asr, "transcribe_async"):
+            return await self.asr.transcribe_async(pcm)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, contextvars.copy_context().run, self.asr.pcm_to_text, pcm)
+
+    async def _handle(self, websocket):
+        if self.stats['connections'] >= self.max_connections:
+            self.stats['rejected'] += 1
+            await websocket.close(1013, "server busy")
+            return
+        self.stats['connections'] += 1
+        self.stats['connections_total'] += 1
+        connection = _VoiceConnection(self, websocket)
+        try:
+            await connection.run()
+        except ConnectionClosed:
+            pass
+        finally:
+            await connection.close()
+            self.stats['connections'] -= 1
+
+    def _connection_count(self):
+        return self.stats['connections']
+
+    def _waiting_turn_count(self):
+        return self._waiting_turns
+
+    async def start(self):
+        self._server = await serve(
+            self._handle, self.host, self.port,
+            max_size=self.max_message_bytes,
+            max_queue=self.max_inbound_queue,
+            compression=None,
+            ping_interval=self.ping_interval,
+            ping_timeout=self.ping_interval,
+        )
+        self.port = self._server.sockets[0].getsockname()[1]
+        metrics.track_connections("gateway", self._connection_count)
+        metrics.track_queue("gateway_turns", self._waiting_turn_count)
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def serve_forever(self):
+        await self.start()
+        print(f"语音网关已启动: {self.url}")
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.stop()
+
+
+class _TurnSlot:
+    """占用一个回合名额，排队期间计入 gateway_turns 队列深度"""
+
+    def __init__(self, gateway):
+        self.gateway = gateway
+
+    async def __aenter__(self):
+        self.gateway._waiting_turns += 1
+        try:
+            await self.gateway._turn_semaphore.acquire()
+        finally:
+            self.gateway._waiting_turns -= 1
+
+    async def __aexit__(self, *exc):
+        self.gateway._turn_semaphore.release()
+
+
+async def _serve(config, stub=False):
+    gateway_config = config.get("Gateway") or {}
+    pipeline_config = config.get("Pipeline")
+    if stub:
+        # 本地替身：桩 LLM 服务 + FakeTTS + FakeASR，不加载模型、不访问网络，用于压测网关本身
+        from benchmark.fake_asr import FakeASR
+        from benchmark.fake_tts import FakeTTS
+        from llm.chatglm import ChatGLM_LLM
+        from llm.stub_server import StubLLMServer
+
+        async with StubLLMServer() as server:
+            llm = ChatGLM_LLM({"model_name": "stub", "api_key": "stub", "url": server.url})
+            gateway = VoiceGateway(FakeASR(), llm, FakeTTS(), gateway_config, pipeline_config)
+            await gateway.serve_forever()
+        return
+
+    from asr.batch_scheduler import ASRBatchScheduler
+    from utils.registry import registry
+
+    asr_config = config.get("ASR").get("FunASR")
+    asr = registry.create(asr_config, "ASR")
+    pool_config = asr_config.get("worker_pool") or {}
+    if pool_config.get("enabled"):
+        # 多进程推理：父进程不做推理，各推理进程 fork 后自行预热
+        from asr.worker_pool import ASRWorkerPool
+        asr = ASRWorkerPool(asr, pool_config)
+    else:
+        registry.warmup(asr, "ASR", background=False)
+        if gateway_config.get("asr_batch", True):
+            # 多个连接的识别请求合并为批量推理
+            asr = ASRBatchScheduler(asr, asr_config.get("batch_scheduler"))
+    llm = registry.create(config.get("LLM").get("ChatGLM"), "LLM")
+    tts = registry.create(config.get("TTS").get("EdgeTTS"), "TTS")
+    print(registry.format_timing_report())
+    await VoiceGateway(asr, llm, tts, gateway_config, pipeline_config).serve_forever()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    import yaml
+
+    from utils.util import Util
+
+    parser = argparse.ArgumentParser(description='CyberAI WebSocket 语音网关')
+    parser.add_argument('--config_path', type=str, default=Util.get_config_file_path(), help='配置文件路径')
+    parser.add_argument('--host', type=str, default=None, help='监听地址（默认使用配置 Gateway.host）')
+    parser.add_argument('--port', type=int, default=None, help='监听端口（默认使用配置 Gateway.port）')
+    parser.add_argument('--stub', action='store_true', help='使用本地替身（桩 LLM、FakeTTS、FakeASR）')
+
+    args = parser.parse_args()
+    with open(args.config_path, "r", encoding="utf-8") as file:
+        config = yaml.safe_load(file)
+    gateway_config = dict(config.get("Gateway") or {})
+    if args.host:
+        gateway_config["host"] = args.host
+    if args.port is not None:
+        gateway_config["port"] = args.port
+    config["Gateway"] = gateway_config
+    metrics.configure(config.get("Metrics"))
+    Opus_Encoder().configure(config.get("Opus"))
+    try:
+        asyncio.run(_serve(config, args.stub))
+    except KeyboardInterrupt:
+        pass
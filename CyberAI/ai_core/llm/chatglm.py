@@ -1,6 +1,16 @@
-from openai import OpenAI
+import asyncio
+import time
+import weakref
+
+import httpx
+from openai import AsyncOpenAI, OpenAI
+
+from utils.metrics import metrics
 
 class ChatGLM_LLM:
+    # 按事件循环共享的 AsyncOpenAI 客户端：httpx 连接池与事件循环绑定，不能跨循环复用
+    _async_clients = weakref.WeakKeyDictionary()
+
     def __init__(self, config):
 
         self.model_name = config.get("model_name")
@@ -8,14 +18,135 @@ class ChatGLM_LLM:
         self.url = config.get("url")
         self.client = OpenAI(api_key=self.api_key, base_url=self.url)
 
-    def generate_response(self, user_input):
-        dialogue = [
+        # 异步客户端的超时与连接池参数
+        self.timeout = float(config.get("timeout", 60))
+        self.max_connections = int(config.get("max_connections", 200))
+        self.max_keepalive_connections = int(config.get("max_keepalive_connections", 50))
+        self.keepalive_expiry = float(config.get("keepalive_expiry", 30))
+
+    def _build_dialogue(self, user_input):
+        return [
         {"role": "system", "content": "你是一个台湾女孩"},
         {"role": "user", "content": user_input},
         ]
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=dialogue,
-        )
+
+    def generate_response(self, user_input):
+        dialogue = self._build_dialogue(user_input)
+        with metrics.span("llm"):
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+            )
         return response.choices[0].message.content
 
+    def generate_response_stream(self, user_input):
+        """流式生成响应，逐个 yield 增量文本"""
+        dialogue = self._build_dialogue(user_input)
+        with metrics.span("llm"):
+            started = time.perf_counter()
+            first = True
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=dialogue,
+                stream=True,
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if first:
+                        metrics.observe("llm.first_token", time.perf_counter() - started, started)
+                        first = False
+                    yield delta
+
+    def _get_async_client(self) -> AsyncOpenAI:
+        """获取当前事件循环下共享的 AsyncOpenAI 客户端（同一 url/api_key 共用一个连接池）"""
+        loop = asyncio.get_running_loop()
+        clients = ChatGLM_LLM._async_clients.setdefault(loop, {})
+        key = (self.url, self.api_key)
+        client = clients.get(key)
+        if client is None:
+            http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=min(self.timeout, 10.0)),
+            )
+            client = AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.url,
+                http_client=http_client,
+                max_retries=0,
+            )
+            clients[key] = client
+        return client
+
+    async def generate_response_stream_async(self, user_input, timeout=None):
+        """
+        异步流式生成响应，逐个 yield 增量文本
+
+        参数:
+            user_input: 用户输入
+            timeout: 整个请求（含全部流式输出）的超时秒数，默认使用配置中的 timeout
+
+        任务被取消或超时时会立即关闭底层 HTTP 流。
+        """
+        client = self._get_async_client()
+        loop = asyncio.get_running_loop()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = loop.time() + timeout
+
+        def remaining():
+            left = deadline - loop.time()
+            if left <= 0:
+                raise asyncio.TimeoutError()
+            return left
+
+        started = time.perf_counter()
+        first = True
+        with metrics.span("llm"):
+            try:
+                left = remaining()
+                stream = await asyncio.wait_for(
+                    client.chat.completions.create(
+                        model=self.model_name,
+                        messages=self._build_dialogue(user_input),
+                        stream=True,
+                        timeout=timeout,
+                    ),
+                    left,
+                )
+                try:
+                    chunks = stream.__aiter__()
+                    while True:
+                        try:
+                            left = remaining()
+                            chunk = await asyncio.wait_for(chunks.__anext__(), left)
+                        except StopAsyncIteration:
+                            break
+                        if not chunk.choices:
+                            continue
+                        delta = chunk.choices[0].delta.content
+                        if delta:
+                            if first:
+                                metrics.observe("llm.first_token", time.perf_counter() - started, started)
+                                first = False
+                            yield delta
+                finally:
+                    await stream.close()
+            except asyncio.TimeoutError:
+                raise asyncio.TimeoutError(f"LLM 请求超时（{timeout}s）") from None
+
+    async def generate_response_async(self, user_input, timeout=None):
+        """异步生成完整响应"""
+        return "".join([delta async for delta in self.generate_response_stream_async(user_input, timeout)])
+
+    @classmethod
+    async def close_async_clients(cls):
+        """关闭当前事件循环下的共享异步客户端及其连接池"""
+        clients = cls._async_clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            await client.close()
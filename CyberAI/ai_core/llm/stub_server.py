@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+本地 OpenAI 兼容桩服务
+功能：模拟 /chat/completions 接口（含 stream=True 的 SSE 输出），
+      用于在不访问真实 ChatGLM API 的情况下测试和压测 ChatGLM_LLM
+"""
+
+import asyncio
+import json
+import time
+import uuid
+
+
+class StubLLMServer:
+    """OpenAI 兼容的本地桩服务，支持 HTTP keep-alive 与流式输出"""
+
+    def __init__(self, host="127.0.0.1", port=0, reply="你好，我是本地测试助手。很高兴认识你！",
+                 first_token_delay=0.05, token_delay=0.01, chars_per_token=2):
+        """
+        参数:
+            host/port: 监听地址，port 为 0 时自动分配
+            reply: 固定回复文本
+            first_token_delay: 首个 token 前的延迟（秒）
+            token_delay: 后续每个 token 之间的延迟（秒）
+            chars_per_token: 每个流式增量包含的字符数
+        """
+        self.host = host
+        self.port = port
+        self.reply = reply
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.chars_per_token = chars_per_token
+        self.requests = 0
+        self.connections = 0
+        # 当前仍打开的连接数，用于检查客户端是否泄漏连接
+        self.open_connections = 0
+        self._server = None
+
+    @property
+    def url(self):
+        """可直接作为 ChatGLM_LLM 配置中 url 的地址"""
+        return f"http://{self.host}:{self.port}/v1"
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+    async def _handle_connection(self, reader, writer):
+        self.connections += 1
+        self.open_connections += 1
+        try:
+            # 同一连接上循环处理请求（keep-alive）
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, value = line.decode("latin-1").split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+                self.requests += 1
+
+                if method == "POST" and path.rstrip("/").endswith("/chat/completions"):
+                    await self._chat_completions(writer, json.loads(body or b"{}"))
+                else:
+                    await self._send_json(writer, 404, {"error": {"message": f"unknown path {path}"}})
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, asyncio.CancelledError):
+            # 客户端断开或服务关闭
+            pass
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def _send_json(self, writer, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: keep-alive\r\n\r\n".encode("latin-1") + data
+        )
+        await writer.drain()
+
+    async def _chat_completions(self, writer, request):
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        model = request.get("model", "stub")
+        created = int(time.time())
+
+        if not request.get("stream"):
+            await asyncio.sleep(self.first_token_delay + self.token_delay * len(self._tokens()))
+            await self._send_json(writer, 200, {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": self.reply},
+                             "finish_reason": "stop"}],
+            })
+            return
+
+        writer.write(
+            b"HTTP/1.1 200 OK\r\n"
+            b"Content-Type: text/event-stream\r\n"
+            b"Transfer-Encoding: chunked\r\n"
+            b"Connection: keep-alive\r\n\r\n"
+        )
+
+        async def send_event(data):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            writer.write(f"{len(payload):x}\r\n".encode("latin-1") + payload + b"\r\n")
+            await writer.drain()
+
+        await asyncio.sleep(self.first_token_delay)
+        tokens = self._tokens()
+        for index, token in enumerate(tokens):
+            if index:
+                await asyncio.sleep(self.token_delay)
+            await send_event(json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"role": "assistant", "content": token},
+                             "finish_reason": "stop" if index == len(tokens) - 1 else None}],
+            }, ensure_ascii=False))
+        await send_event("[DONE]")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    def _tokens(self):
+        step = max(1, self.chars_per_token)
+        return [self.reply[i:i + step] for i in range(0, len(self.reply), step)]
+
+
+# 命令行支持
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='启动本地 OpenAI 兼容桩服务')
+    parser.add_argument('--host', type=str, default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8766, help='监听端口 (默认: 8766，避免与网关默认端口 8765 冲突)')
+    parser.add_argument('--reply', type=str, default=None, help='固定回复文本')
+    parser.add_argument('--first-token-delay', type=float, default=0.05, help='首 token 延迟秒数')
+    parser.add_argument('--token-delay', type=float, default=0.01, help='token 间隔秒数')
+    args = parser.parse_args()
+
+    async def _serve():
+        kwargs = {'reply': args.reply} if args.reply else {}
+        server = StubLLMServer(args.host, args.port, first_token_delay=args.first_token_delay,
+                               token_delay=args.token_delay, **kwargs)
+        await server.start()
+        print(f"桩服务已启动: {server.url}")
+        await server._server.serve_forever()
+
+    asyncio.run(_serve())
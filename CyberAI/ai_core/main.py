@@ -1,10 +1,10 @@
 import os
 import asyncio
-from asr.funasr.funasr_wrapper import FunASRWrapper
 from utils.util import Util
-from llm.chatglm import ChatGLM_LLM
-from tts.edge import Edge_TTS
+from utils.registry import registry
+from utils.metrics import metrics
 from audio_format.opus import Opus_Encoder
+from pipeline.voice_pipeline import VoicePipeline
 
 if __name__ == "__main__":
     
@@ -16,28 +16,30 @@ if __name__ == "__main__":
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # 创建 LLM 对象
-    llm = ChatGLM_LLM(config.get("LLM").get("ChatGLM"))
-    resource = llm.generate_response("你好，你是谁？请用粤语回答")
-    print(resource)
+    # 各阶段耗时、RTF、错误数与请求追踪，导出在本地 HTTP 端口上
+    metrics.configure(config.get("Metrics"))
 
-    # 创建 TTS 对象并合成语音
-    tts = Edge_TTS(config.get("TTS").get("EdgeTTS"))
-    output_file = asyncio.run(tts.text_to_speech(resource,  Util.get_process_dir() + "output" + os.sep + "test.mp3"))
-    os.system(f'start {Util.get_process_dir() + "output" + os.sep + "test.mp3"}')
+    # Opus 编码档位（帧时长、应用类型、码率控制），须在创建编码会话之前设置
+    Opus_Encoder().configure(config.get("Opus"))
 
-    # 创建 FunASR 对象并进行语音识别
-    fun_asr = FunASRWrapper(config.get("ASR").get("FunASR"))
-    resource = fun_asr.audio_file_to_text(Util.get_process_dir() + "output" + os.sep + "test.mp3")
-    print(resource)
+    # 组件按配置中的 type 延迟导入；ASR 模型在后台加载并对静音预热，与下面的 LLM/TTS 并行
+    asr_future = registry.preload(config.get("ASR").get("FunASR"), "ASR")
 
-    # 将 mp3 转换为 opus 数据包
+    # 创建 LLM、TTS 对象，流式生成回复语音：LLM 按句输出，每句立即合成并编码为 opus 数据包
+    llm = registry.create(config.get("LLM").get("ChatGLM"), "LLM")
+    tts = registry.create(config.get("TTS").get("EdgeTTS"), "TTS")
     opus = Opus_Encoder()
-    input_file = Util.get_process_dir() + "output" + os.sep + "test.mp3"  # 可以是 .mp3, .wav, .flac, .m4a 等
-    opus_data, duration = opus.audio_to_opus(input_file)
-    print(f"转换完成，共 {len(opus_data)} 个 Opus 数据包，音频时长 {duration}ms")
+    pipeline = VoicePipeline(llm, tts, config.get("Pipeline"), opus.opus_frame_time)
+    opus_data = asyncio.run(pipeline.run("你好，你是谁？请用粤语回答"))
+    stats = pipeline.last_stats
+    print(stats['text'])
+    print(f"转换完成，共 {len(opus_data)} 个 Opus 数据包，{stats['sentences']} 句，"
+          f"首个数据包延迟 {stats['first_packet_ms']:.0f}ms，总耗时 {stats['total_ms']:.0f}ms")
     opus.save_opus_raw_custom(opus_data,  Util.get_process_dir() + "output" + os.sep + "test.opus")
 
+    fun_asr = asr_future.result()
+    print(registry.format_timing_report())
+
     # 将 opus 数据包转换回 wav 文件
     # opus.opus_to_wav_file(Util.get_process_dir() + "output" + os.sep + "test.wav", opus.load_opus_raw_custom(Util.get_process_dir() + "output" + os.sep + "test.opus"))
 
@@ -0,0 +1,156 @@
+import asyncio
+import re
+import time
+
+from utils.metrics import metrics
+
+_IGNORED = re.compile(r"[\W_]+")
+
+
+def normalize_transcript(text):
+    """比较识别结果时忽略空白、标点与大小写"""
+    return _IGNORED.sub("", text or "").lower()
+
+
+class _Speculation:
+    """一次推测的 LLM 请求：增量缓存在内存中，命中后由 tokens() 回放并接着读取同一请求"""
+
+    def __init__(self, llm, text, key):
+        self.text = text
+        self.key = key
+        self.started = time.perf_counter()
+        self.first_token = None
+        self.deltas = []
+        self.done = False
+        self.error = None
+        self._changed = asyncio.Event()
+        self.task = asyncio.create_task(self._run(llm))
+
+    async def _run(self, llm):
+        try:
+            async for delta in llm.generate_response_stream_async(self.text):
+                if self.first_token is None:
+                    self.first_token = time.perf_counter()
+                self.deltas.append(delta)
+                self._changed.set()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            self._changed.set()
+
+    async def tokens(self):
+        index = 0
+        try:
+            while True:
+                if index < len(self.deltas):
+                    index += 1
+                    yield self.deltas[index - 1]
+                    continue
+                if self.done:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                self._changed.clear()
+                await self._changed.wait()
+        finally:
+            self.cancel()
+
+    def cancel(self):
+        """停止请求（已结束时无操作），用于调用方提前停止或回合被取消"""
+        self.task.cancel()
+
+
+class SpeculativeLLM:
+    """
+    根据稳定的部分识别结果提前发起 LLM 请求
+
+    识别过程中反复调用 observe(partial)：同一文本（忽略标点与空白）保持 stable_ms 毫秒不变时，
+    以该文本发起流式 LLM 请求，增量缓存在内存中（不合成语音）；部分结果之后改变则取消该请求。
+    得到最终识别结果后调用 take(final)：与推测的文本一致（命中）时返回推测请求，其 tokens() 先回放
+    已缓存的增量、再接着读取同一请求；不一致（未命中）时取消推测请求并返回 None，由调用方按最终文本重新请求。
+
+    命中时节省的首 token 延迟按 min(得到最终结果时推测请求已进行的时长, 推测请求的首 token 延迟) 计算；
+    命中率、节省的延迟与作废的 token 数见 get_stats() 与 cyberai_speculation_* 指标。
+    LLM 需提供 generate_response_stream_async（如 ChatGLM_LLM）。
+    """
+
+    def __init__(self, llm, config=None, stats=None):
+        """
+        参数:
+            stats: 可选的共享统计 dict（如网关汇总所有连接），默认每个实例单独统计
+        """
+        config = config or {}
+        self.llm = llm
+        self.stable_ms = float(config.get("stable_ms", 400))
+        self.min_chars = int(config.get("min_chars", 2))
+        self.stats = stats if stats is not None else self.new_stats()
+        self._key = None
+        self._stable_since = None
+        self._speculation = None
+
+    @staticmethod
+    def new_stats():
+        return {'started': 0, 'hits': 0, 'misses': 0, 'cancelled': 0, 'saved_ms': 0.0, 'wasted_tokens': 0}
+
+    def observe(self, partial, now=None):
+        """送入一次部分识别结果，文本稳定足够久时发起推测请求"""
+        now = time.perf_counter() if now is None else now
+        key = normalize_transcript(partial)
+        if key != self._key:
+            self._key, self._stable_since = key, now
+            if self._speculation is not None and self._speculation.key != key:
+                self._discard("cancelled")
+            return
+        if (self._speculation is None and len(key) >= self.min_chars
+                and (now - self._stable_since) * 1000 >= self.stable_ms):
+            self._speculation = _Speculation(self.llm, partial, key)
+            self.stats['started'] += 1
+
+    def take(self, final):
+        """
+        用最终识别结果结算当前推测，之后开始新一句
+
+        返回值:
+            命中时为推测请求（用 tokens() 读取增量，不再需要时调用 cancel()），否则为 None
+        """
+        speculation = self._speculation
+        self._key = self._stable_since = None
+        if speculation is None:
+            return None
+        if speculation.key != normalize_transcript(final) or speculation.error is not None:
+            self._discard("misses")
+            return None
+        self._speculation = None
+        elapsed = time.perf_counter() - speculation.started
+        if speculation.first_token is not None:
+            elapsed = min(elapsed, speculation.first_token - speculation.started)
+        self.stats['hits'] += 1
+        self.stats['saved_ms'] += elapsed * 1000
+        metrics.speculation("hit", saved_seconds=elapsed)
+        return speculation
+
+    def cancel(self):
+        """丢弃当前推测（如客户端 reset、连接关闭）"""
+        self._key = self._stable_since = None
+        if self._speculation is not None:
+            self._discard("cancelled")
+
+    def _discard(self, outcome):
+        speculation, self._speculation = self._speculation, None
+        speculation.cancel()
+        wasted = len(speculation.deltas)
+        self.stats[outcome] += 1
+        self.stats['wasted_tokens'] += wasted
+        metrics.speculation("miss" if outcome == "misses" else "cancelled", wasted_tokens=wasted)
+
+    def get_stats(self):
+        """
+        返回值:
+            dict：started、hits、misses、cancelled、saved_ms、wasted_tokens，以及 hit_rate（命中数 / 发起数）
+            与 avg_saved_ms（每次命中平均节省的首 token 延迟）
+        """
+        stats = dict(self.stats)
+        stats['hit_rate'] = stats['hits'] / stats['started'] if stats['started'] else None
+        stats['avg_saved_ms'] = stats['saved_ms'] / stats['hits'] if stats['hits'] else None
+        return stats
@@ -0,0 +1,269 @@
+import asyncio
+import contextvars
+import threading
+import time
+
+from audio_format.opus_profile import PROFILES
+from utils.metrics import metrics
+
+
+class SentenceSplitter:
+    """按标点将流式 LLM 增量文本切分为句子"""
+
+    DEFAULT_PUNCTUATIONS = "。！？，；!?,;\n"
+
+    def __init__(self, punctuations=None, min_chars=2):
+        self.punctuations = set(punctuations or self.DEFAULT_PUNCTUATIONS)
+        # 去掉标点后不足 min_chars 个字符的片段并入下一句，避免过碎的 TTS 请求
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def _is_boundary(self, text, index):
+        ch = text[index]
+        if ch in self.punctuations:
+            return True
+        # 英文句点只在后跟空白时断句，避免切开 3.14 之类的数字
+        return ch == "." and index + 1 < len(text) and text[index + 1].isspace()
+
+    def _content_length(self, text):
+        return len(text.strip("".join(self.punctuations) + ". \t"))
+
+    def feed(self, text):
+        """追加增量文本，返回已完整的句子列表"""
+        self._buffer += text
+        sentences = []
+        start = 0
+        for index in range(len(self._buffer)):
+            if not self._is_boundary(self._buffer, index):
+                continue
+            candidate = self._buffer[start:index + 1].strip()
+            if self._content_length(candidate) >= self.min_chars:
+                sentences.append(candidate)
+                start = index + 1
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self):
+        """返回缓冲区中剩余的文本（没有结尾标点的最后一句）"""
+        tail = self._buffer.strip()
+        self._buffer = ""
+        return tail if self._content_length(tail) > 0 else None
+
+
+class VoicePipeline:
+    """
+    LLM→TTS→Opus 流式流水线
+
+    LLM 边生成边按句切分，每句立即提交 TTS 合成（最多 max_tts_concurrency 句并行），
+    Opus 数据包按句子顺序输出，首句音频就绪即可开始播放，无需等待完整回复。
+
+    调用方提前停止迭代或取消所在任务（如用户打断）时，LLM 流、各句 TTS 合成与编码一并取消，
+    并等到它们释放网络流、解码子进程与编码器上下文后才返回；已生成但未交付的 token 数与音频
+    记入 last_stats（abandoned_tokens、abandoned_packets）与 cyberai_abandoned_total 指标。
+    """
+
+    def __init__(self, llm, tts, config=None, frame_ms=None):
+        """
+        参数:
+            frame_ms: TTS 输出数据包的帧时长（Opus 档位），用于换算作废的音频时长，默认为 default 档位
+        """
+        config = config or {}
+        self.llm = llm
+        self.tts = tts
+        self.frame_ms = frame_ms or PROFILES["default"].frame_ms
+        self.max_tts_concurrency = int(config.get("max_tts_concurrency", 3))
+        self.min_sentence_chars = int(config.get("min_sentence_chars", 2))
+        self.last_stats = {}
+
+    async def _iterate_in_thread(self, make_iterator):
+        """在线程池中运行同步迭代器，将结果逐个转交给事件循环"""
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        stop = threading.Event()
+        done = object()
+
+        def put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, (item, error))
+            except RuntimeError:
+                # 事件循环已关闭
+                stop.set()
+
+        def produce():
+            iterator = make_iterator()
+            try:
+                for item in iterator:
+                    if stop.is_set():
+                        break
+                    put(item)
+            except Exception as e:
+                put(done, e)
+                return
+            finally:
+                # 提前停止时关闭生成器，使其释放子进程、网络流等资源
+                if hasattr(iterator, "close"):
+                    iterator.close()
+            put(done)
+
+        # 线程池不会继承 contextvars，显式复制以便线程内的 span 记入当前请求的追踪
+        worker = loop.run_in_executor(None, contextvars.copy_context().run, produce)
+        try:
+            while True:
+                item, error = await queue.get()
+                if item is done:
+                    if error is not None:
+                        raise error
+                    break
+                yield item
+            await worker
+        finally:
+            stop.set()
+
+    def _iter_tokens(self, user_input):
+        if hasattr(self.llm, "generate_response_stream_async"):
+            # 异步流式客户端：取消时直接关闭 HTTP 流，不占用线程
+            return self.llm.generate_response_stream_async(user_input)
+        return self._iterate_in_thread(lambda: self.llm.generate_response_stream(user_input))
+
+    async def _synthesize_sentence(self, sentence, packet_queue, semaphore, stats):
+        """合成一句语音并将 Opus 数据包依次放入 packet_queue，以 None 结束"""
+        try:
+            async with semaphore:
+                # 合成过程中即逐包转交，首句不必等整句合成完毕
+                async for packet in self.tts.text_to_opus_stream(sentence):
+                    stats['synthesized_packets'] += 1
+                    packet_queue.put_nowait(packet)
+            packet_queue.put_nowait(None)
+        except Exception as e:
+            packet_queue.put_nowait(e)
+
+    async def stream(self, user_input, tokens=None):
+        """
+        流式输出回复语音的 Opus 数据包（按句子顺序）；每次调用建立一个追踪，TTS 等阶段的 span 记入其中
+
+        tokens 为已有的 LLM 增量流（如命中的推测请求），为 None 时按 user_input 请求 LLM
+        """
+        # 生成器在 yield 之间运行于调用方的上下文，不能在这里设置当前追踪（会泄漏到调用方）；
+        # 追踪只在 LLM / TTS 任务所在的复制上下文中生效。已有追踪时（如网关回合）沿用外层追踪
+        outer = metrics.current_trace()
+        trace = outer if outer is not None else metrics.new_trace("pipeline")
+        packets = self._stream(user_input, tokens, trace)
+        exc_type = None
+        try:
+            async for packet in packets:
+                yield packet
+        except BaseException as e:
+            exc_type = type(e)
+            raise
+        finally:
+            # 调用方提前停止时立即取消 LLM 与 TTS 任务
+            await packets.aclose()
+            stats = self.last_stats
+            if trace is not None and stats:
+                trace.attributes.update(sentences=stats['sentences'], packets=stats['packets'])
+                if stats['cancelled']:
+                    trace.attributes.update(cancelled=True, abandoned_tokens=stats['abandoned_tokens'],
+                                            abandoned_packets=stats['abandoned_packets'])
+            if trace is not None and outer is None:
+                metrics.finish_trace(trace, exc_type)
+
+    async def _stream(self, user_input, tokens=None, trace=None):
+        started = time.perf_counter()
+        # LLM 与各句 TTS 任务在持有追踪的复制上下文中创建，其中的 span 记入 trace
+        context = metrics.trace_context(trace)
+        stats = {
+            'text': "",
+            'speculative': tokens is not None,
+            'tokens': 0,
+            'sentences': 0,
+            'packets': 0,
+            'synthesized_packets': 0,
+            'first_token_ms': None,
+            'first_sentence_ms': None,
+            'first_packet_ms': None,
+            'total_ms': None,
+            'cancelled': False,
+            'abandoned_tokens': 0,
+            'abandoned_packets': 0,
+        }
+        self.last_stats = stats
+        # 第 i 句结束时已收到的 token 数，用于计算打断时作废的 token
+        sentence_tokens = []
+        delivered = 0
+
+        sentence_queues = asyncio.Queue()
+        semaphore = asyncio.Semaphore(self.max_tts_concurrency)
+        tasks = []
+
+        def schedule(sentence):
+            if stats['first_sentence_ms'] is None:
+                stats['first_sentence_ms'] = (time.perf_counter() - started) * 1000
+            stats['sentences'] += 1
+            sentence_tokens.append(stats['tokens'])
+            packet_queue = asyncio.Queue()
+            # 在 produce 任务中调用，新任务继承其（持有追踪的）上下文
+            tasks.append(asyncio.create_task(self._synthesize_sentence(sentence, packet_queue, semaphore, stats)))
+            sentence_queues.put_nowait(packet_queue)
+
+        async def produce():
+            splitter = SentenceSplitter(min_chars=self.min_sentence_chars)
+            try:
+                async for delta in tokens if tokens is not None else self._iter_tokens(user_input):
+                    if stats['first_token_ms'] is None:
+                        stats['first_token_ms'] = (time.perf_counter() - started) * 1000
+                        metrics.observe("pipeline.first_token", stats['first_token_ms'] / 1000, started)
+                    stats['text'] += delta
+                    stats['tokens'] += 1
+                    for sentence in splitter.feed(delta):
+                        schedule(sentence)
+                tail = splitter.flush()
+                if tail:
+                    schedule(tail)
+            finally:
+                sentence_queues.put_nowait(None)
+
+        producer = context.run(asyncio.create_task, produce())
+        try:
+            while True:
+                packet_queue = await sentence_queues.get()
+                if packet_queue is None:
+                    break
+                while True:
+                    item = await packet_queue.get()
+                    if item is None:
+                        delivered += 1
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    if stats['first_packet_ms'] is None:
+                        stats['first_packet_ms'] = (time.perf_counter() - started) * 1000
+                        metrics.observe("pipeline.first_audio", stats['first_packet_ms'] / 1000, started, trace=trace)
+                    stats['packets'] += 1
+                    yield item
+            # LLM 出错时在此抛出
+            await producer
+            stats['total_ms'] = (time.perf_counter() - started) * 1000
+            metrics.observe("pipeline.total", stats['total_ms'] / 1000, started, trace=trace)
+        except BaseException as e:
+            # 调用方 aclose() 或所在任务被取消（不是异常）
+            stats['cancelled'] = not isinstance(e, Exception)
+            raise
+        finally:
+            producer.cancel()
+            for task in tasks:
+                task.cancel()
+            # 等待取消完成：TTS 网络流、解码子进程与编码器上下文在返回前释放，而不是留给之后的事件循环
+            await asyncio.gather(producer, *tasks, return_exceptions=True)
+            if stats['cancelled']:
+                self._record_abandoned(stats, sentence_tokens[delivered - 1] if delivered else 0)
+
+    def _record_abandoned(self, stats, delivered_tokens):
+        stats['abandoned_tokens'] = stats['tokens'] - delivered_tokens
+        stats['abandoned_packets'] = stats['synthesized_packets'] - stats['packets']
+        metrics.abandoned("replies")
+        metrics.abandoned("tokens", stats['abandoned_tokens'])
+        metrics.abandoned("audio_seconds", stats['abandoned_packets'] * self.frame_ms / 1000)
+
+    async def run(self, user_input):
+        """收集完整回复的 Opus 数据包列表"""
+        return [packet async for packet in self.stream(user_input)]
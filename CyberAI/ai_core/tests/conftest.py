@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 模块按 ai_core 目录下的绝对路径导入（如 from llm.chatglm import ...）
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,99 @@
+"""
+ChatGLM_LLM 异步流式客户端对本地桩服务（llm/stub_server.py）的测试：流式输出、超时、取消后关闭流且不泄漏连接
+
+在 ai_core 目录下执行: python -m pytest tests
+"""
+
+import asyncio
+import time
+
+import pytest
+
+from llm.chatglm import ChatGLM_LLM
+from llm.stub_server import StubLLMServer
+
+REPLY = "你好，我是本地测试助手。很高兴认识你！"
+
+
+def make_llm(server, **config):
+    return ChatGLM_LLM(dict({"model_name": "stub", "api_key": "test", "url": server.url}, **config))
+
+
+async def wait_until(predicate, timeout=2.0):
+    deadline = time.perf_counter() + timeout
+    while not predicate():
+        if time.perf_counter() > deadline:
+            return False
+        await asyncio.sleep(0.01)
+    return True
+
+
+def test_stream_yields_reply_in_order():
+    async def run():
+        async with StubLLMServer(reply=REPLY, first_token_delay=0.01, token_delay=0.001) as server:
+            llm = make_llm(server)
+            try:
+                deltas = [delta async for delta in llm.generate_response_stream_async("你好")]
+                # 连接池复用：第二次请求走同一个 keep-alive 连接
+                second = await llm.generate_response_async("再说一次")
+            finally:
+                await ChatGLM_LLM.close_async_clients()
+            return deltas, second, server.connections
+
+    deltas, second, connections = asyncio.run(run())
+    assert len(deltas) > 1
+    assert "".join(deltas) == REPLY
+    assert second == REPLY
+    assert connections == 1
+
+
+def test_timeout_raises_and_releases_connection():
+    async def run():
+        # 桩服务在首 token 前只是等待，察觉不到客户端断开；改由单连接的连接池检查连接已释放
+        async with StubLLMServer(reply=REPLY, first_token_delay=5) as server:
+            llm = make_llm(server, max_connections=1, max_keepalive_connections=1)
+            started = time.perf_counter()
+            try:
+                with pytest.raises(asyncio.TimeoutError):
+                    await llm.generate_response_async("你好", timeout=0.3)
+                elapsed = time.perf_counter() - started
+
+                server.first_token_delay = 0.01
+                reply = await llm.generate_response_async("再说一次", timeout=2)
+            finally:
+                await ChatGLM_LLM.close_async_clients()
+            return elapsed, reply
+
+    elapsed, reply = asyncio.run(run())
+    assert elapsed < 2
+    assert reply == REPLY
+
+
+def test_cancel_closes_stream_without_leaking_connections():
+    async def run():
+        # 连接池只有一个连接：取消后若连接未归还或关闭，下一次请求会一直等待连接
+        async with StubLLMServer(reply=REPLY * 20, first_token_delay=0.01, token_delay=0.05) as server:
+            llm = make_llm(server, max_connections=1, max_keepalive_connections=1)
+            first_delta = asyncio.Event()
+
+            async def consume():
+                async for _ in llm.generate_response_stream_async("你好"):
+                    first_delta.set()
+
+            try:
+                task = asyncio.create_task(consume())
+                await asyncio.wait_for(first_delta.wait(), 2)
+                task.cancel()
+                with pytest.raises(asyncio.CancelledError):
+                    await task
+                closed = await wait_until(lambda: server.open_connections == 0)
+
+                server.reply, server.token_delay = REPLY, 0.001
+                reply = await llm.generate_response_async("再说一次", timeout=2)
+            finally:
+                await ChatGLM_LLM.close_async_clients()
+            return closed, reply
+
+    closed, reply = asyncio.run(run())
+    assert closed
+    assert reply == REPLY
@@ -0,0 +1,192 @@
+"""
+抖动缓冲区（audio_format/jitter_buffer.py）的测试：重排、丢包补偿（FEC / PLC）、取空、迟到与重复包、抖动估计
+
+除最后的端到端模拟外，解码会话用 FakeSession 代替：每个包解码为填满其序号的一帧，
+FEC 恢复的帧为下一个包序号的相反数，PLC 帧为 PLC，输出序列可以逐帧断言。
+"""
+
+import numpy as np
+import pytest
+
+from audio_format.jitter_buffer import OpusJitterBuffer, simulate
+
+FRAME_MS = 60
+FRAME = FRAME_MS / 1000
+PLC = -1
+
+
+class FakeSession:
+    def __init__(self):
+        self.closed = False
+
+    def decode_packet(self, packet):
+        return np.full(4, int(packet), dtype=np.int16)
+
+    def conceal_frame(self, next_packet=None):
+        return np.full(4, PLC if next_packet is None else -int(next_packet), dtype=np.int16)
+
+    def close(self):
+        self.closed = True
+
+
+def make_buffer(**options):
+    # quiet_level=0：测试帧都不视为静音，积压时不丢帧
+    return OpusJitterBuffer(FakeSession(), frame_ms=FRAME_MS, quiet_level=0, **options)
+
+
+def packet(seq):
+    return str(seq).encode()
+
+
+def play(buffer, arrivals, ticks):
+    """arrivals 为 [(序号, 到达时间)]；第 tick 个节拍在 tick * FRAME 时调用 pull()，返回每次的输出"""
+    pending = sorted(arrivals, key=lambda item: item[1])
+    output = []
+    for tick in range(ticks):
+        now = tick * FRAME
+        while pending and pending[0][1] <= now + 1e-9:
+            seq, arrival = pending.pop(0)
+            buffer.push(seq, packet(seq), arrival)
+        frame = buffer.pull(now)
+        output.append(None if frame is None else int(frame[0]))
+    return output
+
+
+def test_in_order_stream_waits_one_frame_then_plays():
+    buffer = make_buffer()
+    output = play(buffer, [(seq, seq * FRAME) for seq in range(5)], 7)
+    # 无抖动时目标延迟为一帧：第一个包等一个节拍后开始播放
+    assert output == [None, 0, 1, 2, 3, 4, PLC]
+    stats = buffer.get_stats()
+    assert stats['decoded'] == 5
+    assert stats['jitter_ms'] == 0
+    assert stats['target_delay_ms'] == FRAME_MS
+    assert stats['avg_added_latency_ms'] == pytest.approx(FRAME_MS)
+
+
+def test_reordered_packets_are_played_in_sequence():
+    buffer = make_buffer(min_delay_ms=3 * FRAME_MS)
+    arrivals = [(1, 0.0), (0, 0.01), (3, 0.02), (2, 0.03), (4, 0.04), (5, 0.05)]
+    output = play(buffer, arrivals, 7)
+    assert output == [None, 0, 1, 2, 3, 4, 5]
+    assert buffer.stats['reordered'] == 2
+    assert buffer.stats['plc'] == buffer.stats['fec'] == 0
+
+
+def lost_packet_run(fec, lost=2, count=6):
+    buffer = make_buffer(fec=fec, min_delay_ms=2 * FRAME_MS)
+    arrivals = [(seq, seq * FRAME) for seq in range(count) if seq != lost]
+    output = play(buffer, arrivals, count + 2)
+    # 目标延迟两帧：前两个节拍缓冲，之后逐帧输出
+    assert output[:2] == [None, None]
+    return buffer, output[2:]
+
+
+def test_lost_packet_is_concealed_with_plc_without_fec():
+    buffer, output = lost_packet_run(fec=False)
+    assert output == [0, 1, PLC, 3, 4, 5]
+    assert (buffer.stats['plc'], buffer.stats['fec']) == (1, 0)
+
+
+def test_lost_packet_is_recovered_from_next_packet_with_fec():
+    buffer, output = lost_packet_run(fec=True)
+    # FEC 帧来自包 3，之后包 3 仍正常解码
+    assert output == [0, 1, -3, 3, 4, 5]
+    assert (buffer.stats['fec'], buffer.stats['plc']) == (1, 0)
+
+
+def test_fec_needs_the_next_packet():
+    buffer, output = lost_packet_run(fec=True, lost=5)
+    assert output == [0, 1, 2, 3, 4, PLC]
+    assert (buffer.stats['fec'], buffer.stats['plc']) == (0, 1)
+
+
+def test_late_and_duplicate_packets_are_dropped():
+    buffer, _ = lost_packet_run(fec=False)
+    assert buffer.push(2, packet(2), 10.0) is False
+    assert buffer.push(5, packet(5), 10.0) is False
+    buffer.push(7, packet(7), 10.0)
+    assert buffer.push(7, packet(7), 10.0) is False
+    assert (buffer.stats['late'], buffer.stats['duplicate']) == (2, 1)
+
+
+def test_underrun_then_late_packet_delays_playback_by_one_frame():
+    buffer = make_buffer()
+    # 包 3 晚到 1.5 帧：缓冲区取空时补一帧，包 3 到达后顺延播放
+    arrivals = [(seq, seq * FRAME + (1.5 * FRAME if seq >= 3 else 0)) for seq in range(6)]
+    output = play(buffer, arrivals, 8)
+    assert output == [None, 0, 1, 2, PLC, 3, 4, 5]
+    assert buffer.stats['underruns'] == 1
+    assert buffer.stats['decoded'] == 6
+
+
+def test_underrun_frame_replaces_a_lost_packet():
+    buffer = make_buffer()
+    # 包 3 丢失、包 4 起晚到半帧：取空时补出的帧就代替了包 3，包 4 到达后直接播放，不再补第二次
+    arrivals = [(seq, seq * FRAME + (0.5 * FRAME if seq >= 4 else 0)) for seq in range(7) if seq != 3]
+    output = play(buffer, arrivals, 8)
+    assert output == [None, 0, 1, 2, PLC, 4, 5, 6]
+    assert buffer.stats['underruns'] == 1
+    assert buffer.stats['plc'] == 1
+
+
+def test_sequence_numbers_wrap_around():
+    buffer = make_buffer()
+    seqs = [65534, 65535, 0, 1]
+    for index, seq in enumerate(seqs):
+        buffer.push(seq, packet(index), index * FRAME)
+    buffer.end()
+    output = []
+    while (frame := buffer.pull(10.0)) is not None:
+        output.append(int(frame[0]))
+    assert output == [0, 1, 2, 3]
+
+
+def test_end_drains_remaining_packets():
+    buffer = make_buffer(min_delay_ms=10 * FRAME_MS)
+    for seq in range(3):
+        buffer.push(seq, packet(seq), 0.0)
+    assert buffer.pull(0.0) is None
+    buffer.end()
+    assert [int(buffer.pull(0.0)[0]) for _ in range(3)] == [0, 1, 2]
+    assert buffer.pull(0.0) is None
+
+
+def test_jitter_estimate_follows_arrival_variation():
+    buffer = make_buffer()
+    deviation = 0.01
+    # 到达时间在 ±10ms 间交替：相邻包的传输时延差恒为 20ms，平滑估计收敛到 20ms
+    for seq in range(200):
+        buffer.push(seq, packet(seq), seq * FRAME + (deviation if seq % 2 else -deviation))
+    stats = buffer.get_stats()
+    assert stats['jitter_ms'] == pytest.approx(2 * deviation * 1000, rel=0.01)
+    assert stats['target_delay_ms'] == pytest.approx(FRAME_MS + 3.0 * stats['jitter_ms'], abs=0.1)
+
+
+def test_target_delay_is_clamped():
+    buffer = make_buffer(max_delay_ms=200)
+    for seq in range(200):
+        buffer.push(seq, packet(seq), seq * FRAME + (0.1 if seq % 2 else 0))
+    assert buffer.target_delay_ms() == 200
+
+
+def test_overflow_skips_oldest_packets():
+    buffer = make_buffer(max_delay_ms=5 * FRAME_MS)
+    for seq in range(8):
+        buffer.push(seq, packet(seq), 0.0)
+    assert buffer.depth() == 5
+    assert buffer.stats['dropped'] == 3
+    assert int(buffer.pull(0.0)[0]) == 3
+
+
+@pytest.mark.parametrize("fec", [False, True])
+def test_simulated_stream_keeps_its_length(fec):
+    report = simulate(seconds=6, loss=0.1, jitter_ms=0, fec=fec, seed=1)
+    stats = report['stats']
+    lost = report['packets'] - stats['decoded']
+    assert lost > 0
+    # 无抖动时每个丢失的包恰好补一帧：输出与输入等长，增加的延迟为一帧
+    assert report['output_ms'] == report['input_ms']
+    assert stats['fec'] + stats['plc'] == lost
+    assert stats['avg_added_latency_ms'] == pytest.approx(FRAME_MS)
+    assert (stats['fec'] > 0) == fec
@@ -0,0 +1,74 @@
+"""
+Opus 容器（audio_format/opus_container.py）的测试：读写往返、写入出错时不留下输出、截断文件的校验
+"""
+
+import os
+
+import pytest
+
+from audio_format.opus_container import (
+    OpusContainerReader, OpusContainerWriter, convert_custom_to_container, save_opus_container,
+)
+
+PACKETS = [bytes([i]) * (10 + i) for i in range(5)]
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "a.cyop")
+    save_opus_container(PACKETS, path, frame_duration_ms=20)
+    with OpusContainerReader(path) as reader:
+        assert [bytes(packet) for packet in reader] == PACKETS
+        assert reader.duration_ms == 100
+        assert bytes(reader.packet(-1)) == PACKETS[-1]
+    assert os.listdir(tmp_path) == ["a.cyop"]
+
+
+def test_writer_error_leaves_no_output(tmp_path):
+    path = tmp_path / "a.cyop"
+    with pytest.raises(RuntimeError):
+        with OpusContainerWriter(str(path)) as writer:
+            writer.extend(PACKETS)
+            raise RuntimeError("中断")
+    assert os.listdir(tmp_path) == []
+
+
+def test_writer_error_keeps_existing_output(tmp_path):
+    path = str(tmp_path / "a.cyop")
+    save_opus_container(PACKETS[:2], path)
+    with pytest.raises(RuntimeError):
+        with OpusContainerWriter(path) as writer:
+            writer.extend(PACKETS)
+            raise RuntimeError("中断")
+    with OpusContainerReader(path) as reader:
+        assert len(reader) == 2
+
+
+def test_convert_truncated_input_leaves_no_output(tmp_path):
+    source = tmp_path / "a.opus"
+    data = b"".join(len(packet).to_bytes(4, byteorder="big") + packet for packet in PACKETS)
+    source.write_bytes(data[:-3])
+    output = tmp_path / "a.cyop"
+    with pytest.raises(ValueError):
+        convert_custom_to_container(str(source), str(output))
+    assert not output.exists()
+    assert os.listdir(tmp_path) == ["a.opus"]
+
+
+@pytest.mark.parametrize("cut", [1, 8, 20])
+def test_reader_rejects_truncated_index(tmp_path, cut):
+    path = tmp_path / "a.cyop"
+    save_opus_container(PACKETS, str(path))
+    path.write_bytes(path.read_bytes()[:-cut])
+    with pytest.raises(ValueError):
+        OpusContainerReader(str(path))
+
+
+def test_reader_rejects_index_past_data(tmp_path):
+    path = tmp_path / "a.cyop"
+    save_opus_container(PACKETS, str(path))
+    data = bytearray(path.read_bytes())
+    # 最后一个偏移（数据区末尾）改为超出索引起点
+    data[-8:] = (len(data)).to_bytes(8, byteorder="little")
+    path.write_bytes(bytes(data))
+    with pytest.raises(ValueError):
+        OpusContainerReader(str(path))
@@ -0,0 +1,156 @@
+"""
+进程内 WAV 读取（audio_format/pcm_loader.py）的测试：文件头解析、采样格式转换与重采样
+"""
+
+import struct
+
+import numpy as np
+import pytest
+
+from audio_format import pcm_loader
+from audio_format.pcm_loader import Resampler
+
+# WAVE_FORMAT_EXTENSIBLE 子格式 GUID 的后 14 字节（前 2 字节为格式代码）
+SUBFORMAT_SUFFIX = b"\x00\x00\x00\x00\x10\x00\x80\x00\x00\xaa\x00\x38\x9b\x71"
+
+
+def fmt_chunk(format_tag, channels, sample_rate, bits, extra=b""):
+    block_align = channels * bits // 8
+    body = struct.pack("<HHIIHH", format_tag, channels, sample_rate, sample_rate * block_align, block_align, bits)
+    return body + extra
+
+
+def write_wav(path, fmt, data, chunks=(), data_size=None):
+    """按给定的 fmt 块内容与额外块拼出 WAV 文件；奇数长度的块补一个填充字节"""
+    body = b"WAVE"
+    for chunk_id, payload in [(b"fmt ", fmt), *chunks]:
+        body += chunk_id + struct.pack("<I", len(payload)) + payload + b"\x00" * (len(payload) & 1)
+    body += b"data" + struct.pack("<I", len(data) if data_size is None else data_size) + data
+    path.write_bytes(b"RIFF" + struct.pack("<I", len(body)) + body)
+    return str(path)
+
+
+def read_mono(path):
+    info = pcm_loader.probe_wav(path)
+    return info, pcm_loader.to_float_mono(pcm_loader.map_samples(path, info), info)
+
+
+def test_probe_native_wav(tmp_path):
+    pcm = np.arange(-5, 5, dtype="<i2")
+    path = write_wav(tmp_path / "a.wav", fmt_chunk(1, 1, 16000, 16), pcm.tobytes())
+    info = pcm_loader.probe_wav(path)
+    assert (info.format_tag, info.channels, info.sample_rate, info.bits_per_sample) == (1, 1, 16000, 16)
+    assert info.frames == 10
+    assert pcm_loader.is_native(info)
+    assert np.array_equal(pcm_loader.map_native_pcm(path, info), pcm)
+
+
+def test_probe_rejects_non_wav(tmp_path):
+    path = tmp_path / "a.wav"
+    path.write_bytes(b"ID3" + b"\x00" * 64)
+    assert pcm_loader.probe_wav(str(path)) is None
+
+
+@pytest.mark.parametrize("subformat, expected", [(1, pcm_loader.WAVE_FORMAT_PCM),
+                                                 (3, pcm_loader.WAVE_FORMAT_IEEE_FLOAT)])
+def test_probe_extensible_uses_subformat(tmp_path, subformat, expected):
+    bits = 16 if subformat == 1 else 32
+    extra = struct.pack("<HHI", 22, bits, 0b11) + struct.pack("<H", subformat) + SUBFORMAT_SUFFIX
+    path = write_wav(tmp_path / "a.wav", fmt_chunk(pcm_loader.WAVE_FORMAT_EXTENSIBLE, 2, 48000, bits, extra),
+                     b"\x00" * (bits // 4) * 3)
+    info = pcm_loader.probe_wav(path)
+    assert info.format_tag == expected
+    assert info.frames == 3
+    assert pcm_loader.is_supported(info)
+
+
+def test_probe_odd_sized_chunks(tmp_path):
+    # 17 字节的 fmt 块与 3 字节的 LIST 块后各有一个填充字节
+    pcm = np.array([1, -2, 3], dtype="<i2")
+    path = write_wav(tmp_path / "a.wav", fmt_chunk(1, 1, 16000, 16, b"\x00"), pcm.tobytes(),
+                     chunks=[(b"LIST", b"abc")])
+    info = pcm_loader.probe_wav(path)
+    assert info.frames == 3
+    assert np.array_equal(pcm_loader.map_native_pcm(path, info), pcm)
+
+
+@pytest.mark.parametrize("data_size", [0, 0xFFFFFFFF])
+def test_probe_streaming_wav_uses_file_size(tmp_path, data_size):
+    pcm = np.arange(8, dtype="<i2")
+    path = write_wav(tmp_path / "a.wav", fmt_chunk(1, 1, 16000, 16), pcm.tobytes(), data_size=data_size)
+    assert pcm_loader.probe_wav(path).frames == 8
+
+
+def test_24_bit_sign_extension(tmp_path):
+    values = [0, 1, -1, 8388607, -8388608, -2]
+    data = b"".join(value.to_bytes(3, "little", signed=True) for value in values)
+    info, samples = read_mono(write_wav(tmp_path / "a.wav", fmt_chunk(1, 1, 16000, 24), data))
+    assert pcm_loader.is_supported(info)
+    assert np.allclose(samples, np.array(values) / 8388608.0)
+
+
+def test_8_bit_is_unsigned(tmp_path):
+    info, samples = read_mono(write_wav(tmp_path / "a.wav", fmt_chunk(1, 1, 8000, 8), bytes([0, 128, 255])))
+    assert np.allclose(samples, [-1.0, 0.0, 127 / 128])
+
+
+def test_float_stereo_is_averaged(tmp_path):
+    frames = np.array([[0.5, -0.5], [1.0, 0.0], [-0.25, -0.75]], dtype="<f4")
+    info, samples = read_mono(write_wav(tmp_path / "a.wav", fmt_chunk(3, 2, 44100, 32), frames.tobytes()))
+    assert np.allclose(samples, [0.0, 0.5, -0.5])
+
+
+@pytest.mark.parametrize("src, dst, length", [(44100, 16000, 44100), (48000, 16000, 1001),
+                                              (8000, 16000, 333), (22050, 16000, 7)])
+def test_resampler_output_length(src, dst, length):
+    resampler = Resampler(src, dst)
+    assert resampler.output_length(length) == -(-length * dst // src)
+    signal = np.zeros(length, dtype=np.float32)
+    out = resampler.process(lambda a, b: signal[a:b], length, 0, resampler.output_length(length))
+    assert len(out) == resampler.output_length(length)
+
+
+def tone(frequency, sample_rate, seconds=0.5):
+    return np.sin(2 * np.pi * frequency * np.arange(int(sample_rate * seconds)) / sample_rate).astype(np.float32)
+
+
+def resample(signal, src, dst):
+    resampler = Resampler(src, dst)
+    return resampler.process(lambda a, b: signal[a:b], len(signal), 0, resampler.output_length(len(signal)))
+
+
+@pytest.mark.parametrize("src", [44100, 48000, 8000])
+def test_resampler_passband(src):
+    out = resample(tone(1000, src), src, 16000)
+    # 去掉两端滤波器的过渡区后与理想的 16kHz 正弦比较
+    expected = tone(1000, 16000)[:len(out)]
+    assert np.max(np.abs(out[200:-200] - expected[200:-200])) < 2e-3
+
+
+def test_resampler_rejects_above_nyquist():
+    # 44.1kHz 中 12kHz 的成分超出 16kHz 的奈奎斯特频率，不能混叠回通带
+    out = resample(tone(12000, 44100), 44100, 16000)
+    assert np.sqrt(np.mean(out[200:-200] ** 2)) < 2e-3
+
+
+def test_resampler_blocks_match_whole():
+    signal = tone(440, 44100) * 0.5
+    resampler = Resampler(44100, 16000)
+    total = resampler.output_length(len(signal))
+    whole = resampler.process(lambda a, b: signal[a:b], len(signal), 0, total)
+    blocks = np.concatenate([resampler.process(lambda a, b: signal[a:b], len(signal), start, min(start + 1000, total))
+                             for start in range(0, total, 1000)])
+    assert np.allclose(whole, blocks, atol=1e-6)
+
+
+def test_iter_converted_pcm_24_bit_stereo(tmp_path):
+    left = (tone(1000, 48000) * 4194304).astype(np.int32)
+    frames = np.stack([left, left], axis=1).reshape(-1)
+    data = b"".join(int(value).to_bytes(3, "little", signed=True) for value in frames)
+    path = write_wav(tmp_path / "a.wav", fmt_chunk(1, 2, 48000, 24), data)
+    info = pcm_loader.probe_wav(path)
+    pcm = np.concatenate(list(pcm_loader.iter_converted_pcm(path, info, 16000, block_seconds=0.1)))
+    assert pcm.dtype == np.int16
+    assert len(pcm) == 8000
+    # 半幅正弦：峰值约为 16384
+    assert abs(np.max(np.abs(pcm[200:-200])) - 16384) < 200
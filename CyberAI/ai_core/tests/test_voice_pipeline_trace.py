@@ -0,0 +1,92 @@
+"""
+VoicePipeline.stream() 的请求追踪：追踪不泄漏到调用方的上下文，LLM / TTS 任务中的 span 记入本次追踪
+"""
+
+import asyncio
+
+from benchmark.fake_tts import FakeTTS
+from llm.chatglm import ChatGLM_LLM
+from llm.stub_server import StubLLMServer
+from pipeline.voice_pipeline import VoicePipeline
+from utils.metrics import metrics
+
+REPLY = "你好。我是本地测试助手。"
+
+
+class SpanTTS(FakeTTS):
+    """合成过程包在 tts span 中的 FakeTTS"""
+
+    async def text_to_opus_stream(self, text):
+        with metrics.span("tts"):
+            async for packet in super().text_to_opus_stream(text):
+                yield packet
+
+
+def run_with_pipeline(body):
+    async def run():
+        async with StubLLMServer(reply=REPLY, first_token_delay=0.01, token_delay=0.001) as server:
+            llm = ChatGLM_LLM({"model_name": "stub", "api_key": "test", "url": server.url})
+            pipeline = VoicePipeline(llm, SpanTTS({"first_packet_delay": 0.01}))
+            try:
+                return await body(pipeline)
+            finally:
+                await ChatGLM_LLM.close_async_clients()
+
+    return asyncio.run(run())
+
+
+def new_traces(before):
+    known = {trace['trace_id'] for trace in before}
+    return [trace for trace in metrics.recent_traces() if trace['trace_id'] not in known]
+
+
+def test_trace_does_not_leak_into_caller():
+    async def body(pipeline):
+        seen = []
+        stream = pipeline.stream("你好")
+        async for _ in stream:
+            seen.append(metrics.current_trace())
+            break
+        await stream.aclose()
+        seen.append(metrics.current_trace())
+
+        before = metrics.recent_traces()
+        for _ in range(3):
+            await pipeline.run("你好")
+        return seen, new_traces(before)
+
+    seen, traces = run_with_pipeline(body)
+    assert seen == [None, None]
+    assert len(traces) == 3
+    assert len({trace['trace_id'] for trace in traces}) == 3
+    for trace in traces:
+        names = {span['name'] for span in trace['spans']}
+        assert {"tts", "pipeline.first_audio", "pipeline.total"} <= names
+        assert trace['status'] == "ok"
+
+
+def test_cancelled_stream_finishes_its_trace():
+    async def body(pipeline):
+        before = metrics.recent_traces()
+        stream = pipeline.stream("你好")
+        async for _ in stream:
+            break
+        await stream.aclose()
+        return new_traces(before)
+
+    traces = run_with_pipeline(body)
+    assert len(traces) == 1
+    assert traces[0]['status'] == "cancelled"
+    assert traces[0]['attributes']['cancelled'] is True
+
+
+def test_outer_trace_is_reused():
+    async def body(pipeline):
+        before = metrics.recent_traces()
+        with metrics.trace("turn"):
+            await pipeline.run("你好")
+        return new_traces(before)
+
+    traces = run_with_pipeline(body)
+    assert [trace['name'] for trace in traces] == ["turn"]
+    assert "tts" in {span['name'] for span in traces[0]['spans']}
@@ -1,13 +1,147 @@
+import asyncio
+import time
+
 import edge_tts
 
+from audio_format.opus import Opus_Encoder
+from audio_format.stream_decoder import decode_stream
+from tts.tts_cache import TTSCache
+from utils.metrics import metrics
+
 class Edge_TTS:
     def __init__(self, config):
         self.voice = config.get("voice")
+        self.rate = config.get("rate", "+0%")
+        self.pitch = config.get("pitch", "+0Hz")
+        self.volume = config.get("volume", "+0%")
+        # MP3 流解码方式：auto（优先进程内 PyAV）、pyav、ffmpeg
+        self.decoder = config.get("decoder", "auto")
 
-    async def text_to_speech(self, text, output_file):
-        communicate = edge_tts.Communicate(
+        cache_config = config.get("cache") or {}
+        self.cache = TTSCache(cache_config) if cache_config.get("enabled", False) else None
+
+    def _communicate(self, text):
+        return edge_tts.Communicate(
             text,
             self.voice,
+            rate=self.rate,
+            pitch=self.pitch,
+            volume=self.volume,
         )
+
+    async def text_to_speech(self, text, output_file):
+        communicate = self._communicate(text)
         await communicate.save(output_file)
-        return output_file
\ No newline at end of file
+        return output_file
+
+    def _cache_key(self, text, opus):
+        # 不同编码档位的数据包不能混用，档位参数计入缓存键
+        audio_format = f"opus-{opus.opus_sample_rate}-{opus.opus_channel}-{opus.opus_frame_time}-{tuple(opus.profile)}"
+        return TTSCache.make_key(text, self.voice, self.rate, self.pitch, self.volume, audio_format)
+
+    async def _iter_audio_chunks(self, text):
+        """逐块返回 Edge 服务推送的 MP3 音频数据"""
+        communicate = self._communicate(text)
+        async for chunk in communicate.stream():
+            if chunk["type"] == "audio":
+                yield chunk["data"]
+
+    async def _synthesize_opus_stream(self, text, opus, result):
+        """边合成边解码为 16kHz 单声道 PCM 并编码为 Opus，结束时在 result 中记录时长"""
+        stream_encoder = opus.create_stream_encoder()
+        pcm_stream = decode_stream(
+            self._iter_audio_chunks(text),
+            opus.ffmpeg_path,
+            input_format="mp3",
+            sample_rate=opus.opus_sample_rate,
+            channels=opus.opus_channel,
+            decoder=self.decoder,
+        )
+        try:
+            async for pcm in pcm_stream:
+                for packet in stream_encoder.encode(pcm):
+                    yield packet
+            for packet in stream_encoder.flush():
+                yield packet
+            result['duration'] = stream_encoder.duration_ms()
+        finally:
+            # 归还编码器上下文（包括合成中途被取消的情况）
+            stream_encoder.close()
+
+    async def text_to_opus_stream(self, text):
+        """
+        流式将文本合成为 Opus 数据包
+
+        Edge 服务推送的 MP3 数据块直接送入解码器（进程内 PyAV 或 FFmpeg 管道），
+        合成尚未结束即可输出数据包，不写中间文件。启用缓存时命中直接返回缓存，
+        未命中则在完整合成后写入缓存。
+        """
+        opus = Opus_Encoder()
+        key = self._cache_key(text, opus) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                for packet in cached[0]:
+                    yield packet
+                return
+
+        opus_datas = []
+        result = {}
+        with metrics.span("tts") as span:
+            started = time.perf_counter()
+            async for packet in self._synthesize_opus_stream(text, opus, result):
+                if not opus_datas:
+                    metrics.observe("tts.first_packet", time.perf_counter() - started, started)
+                opus_datas.append(packet)
+                yield packet
+            span.set_audio_seconds(result['duration'] / 1000)
+
+        if key:
+            self.cache.put(key, opus_datas, result['duration'])
+
+    async def text_to_opus(self, text):
+        """
+        将文本合成为 Opus 数据包
+
+        返回值:
+            (Opus 数据包序列, 时长毫秒)；缓存命中时为 OpusPacketBuffer，可跳过合成与重编码
+        """
+        opus = Opus_Encoder()
+        key = self._cache_key(text, opus) if self.cache else None
+        if key:
+            cached = self.cache.get(key)
+            if cached is not None:
+                return cached
+
+        result = {}
+        with metrics.span("tts") as span:
+            opus_datas = [packet async for packet in self._synthesize_opus_stream(text, opus, result)]
+            span.set_audio_seconds(result['duration'] / 1000)
+        if key:
+            self.cache.put(key, opus_datas, result['duration'])
+        return opus_datas, result['duration']
+
+    async def prewarm_cache(self, phrases, concurrency=4):
+        """
+        用常用短语列表（或每行一句的文本文件路径）预热缓存
+
+        返回值:
+            本次实际合成的短语数（已在缓存中的不计）
+        """
+        if self.cache is None:
+            return 0
+        if isinstance(phrases, str):
+            with open(phrases, "r", encoding="utf-8") as f:
+                phrases = [line.strip() for line in f]
+        phrases = [phrase for phrase in dict.fromkeys(phrases) if phrase]
+
+        opus = Opus_Encoder()
+        missing = [phrase for phrase in phrases if self._cache_key(phrase, opus) not in self.cache]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def warm(phrase):
+            async with semaphore:
+                await self.text_to_opus(phrase)
+
+        await asyncio.gather(*[warm(phrase) for phrase in missing])
+        return len(missing)
@@ -0,0 +1,219 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from audio_format.opus_buffer import OpusPacketBuffer
+from utils.util import Util
+
+
+class TTSCache:
+    """
+    合成语音缓存（按内容寻址）
+
+    以 (文本, 音色, 语速/音调/音量, 音频格式) 的哈希为键，缓存最终的 Opus 数据包，
+    命中时同时跳过网络合成与 Opus 重编码。每个条目的数据包存放在一个 OpusPacketBuffer 中。
+    分两级：内存 LRU（按条目数和字节数限制）与磁盘 LRU（按字节数限制），
+    磁盘命中会回填到内存。
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.memory_max_entries = int(config.get("memory_max_entries", 512))
+        self.memory_max_bytes = int(float(config.get("memory_max_mb", 64)) * 1024 * 1024)
+        self.disk_max_bytes = int(float(config.get("disk_max_mb", 512)) * 1024 * 1024)
+        disk_dir = config.get("disk_dir", "output/tts_cache")
+        self.disk_dir = disk_dir if os.path.isabs(disk_dir) else os.path.join(Util.get_process_dir(), disk_dir)
+
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()   # key -> (packets, duration, size)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()     # key -> 文件大小，按访问时间从旧到新排列
+        self._disk_bytes = 0
+        self._stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'memory_evictions': 0,
+            'disk_evictions': 0,
+            'puts': 0,
+        }
+        self._load_disk_index()
+
+    @staticmethod
+    def make_key(text, voice, rate="", pitch="", volume="", audio_format=""):
+        """计算缓存键：参数的 SHA-256"""
+        payload = json.dumps([text, voice, rate, pitch, volume, audio_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.opus")
+
+    def _load_disk_index(self):
+        """启动时扫描磁盘缓存目录，按修改时间恢复 LRU 顺序"""
+        if not os.path.isdir(self.disk_dir):
+            return
+        entries = []
+        for file_name in os.listdir(self.disk_dir):
+            if not file_name.endswith(".opus"):
+                continue
+            path = os.path.join(self.disk_dir, file_name)
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, file_name[:-len(".opus")], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._disk[key] = size
+            self._disk_bytes += size
+        self._evict_disk()
+
+    @staticmethod
+    def _serialize(packets, duration):
+        # 4 字节时长（毫秒）+ 与 save_opus_raw_custom 相同的 4 字节长度前缀帧
+        parts = [int(duration).to_bytes(4, byteorder='big')]
+        for packet in packets:
+            parts.append(len(packet).to_bytes(4, byteorder='big'))
+            parts.append(packet)
+        return b''.join(parts)
+
+    @staticmethod
+    def _deserialize(data):
+        # 长度前缀越界说明文件损坏或被截断，抛出 ValueError 而不是返回截短的数据包
+        if len(data) < 4:
+            raise ValueError("缓存文件缺少时长字段")
+        duration = int.from_bytes(data[:4], byteorder='big')
+        packets = OpusPacketBuffer()
+        view = memoryview(data)
+        index = 4
+        while index < len(data):
+            if index + 4 > len(data):
+                raise ValueError(f"缓存文件在偏移 {index} 处截断")
+            length = int.from_bytes(view[index:index + 4], byteorder='big')
+            index += 4
+            if index + length > len(data):
+                raise ValueError(f"缓存文件在偏移 {index} 处截断")
+            packets.append(view[index:index + length])
+            index += length
+        return packets, duration
+
+    def __contains__(self, key):
+        """是否已缓存（不计入命中统计）"""
+        with self._lock:
+            return key in self._memory or key in self._disk
+
+    def get(self, key):
+        """
+        查询缓存
+
+        返回值:
+            (OpusPacketBuffer, 时长毫秒)，未命中返回 None
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self._stats['memory_hits'] += 1
+                return entry[0], entry[1]
+            on_disk = key in self._disk
+
+        if on_disk:
+            path = self._disk_path(key)
+            try:
+                with open(path, 'rb') as f:
+                    packets, duration = self._deserialize(f.read())
+                os.utime(path)
+            except OSError:
+                with self._lock:
+                    self._disk_bytes -= self._disk.pop(key, 0)
+            except ValueError as e:
+                # 损坏的条目按未命中处理并删除，之后重新合成写入
+                print(f"TTS 缓存条目损坏，已删除: {path} ({e})")
+                with self._lock:
+                    self._disk_bytes -= self._disk.pop(key, 0)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            else:
+                with self._lock:
+                    if key in self._disk:
+                        self._disk.move_to_end(key)
+                    self._stats['disk_hits'] += 1
+                    self._put_memory(key, packets, duration)
+                return packets, duration
+
+        with self._lock:
+            self._stats['misses'] += 1
+        return None
+
+    def put(self, key, packets, duration):
+        """写入内存与磁盘两级缓存"""
+        packets = OpusPacketBuffer(packets)
+        data = self._serialize(packets, duration)
+        with self._lock:
+            self._stats['puts'] += 1
+            self._put_memory(key, packets, duration)
+
+        if len(data) > self.disk_max_bytes:
+            return
+        os.makedirs(self.disk_dir, exist_ok=True)
+        path = self._disk_path(key)
+        temp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'wb') as f:
+            f.write(data)
+        # 先写临时文件再替换，避免并发读到写了一半的文件
+        os.replace(temp_path, path)
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            self._evict_disk()
+
+    def _put_memory(self, key, packets, duration):
+        size = packets.nbytes
+        if size > self.memory_max_bytes:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= old[2]
+        self._memory[key] = (packets, duration, size)
+        self._memory_bytes += size
+        while self._memory and (len(self._memory) > self.memory_max_entries
+                                or self._memory_bytes > self.memory_max_bytes):
+            _, (_, _, evicted_size) = self._memory.popitem(last=False)
+            self._memory_bytes -= evicted_size
+            self._stats['memory_evictions'] += 1
+
+    def _evict_disk(self):
+        while self._disk and self._disk_bytes > self.disk_max_bytes:
+            key, size = self._disk.popitem(last=False)
+            self._disk_bytes -= size
+            self._stats['disk_evictions'] += 1
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
+
+    def get_stats(self):
+        """获取命中、未命中、淘汰等统计"""
+        with self._lock:
+            stats = dict(self._stats)
+            lookups = stats['memory_hits'] + stats['disk_hits'] + stats['misses']
+            stats['hit_rate'] = (stats['memory_hits'] + stats['disk_hits']) / lookups if lookups else 0.0
+            stats['memory_entries'] = len(self._memory)
+            stats['memory_bytes'] = self._memory_bytes
+            stats['disk_entries'] = len(self._disk)
+            stats['disk_bytes'] = self._disk_bytes
+        return stats
+
+    def clear(self):
+        """清空两级缓存"""
+        with self._lock:
+            keys = list(self._disk)
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._disk.clear()
+            self._disk_bytes = 0
+        for key in keys:
+            try:
+                os.remove(self._disk_path(key))
+            except OSError:
+                pass
@@ -0,0 +1,493 @@
+import contextvars
+import json
+import threading
+import time
+import uuid
+import weakref
+from bisect import bisect_left
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 阶段耗时（秒）与实时率的直方图分桶
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+RTF_BUCKETS = (0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """带标签的指标族，按标签值元组分别计数"""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _samples(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, extra, value in self._samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, labels, extra)} "
+                         f"{_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, labels=(), amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        return self._values.get(labels, 0)
+
+    def _samples(self):
+        with self._lock:
+            return [("", labels, "", value) for labels, value in self._values.items()]
+
+
+class Gauge(_Metric):
+    """瞬时值；也可以注册回调，在导出时才读取（如队列深度），平时没有任何开销"""
+
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, labels=(), value=0):
+        with self._lock:
+            self._values[labels] = value
+
+    def set_function(self, labels, function):
+        """注册取值回调；绑定方法只保存弱引用，对象被回收后自动移除"""
+        if hasattr(function, "__self__"):
+            function = weakref.WeakMethod(function)
+        else:
+            function = (lambda f: lambda: f)(function)
+        with self._lock:
+            self._functions[labels] = function
+
+    def remove(self, labels=()):
+        with self._lock:
+            self._values.pop(labels, None)
+            self._functions.pop(labels, None)
+
+    def _samples(self):
+        with self._lock:
+            samples = [("", labels, "", value) for labels, value in self._values.items()]
+            functions = list(self._functions.items())
+        for labels, ref in functions:
+            function = ref()
+            if function is None:
+                self.remove(labels)
+                continue
+            try:
+                samples.append(("", labels, "", function()))
+            except Exception:
+                continue
+        return samples
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DURATION_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, labels, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # [各桶计数（最后一个为 +Inf）, 总和, 次数]
+                entry = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def snapshot(self, labels=()):
+        """返回 {'count', 'sum'}，没有观测值时为 None"""
+        with self._lock:
+            entry = self._values.get(labels)
+            return None if entry is None else {'count': entry[2], 'sum': entry[1]}
+
+    def _samples(self):
+        with self._lock:
+            entries = [(labels, list(counts), total, count)
+                       for labels, (counts, total, count) in self._values.items()]
+        samples = []
+        for labels, counts, total, count in entries:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                samples.append(("_bucket", labels, f'le="{_format_value(float(bound))}"', cumulative))
+            samples.append(("_sum", labels, "", total))
+            samples.append(("_count", labels, "", count))
+        return samples
+
+
+class Trace:
+    """一次请求的追踪记录：按时间顺序保存各阶段的 span"""
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration_ms = None
+        self.status = "ok"
+        self.spans = []
+
+    def add_span(self, name, started, finished, status="ok", attributes=None):
+        """记录一个 span，started/finished 为 time.perf_counter() 时间"""
+        span = {
+            'name': name,
+            'start_ms': round((started - self._started) * 1000, 3),
+            'duration_ms': round((finished - started) * 1000, 3),
+            'status': status,
+        }
+        if attributes:
+            span.update(attributes)
+        # list.append 在 GIL 下是原子的，多个线程 / 任务可同时写入
+        self.spans.append(span)
+
+    def to_dict(self):
+        return {
+            'trace_id': self.trace_id,
+            'name': self.name,
+            'started_at': self.started_at,
+            'duration_ms': self.duration_ms,
+            'status': self.status,
+            'attributes': self.attributes,
+            'spans': list(self.spans),
+        }
+
+
+class Span:
+    """阶段计时：退出时记录耗时直方图、处理的音频秒数与实时率，异常计入错误数"""
+
+    __slots__ = ("_metrics", "name", "audio_seconds", "attributes", "_trace", "_started")
+
+    def __init__(self, metrics, name, audio_seconds=None):
+        self._metrics = metrics
+        self.name = name
+        self.audio_seconds = audio_seconds
+        self.attributes = None
+
+    def set_audio_seconds(self, seconds):
+        self.audio_seconds = seconds
+
+    def set_attribute(self, key, value):
+        if self.attributes is None:
+            self.attributes = {}
+        self.attributes[key] = value
+
+    def __enter__(self):
+        self._trace = _current_trace.get()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        finished = time.perf_counter()
+        if exc_type is None:
+            status = "ok"
+        elif issubclass(exc_type, Exception):
+            status = "error"
+        else:
+            # 取消（CancelledError / GeneratorExit）不计入错误，也不计入耗时分布
+            status = "cancelled"
+        self._metrics._finish_span(self, self._started, finished, status)
+        return False
+
+
+class _NoopSpan:
+    """关闭指标时使用的空 span"""
+
+    __slots__ = ()
+
+    def set_audio_seconds(self, seconds):
+        pass
+
+    def set_attribute(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NOOP_SPAN = _NoopSpan()
+_current_trace = contextvars.ContextVar("cyberai_trace", default=None)
+
+
+class PipelineMetrics:
+    """
+    流水线指标与追踪
+
+    各模块用 span(stage) 包住一个阶段（LLM 请求、TTS 合成、FFmpeg 转换、ASR 推理等），
+    得到按阶段划分的耗时直方图、音频秒数、实时率与错误数；trace(name) 为一次请求建立追踪，
+    期间（包括其创建的 asyncio 任务中）的 span 都会记入该追踪，最近 max_traces 条追踪保留在内存中。
+    start_server() 在本地 HTTP 端口上以 Prometheus 文本格式导出（/metrics），/traces 返回最近的追踪（JSON）。
+
+    单个 span 的开销约为数微秒，相对毫秒级以上的阶段耗时可以忽略；enabled 为 False 时 span 为空操作。
+    """
+
+    def __init__(self, namespace="cyberai", max_traces=100):
+        self.enabled = True
+        self.namespace = namespace
+        self.stage_duration = Histogram(f"{namespace}_stage_duration_seconds",
+                                        "Stage duration in seconds", ("stage",))
+        self.stage_errors = Counter(f"{namespace}_stage_errors_total", "Stage errors", ("stage",))
+        self.audio_seconds = Counter(f"{namespace}_audio_seconds_total",
+                                     "Audio seconds processed by stage", ("stage",))
+        self.rtf = Histogram(f"{namespace}_real_time_factor",
+                             "Processing time divided by audio duration", ("stage",), RTF_BUCKETS)
+        self.queue_depth = Gauge(f"{namespace}_queue_depth", "Requests waiting in queue", ("queue",))
+        self.connections = Gauge(f"{namespace}_connections", "Open client connections", ("server",))
+        self.jitter_frames = Counter(f"{namespace}_jitter_buffer_frames_total",
+                                     "Frames emitted or discarded by jitter buffers", ("kind",))
+        self.jitter_seconds = Histogram(f"{namespace}_jitter_buffer_seconds",
+                                        "Latency added by jitter buffers and arrival jitter absorbed", ("measure",))
+        self.abandoned_work = Counter(f"{namespace}_abandoned_total",
+                                      "Work discarded by cancelled replies (replies, tokens, audio_seconds)", ("kind",))
+        self.speculation_results = Counter(f"{namespace}_speculation_total",
+                                           "Speculative LLM requests by outcome (hit, miss, cancelled)", ("result",))
+        self.speculation_saved = Counter(f"{namespace}_speculation_saved_seconds_total",
+                                         "First-token latency saved by speculative LLM requests")
+        self.speculation_wasted = Counter(f"{namespace}_speculation_wasted_tokens_total",
+                                          "Tokens generated by discarded speculative LLM requests")
+        self._metrics = [self.stage_duration, self.stage_errors, self.audio_seconds, self.rtf,
+                         self.queue_depth, self.connections, self.jitter_frames, self.jitter_seconds,
+                         self.abandoned_work, self.speculation_results, self.speculation_saved,
+                         self.speculation_wasted]
+        self._traces = deque(maxlen=max_traces)
+        self._server = None
+
+    def configure(self, config=None):
+        """按配置（config["Metrics"]）开关指标，并在配置了 port 时启动导出端口"""
+        config = config or {}
+        self.enabled = bool(config.get("enabled", True))
+        self._traces = deque(self._traces, maxlen=int(config.get("max_traces", self._traces.maxlen)))
+        if self.enabled and config.get("port"):
+            self.start_server(config.get("host", "127.0.0.1"), int(config["port"]))
+        return self
+
+    def span(self, stage, audio_seconds=None):
+        """阶段计时的上下文管理器，audio_seconds 也可以在阶段内用 set_audio_seconds() 补充"""
+        if not self.enabled:
+            return _NOOP_SPAN
+        return Span(self, stage, audio_seconds)
+
+    def _record(self, stage, seconds, audio_seconds):
+        labels = (stage,)
+        self.stage_duration.observe(labels, seconds)
+        if audio_seconds:
+            self.audio_seconds.inc(labels, audio_seconds)
+            self.rtf.observe(labels, seconds / audio_seconds)
+
+    def _finish_span(self, span, started, finished, status):
+        if status == "error":
+            self.stage_errors.inc((span.name,))
+        elif status == "ok":
+            self._record(span.name, finished - started, span.audio_seconds)
+        if span._trace is not None:
+            attributes = span.attributes
+            if span.audio_seconds:
+                attributes = dict(attributes or {}, audio_seconds=round(span.audio_seconds, 3))
+            span._trace.add_span(span.name, started, finished, status, attributes)
+
+    def observe(self, stage, seconds, started=None, audio_seconds=None, trace=None):
+        """
+        直接记录一个阶段耗时（如首个 token 延迟、子进程报告的推理耗时）
+
+        给出 audio_seconds 时同时累计音频秒数与实时率；给出 started 时同时记入 trace（默认为当前追踪）
+        """
+        if not self.enabled:
+            return
+        self._record(stage, seconds, audio_seconds)
+        trace = trace or _current_trace.get()
+        if trace is not None and started is not None:
+            trace.add_span(stage, started, started + seconds)
+
+    def error(self, stage):
+        if self.enabled:
+            self.stage_errors.inc((stage,))
+
+    def track_queue(self, name, depth_function):
+        """注册队列深度回调，导出时读取"""
+        self.queue_depth.set_function((name,), depth_function)
+
+    def untrack_queue(self, name):
+        self.queue_depth.remove((name,))
+
+    def track_connections(self, name, count_function):
+        """注册连接数回调，导出时读取"""
+        self.connections.set_function((name,), count_function)
+
+    def jitter_frame(self, kind):
+        """抖动缓冲区的一帧：decoded、fec、plc、late、duplicate、dropped"""
+        if self.enabled:
+            self.jitter_frames.inc((kind,))
+
+    def jitter_delay(self, measure, seconds):
+        """抖动缓冲区的时延：added_latency（包在缓冲区中等待的时间）或 jitter（包到达时间的偏差）"""
+        if self.enabled:
+            self.jitter_seconds.observe((measure,), seconds)
+
+    def abandoned(self, kind, amount=1):
+        """被取消（如用户打断）的回复中作废的工作量：replies、tokens、audio_seconds"""
+        if self.enabled and amount:
+            self.abandoned_work.inc((kind,), amount)
+
+    def speculation(self, result, saved_seconds=0.0, wasted_tokens=0):
+        """推测的 LLM 请求结算：hit（记节省的延迟）、miss 或 cancelled（记作废的 token）"""
+        if not self.enabled:
+            return
+        self.speculation_results.inc((result,))
+        if saved_seconds:
+            self.speculation_saved.inc((), saved_seconds)
+        if wasted_tokens:
+            self.speculation_wasted.inc((), wasted_tokens)
+
+    def current_trace(self):
+        return _current_trace.get()
+
+    def trace(self, name, **attributes):
+        """
+        为一次请求建立追踪的上下文管理器，返回 Trace；关闭指标时返回 None
+
+        当前已有追踪时（如网关的一个回合内调用 VoicePipeline.stream）直接沿用，span 记入外层追踪
+        """
+        return _TraceScope(self, name, attributes)
+
+    def new_trace(self, name, **attributes):
+        """
+        创建追踪但不设为当前追踪，关闭指标时返回 None
+
+        用于异步生成器：生成器在 yield 之间运行于调用方的上下文，不能在其中设置 contextvar，
+        改为用 trace_context() 得到的上下文运行生成器内部的任务，结束时调用 finish_trace()
+        """
+        return Trace(name, attributes) if self.enabled else None
+
+    def trace_context(self, trace):
+        """复制当前上下文并把 trace 设为其中的当前追踪；调用方自己的上下文不受影响"""
+        context = contextvars.copy_context()
+        context.run(_current_trace.set, trace)
+        return context
+
+    def finish_trace(self, trace, exc_type=None):
+        """结束追踪：记录总耗时与状态（按 exc_type 判断出错或取消），加入最近追踪列表"""
+        trace.duration_ms = round((time.perf_counter() - trace._started) * 1000, 3)
+        if exc_type is not None:
+            trace.status = "error" if issubclass(exc_type, Exception) else "cancelled"
+        self._traces.append(trace)
+
+    def recent_traces(self, limit=None):
+        traces = list(self._traces)
+        if limit is not None:
+            traces = traces[-limit:]
+        return [trace.to_dict() for trace in traces]
+
+    def render(self):
+        """Prometheus 文本格式（0.0.4）"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def start_server(self, host="127.0.0.1", port=9464):
+        """在后台线程中启动导出 HTTP 服务，返回实际监听的 (host, port)"""
+        if self._server is not None:
+            return self._server.server_address[:2]
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                path = self.path.split("?", 1)[0]
+                if path == "/metrics":
+                    body = metrics.render().encode("utf-8")
+                    content_type = "text/plain; version=0.0.4; charset=utf-8"
+                elif path == "/traces":
+                    body = json.dumps(metrics.recent_traces(), ensure_ascii=False).encode("utf-8")
+                    content_type = "application/json; charset=utf-8"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True).start()
+        return self._server.server_address[:2]
+
+    def stop_server(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+class _TraceScope:
+    def __init__(self, metrics, name, attributes):
+        self._metrics = metrics
+        self._name = name
+        self._attributes = attributes
+        self._trace = None
+        self._token = None
+
+    def __enter__(self):
+        if not self._metrics.enabled:
+            return None
+        current = _current_trace.get()
+        if current is not None:
+            return current
+        self._trace = Trace(self._name, self._attributes)
+        self._token = _current_trace.set(self._trace)
+        return self._trace
+
+    def __exit__(self, exc_type, exc, tb):
+        trace = self._trace
+        if trace is None:
+            return False
+        # 不能跨 yield 使用（异步生成器请用 new_trace / trace_context），reset 在其他上下文中会抛出 ValueError
+        _current_trace.reset(self._token)
+        self._metrics.finish_trace(trace, exc_type)
+        return False
+
+
+# 进程级默认实例
+metrics = PipelineMetrics()
@@ -0,0 +1,190 @@
+import importlib
+import threading
+import time
+from concurrent.futures import Future
+
+# 配置中的 type -> "模块:类名"；模块在第一次创建该类型的组件时才导入
+DEFAULT_COMPONENTS = {
+    "EdgeTTS": "tts.edge:Edge_TTS",
+    "ChatGLM": "llm.chatglm:ChatGLM_LLM",
+    "FunASRWrapper": "asr.funasr.funasr_wrapper:FunASRWrapper",
+}
+
+
+class ComponentRegistry:
+    """
+    组件注册表：按配置中的 type 延迟导入并创建 TTS / LLM / ASR 组件
+
+    torch、funasr、edge_tts、openai 等依赖只在对应组件第一次被创建时导入，
+    只用到 Opus 工具的运行不再为它们付出导入开销。
+    每个组件的导入、加载（构造）与预热耗时都会记录，供 timing_report() 汇总冷启动时间。
+    """
+
+    def __init__(self, components=None):
+        self._components = dict(DEFAULT_COMPONENTS if components is None else components)
+        self._classes = {}
+        self._lock = threading.Lock()
+        # 每个组件类型一把导入锁，同一类型只导入一次
+        self._import_locks = {}
+        self._timings = {}
+        self._warmups = {}
+        self._started_at = time.perf_counter()
+
+    def register(self, component_type, target):
+        """注册组件类型，target 为 "模块:类名" 字符串或类本身"""
+        with self._lock:
+            self._components[component_type] = target
+            self._classes.pop(component_type, None)
+
+    def _timing(self, name):
+        return self._timings.setdefault(name, {'import_ms': 0.0, 'load_ms': 0.0, 'warmup_ms': None})
+
+    def _load_class(self, component_type):
+        """返回 (组件类, 本次导入耗时毫秒)，已导入过的耗时为 0"""
+        with self._lock:
+            cls = self._classes.get(component_type)
+            if cls is not None:
+                return cls, 0.0
+            if component_type not in self._components:
+                raise ValueError(f"未注册的组件类型: {component_type}")
+            import_lock = self._import_locks.setdefault(component_type, threading.Lock())
+        # 导入（如 torch、funasr）可能耗时数秒，只按组件类型串行，不持有注册表锁，
+        # 后台预加载 ASR 时其他类型的组件可以同时创建
+        with import_lock:
+            with self._lock:
+                cls = self._classes.get(component_type)
+                if cls is not None:
+                    return cls, 0.0
+                target = self._components.get(component_type)
+            if target is None:
+                raise ValueError(f"未注册的组件类型: {component_type}")
+            started = time.perf_counter()
+            cls = target
+            if isinstance(target, str):
+                module_name, _, class_name = target.partition(":")
+                cls = getattr(importlib.import_module(module_name), class_name)
+            with self._lock:
+                # 导入期间被重新注册时不缓存旧的类
+                if self._components.get(component_type) is target:
+                    self._classes[component_type] = cls
+            return cls, (time.perf_counter() - started) * 1000
+
+    def get_class(self, component_type):
+        """返回组件类，第一次调用时导入其模块"""
+        return self._load_class(component_type)[0]
+
+    def create(self, config, name=None):
+        """
+        按 config["type"] 创建组件
+
+        参数:
+            config: 组件配置（如 config["ASR"]["FunASR"]）
+            name: 计时报告中的名称，默认使用 type
+        """
+        cls, import_ms = self._load_class(config.get("type"))
+        started = time.perf_counter()
+        component = cls(config)
+        load_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            timing = self._timing(name or config.get("type"))
+            timing['import_ms'] += import_ms
+            timing['load_ms'] += load_ms
+        return component
+
+    def preload(self, config, name=None, warmup=True) -> Future:
+        """
+        在后台线程中导入、创建（并预热）组件，返回结果为组件的 Future
+
+        适合模型加载较慢的组件（如 ASR）：加载与其他组件的初始化、首轮对话并行进行
+        """
+        future = Future()
+
+        def run():
+            try:
+                component = self.create(config, name)
+                if warmup:
+                    self.warmup(component, name or config.get("type"), background=False)
+            except Exception as e:
+                future.set_exception(e)
+            else:
+                future.set_result(component)
+
+        threading.Thread(target=run, name=f"preload-{name or config.get('type')}", daemon=True).start()
+        return future
+
+    def warmup(self, component, name=None, background=True) -> Future:
+        """
+        调用组件的 warmup()（如对静音做一次推理），默认在后台线程中执行
+
+        组件没有 warmup() 时直接返回已完成的 Future
+        """
+        name = name or type(component).__name__
+        future = Future()
+        warmup = getattr(component, "warmup", None)
+        if warmup is None:
+            future.set_result(None)
+            return future
+
+        def run():
+            started = time.perf_counter()
+            try:
+                result, error = warmup(), None
+            except Exception as e:
+                print(f"{name} 预热失败: {e}")
+                result, error = None, e
+            with self._lock:
+                self._timing(name)['warmup_ms'] = (time.perf_counter() - started) * 1000
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        with self._lock:
+            self._warmups[name] = future
+        if background:
+            threading.Thread(target=run, name=f"warmup-{name}", daemon=True).start()
+        else:
+            run()
+        return future
+
+    def wait_warmups(self, timeout=None):
+        """等待所有已启动的预热完成"""
+        with self._lock:
+            futures = list(self._warmups.values())
+        for future in futures:
+            try:
+                future.result(timeout=timeout)
+            except Exception:
+                pass
+
+    def timing_report(self):
+        """
+        冷启动耗时报告
+
+        返回值:
+            dict: components（每个组件的 import_ms / load_ms / warmup_ms，未预热为 None）、
+            各阶段合计，以及从注册表创建到现在的 elapsed_ms
+        """
+        with self._lock:
+            components = {name: dict(timing) for name, timing in self._timings.items()}
+        return {
+            'components': components,
+            'import_ms': sum(t['import_ms'] for t in components.values()),
+            'load_ms': sum(t['load_ms'] for t in components.values()),
+            'warmup_ms': sum(t['warmup_ms'] or 0.0 for t in components.values()),
+            'elapsed_ms': (time.perf_counter() - self._started_at) * 1000,
+        }
+
+    def format_timing_report(self):
+        report = self.timing_report()
+        lines = ["启动耗时（毫秒）:"]
+        for name, timing in report['components'].items():
+            warmup = f"{timing['warmup_ms']:.0f}" if timing['warmup_ms'] is not None else "-"
+            lines.append(f"  {name}: 导入 {timing['import_ms']:.0f}，加载 {timing['load_ms']:.0f}，预热 {warmup}")
+        lines.append(f"  合计: 导入 {report['import_ms']:.0f}，加载 {report['load_ms']:.0f}，"
+                     f"预热 {report['warmup_ms']:.0f}，总计 {report['elapsed_ms']:.0f}")
+        return "\n".join(lines)
+
+
+# 进程级默认注册表
+registry = ComponentRegistry()